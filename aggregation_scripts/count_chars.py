@@ -1,29 +1,30 @@
-import os
-import json
+import sys
+from pathlib import Path
 
-def average_chars_in_jsons(folder_path: str):
-    total_chars = 0
-    file_count = 0
+# Auswertung über den indexierten Ergebnis-Speicher (siehe run_experiments.py ingest)
+# Repo-Wurzel für den Import über src.* (wie run_experiments.py), src für die internen utils-Importe
+sys.path[:0] = [str(Path(__file__).resolve().parents[1]), str(Path(__file__).resolve().parents[1] / "src")]
+from src.analysis.results_store import ResultsStore
 
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(".json"):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    total_chars += len(content)
-                    file_count += 1
-            except Exception as e:
-                print(f"Fehler beim Lesen von {filename}: {e}")
+def average_chars_in_jsons(folder_path: str, db_path: str = "outputs/results.sqlite"):
+    folder = Path(folder_path)
+    store = ResultsStore(db_path)
+    try:
+        store.ingest(folder)
+        df = store.dataframe()
+    finally:
+        store.close()
 
-    if file_count == 0:
+    # Zeichenanzahl der Antwort (_response_char_count) statt Länge der formatierten Datei
+    prefix = str(folder.resolve())
+    chars = df.loc[df["source"].str.startswith(prefix) & (df["status"] == "ok"), "char_count"].dropna()
+    if chars.empty:
         print("Keine JSON-Dateien gefunden.")
         return
 
-    average = total_chars / file_count
-    print(f"Anzahl Dateien: {file_count}")
-    print(f"Gesamtanzahl Zeichen: {total_chars}")
-    print(f"Durchschnitt pro Datei: {average:.2f}")
+    print(f"Anzahl Dateien: {len(chars)}")
+    print(f"Gesamtanzahl Zeichen: {int(chars.sum())}")
+    print(f"Durchschnitt pro Datei: {chars.mean():.2f}")
 
 if __name__ == "__main__":
     ordner = "outputs/final_experiment/gemini-2.5-pro"  # Pfad hier anpassen
@@ -1,6 +1,8 @@
+import hashlib
 import os
 import re
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor
 
 # Mapping für Modelle (Langname → Kurzform)
 MODEL_MAP = {
@@ -38,68 +40,114 @@ REPLACEMENTS = {
     "\u201E": '"',           # „
 }
 
+# Übersetzungstabelle: alle Ersetzungen in einem Durchlauf
+_TRANSLATION = str.maketrans(REPLACEMENTS)
+
+# Erste Zeile jeder .tex-Datei: Hash über Inhalt der JSON-Dateien und Generator-Einstellungen,
+# unveränderte Ordner werden übersprungen
+HASH_PREFIX = "% lstlisting-hash: "
+# bei Änderungen am Ausgabeformat erhöhen, damit alle Ordner neu erzeugt werden
+FORMAT_VERSION = "3"
+
 
 def sanitize_text(s: str) -> str:
     """Replace problematic symbols with ASCII-safe equivalents."""
-    for bad, repl in REPLACEMENTS.items():
-        s = s.replace(bad, repl)
-    return s
-
-def process_directory(base_dir: str):
-    for root, dirs, files in os.walk(base_dir):
-        json_files = [f for f in files if f.endswith(".json")]
-        if not json_files:
+    return s.translate(_TRANSLATION)
+
+def folder_hash(root: str, json_files: list[str]) -> str:
+    """Content hash of a folder: JSON file names and contents plus everything that shapes the output."""
+    h = hashlib.sha256(FORMAT_VERSION.encode("utf-8"))
+    for setting in (REPLACEMENTS, MODEL_MAP, PROMPT_MAP):
+        h.update(repr(sorted(setting.items())).encode("utf-8"))
+    h.update(FILENAME_REGEX.pattern.encode("utf-8"))
+    for name in sorted(json_files):
+        with open(os.path.join(root, name), "rb") as f:
+            content = hashlib.sha256(f.read()).hexdigest()
+        h.update(f"{name}\0{content}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def _stored_hash(output_path: str) -> str | None:
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            first = f.readline()
+    except OSError:
+        return None
+    return first[len(HASH_PREFIX):].strip() if first.startswith(HASH_PREFIX) else None
+
+def process_folder(root: str, json_files: list[str], digest: str) -> str:
+    # Tex-Datei pro Unterordner
+    output_path = os.path.join(root, f"{os.path.basename(root)}.tex")
+    entries = []
+
+    for json_file in json_files:
+        match = FILENAME_REGEX.match(json_file)
+        if not match:
+            print(f"Überspringe unpassende Datei: {json_file}")
             continue
 
-        # Tex-Datei pro Unterordner
-        output_path = os.path.join(root, f"{os.path.basename(root)}.tex")
-        entries = []
-
-        for json_file in json_files:
-            match = FILENAME_REGEX.match(json_file)
-            if not match:
-                print(f"Überspringe unpassende Datei: {json_file}")
-                continue
-
-            model_key = match.group("model")
-            case_number = int(match.group("case"))
-            prompt_key = match.group("prompt")
-
-            model_name, model_short = MODEL_MAP.get(model_key, (model_key, model_key.lower()))
-            prompt_label, prompt_order, prompt_short = PROMPT_MAP.get(
-                prompt_key, (prompt_key, 99, prompt_key.lower())
-            )
-
-            # JSON-Inhalt laden (falls fehlerhaft → ersetzen)
-            json_path = os.path.join(root, json_file)
-            with open(json_path, "r", encoding="utf-8", errors="replace") as jf:
-                json_content = jf.read().strip()
-
-            # Sanitize JSON content for LaTeX
-            json_content = sanitize_text(json_content)
-
-            subsubcaption = f"Ausgabe von {model_name} Anwendungsfall {case_number} {prompt_label}"
-            subsublabel = f"{model_short}_case{case_number}_{prompt_short}"
-            caption = f"Ausgabe: {model_name} Anwendungsfall {case_number} {prompt_label}"
-            label = f"{model_short}_case{case_number}_{prompt_short}"
-
-            # Store all relevant info per entry
-            entries.append((case_number, prompt_order, subsubcaption, subsublabel, caption, label, json_content))
-
-        # Sortieren nach Case, dann Prompt-Reihenfolge
-        entries.sort(key=lambda x: (x[0], x[1]))
-
-        # Schreiben
-        with open(output_path, "w", encoding="utf-8") as out_file:
-            for case_number, prompt_order, subsubcaption, subsublabel, caption, label, json_content in entries:
+        model_key = match.group("model")
+        case_number = int(match.group("case"))
+        prompt_key = match.group("prompt")
+
+        model_name, model_short = MODEL_MAP.get(model_key, (model_key, model_key.lower()))
+        prompt_label, prompt_order, prompt_short = PROMPT_MAP.get(
+            prompt_key, (prompt_key, 99, prompt_key.lower())
+        )
+
+        subsubcaption = f"Ausgabe von {model_name} Anwendungsfall {case_number} {prompt_label}"
+        subsublabel = f"{model_short}_case{case_number}_{prompt_short}"
+        caption = f"Ausgabe: {model_name} Anwendungsfall {case_number} {prompt_label}"
+        label = f"{model_short}_case{case_number}_{prompt_short}"
+
+        # Store all relevant info per entry (JSON-Inhalt wird erst beim Schreiben gelesen)
+        entries.append((case_number, prompt_order, subsubcaption, subsublabel, caption, label, json_file))
+
+    # Sortieren nach Case, dann Prompt-Reihenfolge
+    entries.sort(key=lambda x: (x[0], x[1]))
+
+    # Schreiben: Eintrag für Eintrag in eine temporäre Datei, danach atomar umbenennen
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as out_file:
+            out_file.write(f"{HASH_PREFIX}{digest}\n")
+            for case_number, prompt_order, subsubcaption, subsublabel, caption, label, json_file in entries:
+                # JSON-Inhalt laden (falls fehlerhaft → ersetzen) und für LaTeX bereinigen
+                with open(os.path.join(root, json_file), "r", encoding="utf-8", errors="replace") as jf:
+                    json_content = sanitize_text(jf.read().strip())
                 out_file.write(
                     f"\\subsubsection{{{subsubcaption}}}\\label{{anhang:subsubsec:{subsublabel}}}\n"
                 )
                 out_file.write(f"\\begin{{lstlisting}}[caption={{{caption}}},label={{{label}}}]\n")
                 out_file.write(json_content + "\n")
                 out_file.write("\\end{lstlisting}\n\n")
-
-        print(f"Fertig: {output_path}")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+def process_directory(base_dir: str, force: bool = False, workers: int | None = None):
+    # Ordner mit unverändertem Fingerprint überspringen, die übrigen parallel erzeugen
+    jobs = []
+    for root, dirs, files in os.walk(base_dir):
+        json_files = [f for f in files if f.endswith(".json")]
+        if not json_files:
+            continue
+        digest = folder_hash(root, json_files)
+        output_path = os.path.join(root, f"{os.path.basename(root)}.tex")
+        if not force and _stored_hash(output_path) == digest:
+            print(f"Unverändert: {output_path}")
+            continue
+        jobs.append((root, json_files, digest))
+
+    workers = workers or os.cpu_count() or 1
+    if len(jobs) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            for output_path in pool.map(process_folder, *zip(*jobs)):
+                print(f"Fertig: {output_path}")
+    else:
+        for job in jobs:
+            print(f"Fertig: {process_folder(*job)}")
 
 
 if __name__ == "__main__":
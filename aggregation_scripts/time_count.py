@@ -1,30 +1,35 @@
-import json
-import os
+import sys
 from pathlib import Path
 
-def average_duration(subfolder_path):
+# Auswertung über den indexierten Ergebnis-Speicher (siehe run_experiments.py ingest)
+# Repo-Wurzel für den Import über src.* (wie run_experiments.py), src für die internen utils-Importe
+sys.path[:0] = [str(Path(__file__).resolve().parents[1]), str(Path(__file__).resolve().parents[1] / "src")]
+from src.analysis.results_store import ResultsStore
+
+def average_duration(subfolder_path, db_path="outputs/results.sqlite"):
     subfolder = Path(subfolder_path)
-    json_files = list(subfolder.glob("*.json"))
-    
-    durations = []
-    for file in json_files:
-        with open(file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if "_duration_seconds" in data:
-                durations.append(data["_duration_seconds"])
-    
-    if not durations:
+    store = ResultsStore(db_path)
+    try:
+        store.ingest(subfolder)
+        df = store.dataframe()
+    finally:
+        store.close()
+
+    # nur Zeilen aus diesem Ordner, geteilt durch die tatsächliche Anzahl Antworten
+    prefix = str(subfolder.resolve())
+    durations = df.loc[df["source"].str.startswith(prefix) & (df["status"] == "ok"), "duration_seconds"].dropna()
+    if durations.empty:
         print("Keine _duration_seconds gefunden.")
         return None
-    
-    total = sum(durations)
-    average = total / 30  # fest auf 30 Dateien
+
+    total = durations.sum()
+    average = durations.mean()
     print(f"Summe der Zeiten: {total:.3f} Sekunden")
-    print(f"Durchschnitt (geteilt durch 30): {average:.3f} Sekunden")
+    print(f"Durchschnitt (über {len(durations)} Antworten): {average:.3f} Sekunden")
     return average
 
 # Beispielaufruf:
 # average_duration("pfad/zum/unterordner")
 if __name__ == "__main__":
     ordner = "outputs/time_measurements/claude-sonnet-4"  # Pfad hier anpassen
-    average_duration(ordner)
\ No newline at end of file
+    average_duration(ordner)
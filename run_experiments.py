@@ -1,13 +1,19 @@
 import typer
-import asyncio
 from src import config
-from src.runner.runner import _run_async
 from src.utils.utils import get_model_list
 from src.llm_schema_prompts.model_prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_ROBUST, USER_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE_ROBUST
 
 
 app = typer.Typer(help="LLM Runner für Datentransformationsfluss-Testfälle")
 
+def default_prompt_configs() -> list[dict]:
+    # Define prompt configs: two initial, one robust
+    return [
+        {"system_prompt": SYSTEM_PROMPT, "user_prompt_builder": USER_PROMPT_TEMPLATE},
+        {"system_prompt": SYSTEM_PROMPT, "user_prompt_builder": USER_PROMPT_TEMPLATE},
+        {"system_prompt": SYSTEM_PROMPT_ROBUST, "user_prompt_builder": USER_PROMPT_TEMPLATE_ROBUST},
+    ]
+
 @app.command() 
 def run(
     ping: bool = typer.Option(False, help="Ping den LLM-Dienst an und beende das Programm"),
@@ -17,9 +23,28 @@ def run(
     output: str = typer.Option("outputs", help="Ausgabeordner"),
     loglevel: str = typer.Option("INFO", help="Logging Level (DEBUG, INFO, WARNING, ERROR, CRITICAL)"),
     logfile: bool = typer.Option(True, help="Soll ein Logfile geschrieben werden? (default: True)"),
-    concurrency: int = typer.Option(8, help="Max. gleichzeitige LLM-Requests"),
+    concurrency: int = typer.Option(8, help="Max. gleichzeitige LLM-Requests pro Modell (Obergrenze, überschreibbar via MODEL_LIMITS)"),
     repeat: int = typer.Option(1, help="Wie oft soll jeder Fall ausgeführt werden? (Testen der Konsistenz) (default: 1)"),
     stream: bool = typer.Option(False, help="Nutze Streaming für LLM-Antworten (default: False)"),  
+    cache: str = typer.Option("off", help="Antwort-Cache: off, read, write oder readwrite (default: off)"),
+    replay_only: bool = typer.Option(False, help="Nur gespeicherte Antworten aus dem Cache nutzen, keine Netzwerkzugriffe (default: False)"),
+    resume: str = typer.Option(None, help="Run-ID eines abgebrochenen Laufs; es werden nur fehlende oder fehlgeschlagene Zellen ausgeführt"),
+    only_failed: bool = typer.Option(False, help="Mit --resume: nur fehlgeschlagene Zellen erneut ausführen (default: False)"),
+    export_json: bool = typer.Option(True, help="Ergebnisse am Ende zusätzlich als einzelne JSON-Dateien exportieren (default: True)"),
+    parquet: bool = typer.Option(False, help="Ergebnisse am Ende zusätzlich als Parquet exportieren, benötigt pyarrow (default: False)"),
+    compact_schema: bool = typer.Option(False, help="JSON-Schema im Prompt ohne Einrückung senden (weniger Tokens) (default: False)"),
+    output_mode: str = typer.Option("json_object", help="Ausgabemodus: json_object oder json_schema (striktes Schema, Fallback pro Modell) (default: json_object)"),
+    shards: int = typer.Option(1, help="Anzahl Worker-Prozesse; ohne --shard-index startet ein lokaler Koordinator alle Shards (default: 1)"),
+    shard_index: int = typer.Option(None, help="Index dieses Shards (0..shards-1), z.B. für einen Worker auf einem anderen Rechner"),
+    lease_queue: str = typer.Option(None, help="SQLite-Datei der gemeinsamen Lease-Queue (ohne: statische Aufteilung per Hash)"),
+    run_id: str = typer.Option(None, help="Run-ID vorgeben (alle Shards eines Laufs nutzen dieselbe Run-ID)"),
+    sample_batching: bool = typer.Option(True, help="Gleiche Prompts (Wiederholungen, gleiche Prompt-Configs) als ein Request mit n Choices senden (default: True)"),
+    compact_prompt: bool = typer.Option(False, help="Eingabetabellen und Schema auf das Token-Budget des Modells verdichten (PROMPT_TOKEN_BUDGETS) (default: False)"),
+    hedge: bool = typer.Option(False, help="Nachzügler nach der Latenz-Perzentile des Modells doppelt anfragen (HEDGE_PERCENTILE, HEDGE_MAX_SHARE); Hedges zählen gegen RPM/TPM, aber nicht gegen max_concurrency (default: False)"),
+    log_json: bool = typer.Option(False, help="Logdatei als JSON-Zeilen mit Fall, Modell, Prompt und Wiederholung schreiben (default: False)"),
+    dry_run: bool = typer.Option(False, help="Nur planen: Matrix, Prompt-Tokens, Laufzeit und Kosten schätzen, ohne Netzwerkzugriff (default: False)"),
+    metrics_port: int = typer.Option(None, help="Live-Metriken im Prometheus-Format unter http://METRICS_HOST:<port>/metrics (bei Shards Port + Shard-Index)"),
+    metrics_file: str = typer.Option(None, help="Live-Metriken zusätzlich alle METRICS_INTERVAL Sekunden in diese Datei schreiben (z.B. für den node_exporter)"),
 ):
     """
     Starte die Verarbeitung der Testfälle mit dem angegebenen Modell.
@@ -28,15 +53,281 @@ def run(
     # Split and map short names to full model IDs from MODEL_ALIASES
     model_list = get_model_list(model)
 
-    # Define prompt configs: two initial, one robust
-    prompt_configs = [
-        {"system_prompt": SYSTEM_PROMPT, "user_prompt_builder": USER_PROMPT_TEMPLATE},
-        {"system_prompt": SYSTEM_PROMPT, "user_prompt_builder": USER_PROMPT_TEMPLATE},
-        {"system_prompt": SYSTEM_PROMPT_ROBUST, "user_prompt_builder": USER_PROMPT_TEMPLATE_ROBUST},
-    ]
+    if dry_run:
+        # Planung aus Testfällen und historischen Statistiken, ohne OpenAI-Client und API-Key
+        from src.utils.logger import setup
+        from src.runner.planning import plan_run, print_plan
+        setup(level=loglevel, write_file=False)
+        print_plan(plan_run(model_list, input, limit, output, concurrency, repeat, default_prompt_configs(), compact_schema, compact_prompt, sample_batching))
+        return
+
+    if shards > 1 and shard_index is None:
+        # lokaler Koordinator: startet die Shards als eigene Prozesse und führt danach die Statistiken zusammen
+        import sys
+        from src.utils.logger import setup
+        from src.runner.sharding import run_coordinator
+        setup(level=loglevel, write_file=False)
+        raise typer.Exit(run_coordinator(sys.argv, shards, output, model_list, resume))
+
+    # Runner (openai, httpx, pydantic) erst hier importieren, damit --help und --dry-run schnell starten
+    import asyncio
+    from src.runner.runner import _run_async
+    prompt_configs = default_prompt_configs()
     asyncio.run(_run_async(
-        ping, model_list, input, limit, output, loglevel, logfile, concurrency, repeat, prompt_configs, stream  
+        ping, model_list, input, limit, output, loglevel, logfile, concurrency, repeat, prompt_configs, stream, cache, replay_only, resume, only_failed, export_json, parquet, compact_schema, output_mode,
+        shards, shard_index or 0, lease_queue, run_id, sample_batching, compact_prompt, hedge, log_json,
+        metrics_port, metrics_file
     ))
 
+@app.command("merge-shards")
+def merge_shards(
+    run_id: str = typer.Option(..., help="Run-ID des verteilten Laufs (ohne Shard-Suffix)"),
+    output: str = typer.Option("outputs", help="Ausgabeordner mit runs/<run-id>-s*.results.jsonl"),
+    model: str = typer.Option(None, help="Komma-separierte Modell-Liste (default: alle Modelle in den Ergebnissen)"),
+):
+    """
+    Statistiken aller Shards eines Laufs zu einer model_statistics.json zusammenführen.
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    from src.runner.sharding import merge_shard_stats
+    setup(level="INFO", write_file=False)
+    merge_shard_stats(Path(output), run_id, get_model_list(model) if model else None)
+
+batch_app = typer.Typer(help="Offline-Ausführung über die Batch-API: write -> submit -> poll -> ingest")
+app.add_typer(batch_app, name="batch")
+
+@batch_app.command("write")
+def batch_write(
+    model: str = typer.Option(config.DEFAULT_MODEL, help="Komma-separierte Liste von Modell-Kurzbezeichnungen (z.B. gpt,claude,google)"),
+    input: str = typer.Option("inputs", help="Ordner mit .yaml Testfällen"),
+    limit: int = typer.Option(None, help="Limitiere die Anzahl der zu testenden Fälle"),
+    output: str = typer.Option("outputs", help="Ausgabeordner (Batch-Dateien unter <output>/batch)"),
+    repeat: int = typer.Option(1, help="Wie oft soll jeder Fall ausgeführt werden? (default: 1)"),
+    compact_schema: bool = typer.Option(False, help="JSON-Schema im Prompt ohne Einrückung senden (default: False)"),
+    output_mode: str = typer.Option("json_object", help="Ausgabemodus: json_object oder json_schema (default: json_object)"),
+    run_id: str = typer.Option(None, help="Run-ID vorgeben (default: neue Run-ID)"),
+    compact_prompt: bool = typer.Option(False, help="Eingabetabellen und Schema auf das Token-Budget des Modells verdichten (default: False)"),
+):
+    """
+    Gesamte Experiment-Matrix als JSONL im Batch-Format schreiben (custom_id = Fall/Modell/Prompt/Wiederholung).
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    from src.runner.batch import write_batch
+    setup(level="INFO", write_file=False)
+    manifest = write_batch(Path(output), get_model_list(model), input, limit, repeat, default_prompt_configs(), compact_schema, output_mode, run_id, compact_prompt)
+    print(manifest["run_id"])
+
+@batch_app.command("submit")
+def batch_submit(
+    run_id: str = typer.Option(..., help="Run-ID aus batch write"),
+    output: str = typer.Option("outputs", help="Ausgabeordner"),
+    backend: str = typer.Option("openai", help="Batch-Endpunkt: openai oder local (Dateien + Requests an OPENAI_BASE_URL)"),
+):
+    """
+    Request-Datei hochladen und den Batch starten.
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    from src.runner.batch import submit_batch
+    setup(level="INFO", write_file=False)
+    submit_batch(Path(output), run_id, backend)
+
+@batch_app.command("poll")
+def batch_poll(
+    run_id: str = typer.Option(..., help="Run-ID aus batch write"),
+    output: str = typer.Option("outputs", help="Ausgabeordner"),
+    interval: float = typer.Option(60.0, help="Sekunden zwischen zwei Statusabfragen"),
+    wait: bool = typer.Option(True, help="Bis zum Ende des Batches warten (default: True)"),
+):
+    """
+    Status abfragen und Ausgabe- bzw. Fehlerdatei herunterladen, sobald der Batch fertig ist.
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    from src.runner.batch import poll_batch, FINAL_STATES
+    setup(level="INFO", write_file=False)
+    manifest = poll_batch(Path(output), run_id, interval, wait)
+    if manifest["status"] not in FINAL_STATES:
+        raise typer.Exit(2)
+
+@batch_app.command("ingest")
+def batch_ingest(
+    run_id: str = typer.Option(..., help="Run-ID aus batch write"),
+    output: str = typer.Option("outputs", help="Ausgabeordner"),
+    concurrency: int = typer.Option(8, help="Max. gleichzeitige Korrektur-Requests pro Modell"),
+    export_json: bool = typer.Option(True, help="Ergebnisse zusätzlich als einzelne JSON-Dateien exportieren (default: True)"),
+    loglevel: str = typer.Option("INFO", help="Logging Level (DEBUG, INFO, WARNING, ERROR, CRITICAL)"),
+    force: bool = typer.Option(False, help="Bereits ausgewerteten Batch erneut auswerten; erfolgreiche Zellen werden übersprungen (default: False)"),
+):
+    """
+    Ausgabedatei des Batches wie im Online-Runner auswerten (Parsen, Reparatur, Statistik, Journal).
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    import asyncio
+    from src.runner.batch import ingest_batch
+    setup(level=loglevel, write_file=False)
+    asyncio.run(ingest_batch(Path(output), run_id, default_prompt_configs(), concurrency, export_json, force))
+
+@app.command("mock-server")
+def mock_server(
+    host: str = typer.Option("127.0.0.1", help="Host des Mock-Servers"),
+    port: int = typer.Option(8765, help="Port des Mock-Servers (OPENAI_BASE_URL=http://host:port/v1)"),
+    answers: str = typer.Option("outputs/final_experiment", help="Ordner mit echten Antworten, die wiedergegeben werden"),
+    latency_scale: float = typer.Option(1.0, help="Faktor auf die historischen Latenzen aus model_statistics.json"),
+    p_429: float = typer.Option(0.0, help="Anteil der Requests mit 429 Too Many Requests"),
+    p_timeout: float = typer.Option(0.0, help="Anteil der Requests ohne Antwort (Timeout beim Client)"),
+    p_malformed: float = typer.Option(0.0, help="Anteil der Antworten mit fehlerhaftem JSON"),
+    profile: str = typer.Option(None, help="JSON-Datei mit Profilen pro Modell (latency_median, latency_sigma, p_429, ...)"),
+    seed: int = typer.Option(None, help="Seed für reproduzierbare Latenzen und Fehler"),
+):
+    """
+    Starte einen lokalen OpenAI-kompatiblen Mock-Server für /v1/chat/completions.
+    """
+    from src.utils.logger import setup
+    from src.loadtest.mock_server import serve
+    setup(level="INFO", write_file=False)
+    serve(host, port, answers, config.HISTORY_STATS_PATH, latency_scale, p_429, p_timeout, p_malformed,
+          profile_file=profile, seed=seed)
+
+@app.command()
+def bench(
+    model: str = typer.Option("gpt,claude,google", help="Komma-separierte Liste von Modell-Kurzbezeichnungen"),
+    input: str = typer.Option("inputs", help="Ordner mit .yaml Testfällen"),
+    repeat: int = typer.Option(112, help="Wiederholungen pro Fall (10 Fälle x 3 Prompts x 3 Modelle x 112 = 10080 Requests)"),
+    concurrency: int = typer.Option(64, help="Max. gleichzeitige Requests pro Modell"),
+    stream: bool = typer.Option(False, help="Streaming-Pfad messen (default: False)"),
+    latency_scale: float = typer.Option(0.001, help="Faktor auf die historischen Latenzen (0.001 = ms statt s)"),
+    p_429: float = typer.Option(0.0, help="Anteil injizierter 429-Antworten"),
+    p_timeout: float = typer.Option(0.0, help="Anteil injizierter Timeouts"),
+    p_malformed: float = typer.Option(0.0, help="Anteil fehlerhafter JSON-Antworten"),
+    output_mode: str = typer.Option("json_object", help="Ausgabemodus: json_object oder json_schema"),
+    port: int = typer.Option(8799, help="Port für den Mock-Server"),
+    output: str = typer.Option(None, help="Ausgabeordner (default: temporärer Ordner)"),
+):
+    """
+    Lasttest des Runners gegen den lokalen Mock-Server: Durchsatz, Scheduler-Overhead und Speicher.
+    """
+    from src.loadtest.benchmark import run_benchmark
+    report = run_benchmark(
+        get_model_list(model), input, default_prompt_configs(), repeat, concurrency, stream=stream,
+        latency_scale=latency_scale, p_429=p_429, p_timeout=p_timeout, p_malformed=p_malformed,
+        port=port, output=output, run_kwargs={"output_mode": output_mode},
+    )
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+@app.command("log-bench")
+def log_bench(
+    requests: int = typer.Option(2000, help="Anzahl simulierter Requests pro Messung"),
+    concurrency: int = typer.Option(64, help="Gleichzeitige Tasks auf dem Event-Loop"),
+    level: str = typer.Option("INFO,DEBUG", help="Komma-separierte Log-Level, die gemessen werden"),
+):
+    """
+    Event-Loop-Zeit der Logzeilen pro Request: frühere synchrone Handler (before) vs. Queue-Pipeline (after).
+    """
+    from src.loadtest.log_bench import run_log_benchmark, format_results
+    levels = tuple(l.strip().upper() for l in level.split(",") if l.strip())
+    print(format_results(run_log_benchmark(requests, concurrency, levels)))
+
+@app.command("import-budget")
+def import_budget(
+    runs: int = typer.Option(3, help="Messungen pro Befehl (Minimum zählt)"),
+):
+    """
+    Importzeit der CLI (python -X importtime) gegen das eingecheckte Budget prüfen, ohne OPENAI_API_KEY.
+    """
+    from src.loadtest.import_budget import check_budgets, format_results
+    results = check_budgets(runs=runs)
+    print(format_results(results))
+    if not all(r["ok"] for r in results):
+        raise typer.Exit(1)
+
+@app.command()
+def ingest(
+    root: str = typer.Option("outputs", help="Ordner mit Ergebnissen (RESULTS_*.json und runs/*.results.jsonl), rekursiv"),
+    db: str = typer.Option(config.RESULTS_DB_PATH, help="SQLite-Datei des Ergebnis-Speichers"),
+    by: str = typer.Option("model,prompt", help="Komma-separierte Gruppierungen: model, case, prompt"),
+    experiment: str = typer.Option(None, help="Nur Ergebnisse dieses Unterordners von root auswerten (z.B. final_experiment)"),
+    csv: str = typer.Option(None, help="Ordner, in den die Auswertungen als CSV geschrieben werden"),
+):
+    """
+    Ergebnisse inkrementell in den Ergebnis-Speicher einlesen und pro Modell/Fall/Prompt auswerten.
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    from src.analysis.results_store import ResultsStore
+    from src.analysis.aggregate import aggregate, print_aggregate, GROUPINGS
+    setup(level="INFO", write_file=False)
+    groupings = [g.strip() for g in by.split(",") if g.strip()]
+    unknown = [g for g in groupings if g not in GROUPINGS]
+    if unknown:
+        raise typer.BadParameter(f"Unbekannte Gruppierung(en): {', '.join(unknown)}")
+    store = ResultsStore(db)
+    try:
+        store.ingest(root)
+        df = store.dataframe(experiment)
+    finally:
+        store.close()
+    for grouping in groupings:
+        table = aggregate(df, grouping)
+        print_aggregate(table, grouping)
+        if csv:
+            Path(csv).mkdir(parents=True, exist_ok=True)
+            table.to_csv(Path(csv) / f"aggregate_{grouping}.csv", index=False)
+
+@app.command()
+def consistency(
+    root: str = typer.Option("outputs", help="Ordner mit Ergebnissen (RESULTS_*.json und runs/*.results.jsonl), rekursiv"),
+    experiment: str = typer.Option(None, help="Nur Ergebnisse dieses Unterordners von root auswerten (z.B. final_experiment)"),
+    by: str = typer.Option("repeat,prompt,model", help="Komma-separiert, was innerhalb einer Gruppe variiert: repeat, prompt, model"),
+    csv: str = typer.Option(None, help="Ordner, in den die Tabellen als CSV geschrieben werden"),
+):
+    """
+    Konsistenz der Antworten pro Fall/Modell: computations_valid, Schweregrade, Data-Lineage und Findings (MinHash/LSH).
+    """
+    from pathlib import Path
+    from src.utils.logger import setup
+    from src.analysis.results_store import iter_answers
+    from src.analysis.consistency import consistency_table, model_summary, print_consistency, prepare, GROUPINGS, MinHasher
+    setup(level="INFO", write_file=False)
+    groupings = [g.strip() for g in by.split(",") if g.strip()]
+    unknown = [g for g in groupings if g not in GROUPINGS]
+    if unknown:
+        raise typer.BadParameter(f"Unbekannte Gruppierung(en): {', '.join(unknown)}")
+    records = list(iter_answers(root, experiment))
+    hasher = MinHasher()
+    features = prepare(records, hasher)
+    for grouping in groupings:
+        table = consistency_table(records, grouping, hasher, features)
+        print_consistency(table, grouping)
+        if csv:
+            Path(csv).mkdir(parents=True, exist_ok=True)
+            table.to_csv(Path(csv) / f"consistency_{grouping}.csv", index=False)
+            model_summary(table).to_csv(Path(csv) / f"consistency_{grouping}_models.csv", index=False)
+
+@app.command()
+def revalidate(
+    root: str = typer.Option("outputs", help="Ordner mit Ergebnissen (RESULTS_*.json und runs/*.results.jsonl), rekursiv"),
+    experiment: str = typer.Option(None, help="Nur Ergebnisse dieses Unterordners von root prüfen (z.B. final_experiment)"),
+    workers: int = typer.Option(None, help="Anzahl Worker-Prozesse (default: Anzahl CPUs)"),
+    report: str = typer.Option(None, help="Bericht als JSONL (default: <root>/revalidate_report.jsonl)"),
+):
+    """
+    Alle gespeicherten Antworten parallel gegen das aktuelle LLMAnswer-Schema prüfen, ohne die LLMs erneut anzufragen.
+    """
+    from pathlib import Path
+    from src.utils.logger import setup, flush
+    from src.analysis.revalidate import revalidate as run_revalidate, write_report, print_report
+    setup(level="INFO", write_file=False)
+    result = run_revalidate(root, experiment, workers)
+    flush()
+    print_report(result)
+    path = write_report(result, report or Path(root) / "revalidate_report.jsonl")
+    print(f"Bericht: {path}")
+    raise typer.Exit(1 if result["summary"]["failing"] else 0)
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -7,4 +7,4 @@ python -m pip install --upgrade pip
 # install dependencies
 pip install -e .
 clear
-python3 run_experiments.py --model gpt,claude,google --input inputs --output outputs/final_experiment --loglevel INFO --logfile --concurrency 8 --repeat 1 --no-stream
\ No newline at end of file
+python3 run_experiments.py run --model gpt,claude,google --input inputs --output outputs/final_experiment --loglevel INFO --logfile --concurrency 8 --repeat 1 --no-stream
\ No newline at end of file
@@ -19,6 +19,6 @@ rem Konsole clearn
 cls
 
 rem Tests starten
-python run_experiments.py --ping
+python run_experiments.py run --ping
 
 endlocal
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from src.analysis.results_store import SEVERITIES
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Gruppierungen für die Auswertung (Spalten der results-Tabelle)
+GROUPINGS = {
+    "model": ["model"],
+    "case": ["model", "case_file"],
+    "prompt": ["model", "prompt"],
+}
+
+def aggregate(df: pd.DataFrame, by: str = "model") -> pd.DataFrame:
+    # Kennzahlen pro Gruppe als vektorisierte Group-Bys (Dauer, Zeichen, Schweregrade, Validität, Reparaturen)
+    keys = GROUPINGS[by]
+    df = df.astype({"prompt": "Int64"})
+    df = df.assign(
+        is_ok=(df["status"] == "ok").astype(np.int64),
+        is_error=(df["status"] == "error").astype(np.int64),
+    )
+    ok = df[df["status"] == "ok"]
+    grouped_all = df.groupby(keys, dropna=False)
+    grouped_ok = ok.groupby(keys, dropna=False)
+    out = pd.DataFrame({
+        "answers": grouped_all["is_ok"].sum(),
+        "errors": grouped_all["is_error"].sum(),
+    })
+    stats = grouped_ok.agg(
+        avg_duration_seconds=("duration_seconds", "mean"),
+        p50_duration_seconds=("duration_seconds", "median"),
+        avg_char_count=("char_count", "mean"),
+        computations_valid_rate=("computations_valid", "mean"),
+        avg_risks=("num_risks", "mean"),
+        llm_repairs=("llm_repaired", "sum"),
+        local_repairs=("local_repaired", "sum"),
+        cache_hits=("cache_hit", "sum"),
+        **{f"sev_{s}": (f"sev_{s}", "sum") for s in SEVERITIES},
+    )
+    stats.insert(2, "p90_duration_seconds", grouped_ok["duration_seconds"].quantile(0.9))
+    out = out.join(stats, how="left")
+    counts = ["answers", "errors", "llm_repairs", "local_repairs", "cache_hits", *(f"sev_{s}" for s in SEVERITIES)]
+    out[counts] = out[counts].fillna(0).astype(np.int64)
+    out["error_rate"] = out["errors"] / (out["answers"] + out["errors"]).replace(0, np.nan)
+    return out.round(3).reset_index()
+
+def print_aggregate(table: pd.DataFrame, by: str) -> None:
+    print(f"\n=== Auswertung pro {by} ===")
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        print(table.to_string(index=False))
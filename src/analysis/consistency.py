@@ -0,0 +1,255 @@
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from src import config
+from src.analysis.results_store import SEVERITIES
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Konsistenz der Antworten über Wiederholungen, Prompt-Configs und Modelle. Verglichen werden Inhalte der LLMAnswer:
+# computations_valid, Verteilung der Schweregrade, Kanten der Data-Lineage und der Text der Findings.
+# Mengenähnlichkeiten laufen über MinHash-Signaturen: die mittlere paarweise Jaccard-Ähnlichkeit einer Gruppe ergibt
+# sich aus den Häufigkeiten gleicher Signaturwerte pro Spalte (O(n*k) statt aller Paare), gleiche Findings
+# verschiedener Antworten werden per LSH (Banding) gefunden.
+
+# Gruppierungen: welche Dimension innerhalb einer Gruppe variiert
+GROUPINGS = {
+    "repeat": ["case_file", "model", "prompt"],   # nur Wiederholungen
+    "prompt": ["case_file", "model"],             # Wiederholungen und Prompt-Configs
+    "model": ["case_file"],                       # zusätzlich die Modelle
+}
+
+# Findings gelten als gleich ab dieser geschätzten Jaccard-Ähnlichkeit ihrer Shingles
+FINDING_THRESHOLD = 0.5
+SHINGLE_SIZE = 5
+
+_PRIME = (1 << 31) - 1
+# Signaturwert für leere Mengen: leere Mengen sind untereinander gleich, aber verschieden von allen anderen
+# (Hashwerte der Signaturen sind < 2**32)
+_EMPTY = np.uint64(1 << 32)
+# Basis des Polynom-Hashs über die Zeichen eines Shingles
+_BASE = 1_000_003
+# Shingle-Hashes pro Signatur-Block (Speicher: Permutationen x Block x 8 Byte)
+_CHUNK = 1 << 16
+_WS_RE = re.compile(r"\s+")
+_ARROW_RE = re.compile(r"\s*(?:->|→|=>)\s*")
+
+class MinHasher:
+    def __init__(self, num_perm: int = config.MINHASH_PERMUTATIONS, seed: int = 1):
+        # Multiply-Shift-Hashing (a ungerade, Überlauf modulo 2**64, obere 32 Bit) statt Modulo einer Primzahl
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+
+    def signatures(self, sets: list[np.ndarray]) -> np.ndarray:
+        # Eine Signatur pro Menge (Zeilen), Mengen als Arrays gehashter Elemente; blockweise vektorisiert
+        out = np.full((len(sets), self.num_perm), _EMPTY, dtype=np.uint64)
+        start = 0
+        while start < len(sets):
+            end, size = start, 0
+            while end < len(sets) and (size == 0 or size + len(sets[end]) <= _CHUNK):
+                size += len(sets[end])
+                end += 1
+            block = sets[start:end]
+            lengths = np.array([len(v) for v in block])
+            if size:
+                values = np.concatenate(block).astype(np.uint64)
+                hashed = self._a * values
+                hashed += self._b
+                hashed >>= np.uint64(32)
+                filled = np.flatnonzero(lengths)
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))[filled]
+                out[start + filled] = np.minimum.reduceat(hashed, offsets, axis=1).T
+            start = end
+        return out
+
+def _normalize(text) -> str:
+    return _WS_RE.sub(" ", str(text or "")).strip().lower()
+
+_POWERS: dict[int, np.ndarray] = {}
+
+def shingle_hashes(text, size: int = SHINGLE_SIZE) -> np.ndarray:
+    # Hashes der Zeichen-Shingles des normalisierten Textes (Polynom-Hash über ein gleitendes Fenster, ohne
+    # Python-Schleife pro Shingle); kurze Texte als ein Shingle
+    text = _normalize(text)
+    if not text:
+        return np.empty(0, dtype=np.int64)
+    powers = _POWERS.get(size)
+    if powers is None:
+        powers = _POWERS[size] = np.array([pow(_BASE, size - 1 - j, _PRIME) for j in range(size)], dtype=np.int64)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    if len(codes) <= size:
+        return np.array([int((codes * powers[size - len(codes):]).sum() % _PRIME)], dtype=np.int64)
+    # doppelte Shingles stören das Minimum nicht, daher kein np.unique
+    windows = np.lib.stride_tricks.sliding_window_view(codes, size)
+    return (windows @ powers) % _PRIME
+
+def item_hashes(items: set[str]) -> np.ndarray:
+    # stabiler Hash (crc32) statt hash(), damit Signaturen nicht von PYTHONHASHSEED abhängen
+    return np.fromiter((zlib.crc32(i.encode("utf-8")) % _PRIME for i in items), dtype=np.int64, count=len(items))
+
+def lineage_edges(steps) -> set[str]:
+    # "A, B -> JOIN -> C" ergibt die Kanten A>JOIN, B>JOIN, JOIN>C; Schritte ohne Pfeil zählen als Knoten
+    edges = set()
+    for step in steps or []:
+        segments = [[_normalize(n).upper() for n in part.split(",") if n.strip()] for part in _ARROW_RE.split(str(step))]
+        segments = [s for s in segments if s]
+        if len(segments) == 1:
+            edges.update(segments[0])
+        for left, right in zip(segments, segments[1:]):
+            edges.update(f"{a}>{b}" for a in left for b in right)
+    return edges
+
+def answer_features(answer) -> dict:
+    # Vergleichsmerkmale einer Antwort (LLMAnswer oder deren Dict aus der Ergebnisdatei)
+    if hasattr(answer, "model_dump"):
+        answer = answer.model_dump()
+    risks = [r for r in answer.get("error_risks") or [] if isinstance(r, dict)]
+    counts = [sum(1 for r in risks if r.get("severity") == s) for s in SEVERITIES]
+    ranked = [SEVERITIES.index(r["severity"]) for r in risks if r.get("severity") in SEVERITIES]
+    valid = answer.get("computations_valid")
+    return {
+        "valid": valid if isinstance(valid, bool) else None,
+        "severity_counts": counts,
+        "max_severity": SEVERITIES[max(ranked)] if ranked else "none",
+        "lineage": item_hashes(lineage_edges(answer.get("data_lineage"))),
+        "findings": [shingle_hashes(f"{r.get('source_of_risk', '')} {r.get('fix_suggestion', '')}") for r in risks],
+    }
+
+def prepare(records: list[dict], hasher: MinHasher) -> list[dict]:
+    # Merkmale und Signaturen aller Antworten, einmal berechnet und für alle Gruppierungen wiederverwendet
+    features = [answer_features(r["answer"]) for r in records]
+    lineage = hasher.signatures([f["lineage"] for f in features])
+    findings = hasher.signatures([h for f in features for h in f["findings"]])
+    pos = 0
+    for i, f in enumerate(features):
+        n = len(f["findings"])
+        f["lineage_sig"] = lineage[i]
+        f["finding_sigs"] = findings[pos:pos + n]
+        # MinHash der Vereinigung = elementweises Minimum der Signaturen
+        f["findings_sig"] = f["finding_sigs"].min(axis=0) if n else np.full(hasher.num_perm, _EMPTY, dtype=np.uint64)
+        pos += n
+        del f["lineage"], f["findings"]
+    return features
+
+def majority_share(values: list) -> float | None:
+    # Anteil der Antworten mit dem häufigsten Wert (None-Werte zählen nicht)
+    values = [v for v in values if v is not None]
+    if len(values) < 2:
+        return None
+    _, counts = np.unique(np.array(values, dtype=object).astype(str), return_counts=True)
+    return float(counts.max() / len(values))
+
+def mean_pairwise_jaccard(signatures: np.ndarray) -> float | None:
+    # Mittel der per MinHash geschätzten Jaccard-Ähnlichkeit über alle Paare, ohne die Paare zu bilden:
+    # pro Signaturspalte stimmen sum(c*(c-1)) von n*(n-1) geordneten Paaren überein (c = Häufigkeit eines Werts)
+    n = len(signatures)
+    if n < 2:
+        return None
+    # nach dem Sortieren jeder Spalte ist sum(c*(c-1)/2) = Summe der Positionen innerhalb der Läufe gleicher Werte
+    ordered = np.sort(signatures, axis=0)
+    idx = np.arange(n)[:, None]
+    starts = np.vstack([np.ones((1, ordered.shape[1]), dtype=bool), ordered[1:] != ordered[:-1]])
+    run_start = np.maximum.accumulate(np.where(starts, idx, 0), axis=0)
+    agree = 2 * int((idx - run_start).sum())
+    return agree / (n * (n - 1) * signatures.shape[1])
+
+def severity_stability(counts: np.ndarray) -> float | None:
+    # 1 - mittlere Total-Variation-Distanz der Schweregrad-Verteilung jeder Antwort zur mittleren Verteilung
+    # (Antworten ohne Findings als eigene Kategorie "keine")
+    if len(counts) < 2:
+        return None
+    counts = np.hstack([counts, (counts.sum(axis=1) == 0).astype(np.int64)[:, None]])
+    dist = counts / counts.sum(axis=1, keepdims=True)
+    return float(1 - 0.5 * np.abs(dist - dist.mean(axis=0)).sum(axis=1).mean())
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        self.parent[self.find(i)] = self.find(j)
+
+def finding_reproducibility(owners: list[int], signatures: np.ndarray, answers: int, bands: int = config.LSH_BANDS) -> float | None:
+    # Anteil der Findings, die (als Near-Duplicate) in mindestens der Hälfte der Antworten der Gruppe vorkommen.
+    # LSH: Findings mit gleichem Band landen im selben Bucket und werden nur mit dem ersten Eintrag des Buckets
+    # verglichen, damit große Buckets nicht quadratisch werden.
+    if answers < 2 or not owners:
+        return None
+    rows = signatures.shape[1] // bands
+    uf = _UnionFind(len(owners))
+    for band in range(bands):
+        buckets: dict[bytes, int] = {}
+        chunk = signatures[:, band * rows:(band + 1) * rows]
+        for i, key in enumerate(map(np.ndarray.tobytes, chunk)):
+            first = buckets.setdefault(key, i)
+            if first != i and uf.find(first) != uf.find(i) and float((signatures[first] == signatures[i]).mean()) >= FINDING_THRESHOLD:
+                uf.union(first, i)
+    clusters: dict[int, set[int]] = {}
+    for i, owner in enumerate(owners):
+        clusters.setdefault(uf.find(i), set()).add(owner)
+    reproduced = sum(1 for i in range(len(owners)) if 2 * len(clusters[uf.find(i)]) >= answers)
+    return reproduced / len(owners)
+
+def _mean(values: list) -> float | None:
+    values = [v for v in values if v is not None]
+    return float(np.mean(values)) if values else None
+
+def consistency_table(records: list[dict], by: str = "prompt", hasher: MinHasher | None = None, features: list[dict] | None = None) -> pd.DataFrame:
+    # Eine Zeile pro Gruppe mit Übereinstimmungs-Kennzahlen (0..1) und einem Gesamtwert "stability"
+    keys = GROUPINGS[by]
+    hasher = hasher or MinHasher()
+    features = features if features is not None else prepare(records, hasher)
+    groups: dict[tuple, list[dict]] = {}
+    for record, f in zip(records, features):
+        groups.setdefault(tuple(record.get(k) for k in keys), []).append(f)
+    rows = []
+    for group, members in sorted(groups.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        owners = [i for i, f in enumerate(members) for _ in range(len(f["finding_sigs"]))]
+        scores = {
+            "valid_agreement": majority_share([f["valid"] for f in members]),
+            "severity_stability": severity_stability(np.array([f["severity_counts"] for f in members], dtype=np.int64)),
+            "max_severity_agreement": majority_share([f["max_severity"] for f in members]),
+            "lineage_jaccard": mean_pairwise_jaccard(np.vstack([f["lineage_sig"] for f in members])),
+            "findings_jaccard": mean_pairwise_jaccard(np.vstack([f["findings_sig"] for f in members])),
+            "finding_reproducibility": finding_reproducibility(owners, np.vstack([f["finding_sigs"] for f in members]), len(members)),
+        }
+        valid = [f["valid"] for f in members if f["valid"] is not None]
+        rows.append({
+            **dict(zip(keys, group)),
+            "answers": len(members),
+            "valid_rate": round(sum(valid) / len(valid), 3) if valid else None,
+            **scores,
+            "stability": _mean([scores["valid_agreement"], scores["severity_stability"], scores["lineage_jaccard"], scores["findings_jaccard"]]),
+        })
+    return pd.DataFrame(rows).round(3)
+
+def model_summary(table: pd.DataFrame) -> pd.DataFrame:
+    # Mittelwerte der Gruppen pro Modell (nur Gruppen mit mindestens zwei Antworten)
+    if "model" not in table.columns or table.empty:
+        return pd.DataFrame()
+    scored = table[table["answers"] >= 2]
+    metrics = ["valid_agreement", "severity_stability", "max_severity_agreement", "lineage_jaccard", "findings_jaccard", "finding_reproducibility", "stability"]
+    out = scored.groupby("model")[metrics].mean()
+    out.insert(0, "groups", scored.groupby("model").size())
+    return out.round(3).reset_index()
+
+def print_consistency(table: pd.DataFrame, by: str) -> None:
+    print(f"\n=== Konsistenz pro Gruppe (variiert: {by}) ===")
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 220):
+        print(table.to_string(index=False))
+        summary = model_summary(table)
+        if not summary.empty:
+            print(f"\n--- Mittel pro Modell (variiert: {by}) ---")
+            print(summary.to_string(index=False))
@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import sqlite3
+from pathlib import Path
+from typing import Iterator
+
+from utils.logger import logging
+from utils.result_sink import RESULTS_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Indexierter Ergebnis-Speicher (SQLite): eine Zeile pro Antwort bzw. Fehler, aus den einzelnen
+# RESULTS_*.json-Dateien und den .results.jsonl-Dateien der Runs. Ingest arbeitet inkrementell über mtime/Größe.
+
+SEVERITIES = ("info", "low", "medium", "high", "critical")
+
+_PROMPT_RE = re.compile(r"_PROMPT(\d+)", re.IGNORECASE)
+_REPEAT_RE = re.compile(r"_REPEAT(\d+)", re.IGNORECASE)
+# (error_)results_<case_id>_<model>_PROMPT<n>_... bzw. (error_)results_<case_id>_<model>_<stamp>.json
+_ERROR_NAME_RE = re.compile(r"results_([^_]+)_(.+?)_(?:PROMPT\d+|\d{8})")
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    offset INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS results (
+    row_key TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    experiment TEXT,
+    model TEXT,
+    case_file TEXT,
+    case_id TEXT,
+    prompt INTEGER,
+    repeat INTEGER,
+    status TEXT NOT NULL,
+    duration_seconds REAL,
+    wall_seconds REAL,
+    char_count INTEGER,
+    computations_valid INTEGER,
+    num_risks INTEGER,
+    num_transformations INTEGER,
+    {", ".join(f"sev_{s} INTEGER" for s in SEVERITIES)},
+    llm_repaired INTEGER,
+    local_repaired INTEGER,
+    cache_hit INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_model ON results(model, prompt);
+CREATE INDEX IF NOT EXISTS idx_results_case ON results(case_file);
+CREATE INDEX IF NOT EXISTS idx_results_source ON results(source);
+CREATE INDEX IF NOT EXISTS idx_results_experiment ON results(experiment);
+"""
+
+_COLUMNS = (
+    "row_key", "source", "experiment", "model", "case_file", "case_id", "prompt", "repeat", "status",
+    "duration_seconds", "wall_seconds", "char_count", "computations_valid", "num_risks", "num_transformations",
+    *(f"sev_{s}" for s in SEVERITIES),
+    "llm_repaired", "local_repaired", "cache_hit", "prompt_tokens", "completion_tokens", "error",
+)
+_INSERT = f"INSERT OR REPLACE INTO results ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})"
+
+def _int_from(regex: re.Pattern, name: str) -> int | None:
+    m = regex.search(name)
+    return int(m.group(1)) if m else None
+
+def row_status(data: dict, status: str | None = None) -> str:
+    # ohne Status (einzelne JSON-Dateien): Fehlerdateien haben "error", aber kein "final_feedback"
+    return status or ("error" if "error" in data and "final_feedback" not in data else "ok")
+
+def result_row(data: dict, row_key: str, source: str, experiment: str, name: str, status: str | None = None, cell: dict | None = None) -> tuple:
+    # Flache Kennzahlen einer Ergebniszeile (Metadaten + Inhalt der Antwort)
+    cell = cell or {}
+    status = row_status(data, status)
+    severities = {s: 0 for s in SEVERITIES}
+    risks = data.get("error_risks") or []
+    for risk in risks:
+        sev = risk.get("severity") if isinstance(risk, dict) else None
+        if sev in severities:
+            severities[sev] += 1
+    valid = data.get("computations_valid")
+    from_name = _ERROR_NAME_RE.search(name) if status == "error" else None
+    values = {
+        "row_key": row_key,
+        "source": source,
+        "experiment": experiment,
+        "model": data.get("_model") or cell.get("model") or (from_name.group(2) if from_name else None),
+        "case_file": data.get("_source_file") or cell.get("case_file"),
+        "case_id": data.get("case_id") or cell.get("case_id"),
+        "prompt": cell.get("prompt") or _int_from(_PROMPT_RE, name),
+        "repeat": cell.get("repeat") if cell.get("repeat") is not None else _int_from(_REPEAT_RE, name),
+        "status": status,
+        # Batch-API-Antworten und Cache-Treffer haben keine Modell-Latenz (ältere Batch-Zeilen tragen 0.0)
+        "duration_seconds": None if data.get("_batch") or data.get("_cache_hit") else data.get("_duration_seconds"),
+        "wall_seconds": data.get("_wall_seconds"),
+        "char_count": data.get("_response_char_count"),
+        "computations_valid": int(valid) if isinstance(valid, bool) else None,
+        "num_risks": len(risks) if status == "ok" else None,
+        "num_transformations": len(data.get("transformations") or []) if status == "ok" else None,
+        **{f"sev_{s}": n for s, n in severities.items()},
+        "llm_repaired": int(bool(data.get("_correction_attempted"))),
+        "local_repaired": int(bool(data.get("_local_repair"))),
+        "cache_hit": int(bool(data.get("_cache_hit"))),
+        "prompt_tokens": data.get("_prompt_tokens"),
+        "completion_tokens": data.get("_completion_tokens"),
+        "error": data.get("error") if status == "error" else None,
+    }
+    return tuple(values[c] for c in _COLUMNS)
+
+def _jsonl_row_key(record: dict, out_dir: Path, root: Path, key: str) -> str:
+    # gleicher Schlüssel wie die exportierte JSON-Datei, damit Zeilen nicht doppelt gezählt werden
+    # (os.path statt pathlib: wird für jede Zeile aufgerufen)
+    name = record.get("export_name") or record.get("id", "")
+    path = os.path.normpath(os.path.join(out_dir, name))
+    prefix = os.path.join(str(root), "")
+    if path.startswith(prefix) and len(path) > len(prefix):
+        return path[len(prefix):]
+    return f"{key}#{record.get('id')}"
+
+def iter_answers(root: str | os.PathLike, experiment: str | None = None) -> Iterator[dict]:
+    # Erfolgreiche Antworten mit vollständigem Inhalt (der Speicher hält nur Kennzahlen), z.B. für die Konsistenzanalyse.
+    # Kennfelder wie beim Ingest; exportierte JSON-Dateien und JSONL-Zeilen derselben Zelle werden nur einmal geliefert.
+    root = Path(root).resolve()
+    seen: set[str] = set()
+    for f in ResultsStore._walk(root):
+        parts = f.relative_to(root).parts
+        exp = parts[0] if len(parts) > 1 else ""
+        if experiment is not None and exp != experiment:
+            continue
+        key = str(f)
+        if f.name.endswith(RESULTS_SUFFIX):
+            records = []
+            with f.open("r", encoding="utf-8") as h:
+                for line in h:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+            entries = [(_jsonl_row_key(r, f.parent.parent, root, key), r.get("data") or {}, r.get("export_name") or r.get("id", ""), r.get("status"), r)
+                       for r in records]
+        else:
+            try:
+                with f.open("r", encoding="utf-8") as h:
+                    data = json.load(h)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Überspringe %s: %s", f, e)
+                continue
+            if not isinstance(data, dict) or not ("_model" in data or "error" in data):
+                continue
+            entries = [(str(f.relative_to(root)), data, f.name, None, None)]
+        for row_key, data, name, status, cell in entries:
+            if row_key in seen:
+                continue
+            seen.add(row_key)
+            row = dict(zip(_COLUMNS, result_row(data, row_key, key, exp, name, status, cell)))
+            if row["status"] == "ok":
+                row["answer"] = data
+                yield row
+
+# Version der Zeilen: 1 = experiment und row_key relativ zum Wurzelordner des Speichers,
+# 2 = keine Dauer für Batch-API-Antworten und Cache-Treffer
+_STORE_VERSION = 2
+
+class ResultsStore:
+    def __init__(self, path: str | os.PathLike, root: str | os.PathLike | None = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Wurzelordner des Speichers (default: Ordner der DB, z.B. outputs): experiment und row_key werden relativ dazu
+        # bestimmt, unabhängig davon, ob ingest mit outputs oder einem Unterordner aufgerufen wird
+        self.root = Path(root).resolve() if root is not None else self.path.resolve().parent
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < _STORE_VERSION:
+            # ältere Speicher (anders berechnete Spalten) -> alle Dateien neu einlesen
+            with self._conn:
+                self._conn.execute("DELETE FROM files")
+                self._conn.execute("DELETE FROM results")
+            self._conn.execute(f"PRAGMA user_version = {_STORE_VERSION}")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def ingest(self, root: str | os.PathLike) -> dict:
+        # Neue oder geänderte Dateien unter root einlesen; unveränderte Dateien werden übersprungen
+        root = Path(root).resolve()
+        base = self.root if root == self.root or self.root in root.parents else root
+        known = {p: (m, s, o) for p, m, s, o in self._conn.execute("SELECT path, mtime_ns, size, offset FROM files")}
+        counts = {"files_seen": 0, "files_ingested": 0, "rows": 0, "files_removed": 0}
+        seen = set()
+        with self._conn:
+            for f in self._walk(root):
+                kind = "jsonl" if f.name.endswith(RESULTS_SUFFIX) else "json"
+                counts["files_seen"] += 1
+                st = f.stat()
+                key = str(f)
+                seen.add(key)
+                previous = known.get(key)
+                if previous is not None and previous[0] == st.st_mtime_ns and previous[1] == st.st_size:
+                    continue
+                parts = f.relative_to(base).parts
+                experiment = parts[0] if len(parts) > 1 else ""
+                start = 0
+                if kind == "json":
+                    rows, offset = self._read_json(f, key, base, experiment), st.st_size
+                else:
+                    # JSONL ist append-only: nur den neuen Teil lesen, außer die Datei ist geschrumpft
+                    start = previous[2] if previous is not None and st.st_size >= previous[1] else 0
+                    rows, offset = self._read_jsonl(f, key, base, experiment, start)
+                if start == 0:
+                    self._conn.execute("DELETE FROM results WHERE source = ?", (key,))
+                self._conn.executemany(_INSERT, rows)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files (path, mtime_ns, size, offset) VALUES (?, ?, ?, ?)",
+                    (key, st.st_mtime_ns, st.st_size, offset),
+                )
+                counts["files_ingested"] += 1
+                counts["rows"] += len(rows)
+            # gelöschte Dateien unter root aus dem Index entfernen
+            prefix = str(root) + os.sep
+            for key in known:
+                if key.startswith(prefix) and key not in seen:
+                    self._conn.execute("DELETE FROM results WHERE source = ?", (key,))
+                    self._conn.execute("DELETE FROM files WHERE path = ?", (key,))
+                    counts["files_removed"] += 1
+        logger.info(f"Ingest {root}: {counts['files_ingested']} von {counts['files_seen']} Dateien neu eingelesen, {counts['rows']} Zeilen")
+        return counts
+
+    @staticmethod
+    def _walk(root: Path):
+        # Ergebnisdateien unter root (os.walk ist bei vielen Dateien deutlich schneller als Path.rglob)
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(RESULTS_SUFFIX) or (
+                    name.endswith(".json") and not name.startswith(".") and name not in ("model_statistics.json", "benchmark.json")
+                ):
+                    yield Path(dirpath, name)
+
+    @staticmethod
+    def _read_json(f: Path, key: str, root: Path, experiment: str) -> list[tuple]:
+        try:
+            with f.open("r", encoding="utf-8") as h:
+                data = json.load(h)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Überspringe {f}: {e}")
+            return []
+        if not isinstance(data, dict) or not ("_model" in data or "error" in data):
+            return []
+        row_key = str(f.relative_to(root))
+        return [result_row(data, row_key, key, experiment, f.name)]
+
+    @staticmethod
+    def _read_jsonl(f: Path, key: str, root: Path, experiment: str, start: int) -> tuple[list[tuple], int]:
+        # Zeilen ab Byte-Offset start; eine unvollständige letzte Zeile wird beim nächsten Ingest gelesen
+        rows = []
+        out_dir = f.parent.parent
+        with f.open("rb") as h:
+            h.seek(start)
+            offset = start
+            for line in h:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                name = record.get("export_name") or record.get("id", "")
+                row_key = _jsonl_row_key(record, out_dir, root, key)
+                rows.append(result_row(record.get("data") or {}, row_key, key, experiment, name, record.get("status"), record))
+        return rows, offset
+
+    def dataframe(self, experiment: str | None = None):
+        # Alle Zeilen (optional eines Experiments) als pandas DataFrame
+        import pandas as pd
+        query = "SELECT * FROM results"
+        params: tuple = ()
+        if experiment is not None:
+            query += " WHERE experiment = ?"
+            params = (experiment,)
+        return pd.read_sql_query(query, self._conn, params=params)
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from pydantic import ValidationError
+
+from utils.logger import logging
+from utils.result_sink import RESULTS_SUFFIX
+from src.analysis.results_store import ResultsStore, _COLUMNS, _jsonl_row_key, result_row, row_status
+from src.llm_schema_prompts.llm_output_format import LLMAnswer
+from src.runner.json_repair import clamp_to_schema
+
+logger = logging.getLogger(__name__)
+
+# Erneute Validierung aller gespeicherten Antworten gegen das aktuelle LLMAnswer-Schema (Befehl revalidate), z.B. nach
+# Änderungen an llm_output_format.py, ohne die LLMs erneut anzufragen. Die Ergebnisdateien werden in Aufgaben zerlegt
+# (Gruppen von RESULTS_*.json bzw. Byte-Abschnitte der .results.jsonl) und in Worker-Prozessen geprüft; Zellen, die
+# sowohl als JSONL-Zeile als auch als exportierte JSON-Datei vorliegen, zählen wie beim Ingest nur einmal.
+
+# Byte-Abschnitte der JSONL-Dateien bzw. Anzahl JSON-Dateien pro Aufgabe
+CHUNK_BYTES = 4 << 20
+FILES_PER_TASK = 256
+# Unterhalb dieser Anzahl Aufgaben lohnt sich der Start eines Prozess-Pools nicht
+POOL_MIN_TASKS = 4
+
+def schema_fingerprint() -> str:
+    # kurzer Hash des aktuellen Schemas, damit ein Bericht einer Schema-Version zugeordnet werden kann
+    schema = json.dumps(LLMAnswer.model_json_schema(), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:12]
+
+def _loc(loc: tuple) -> str:
+    # Listenindizes zusammenfassen, damit gleiche Fehler verschiedener Einträge gleich gezählt werden
+    return ".".join("*" if isinstance(part, int) else str(part) for part in loc) or "<root>"
+
+def check_answer(data: dict) -> dict | None:
+    # None = gültig; sonst kompakte Fehler (Feld:Fehlertyp) und ob die lokale Reparatur (Klemmen) genügen würde
+    answer = {k: v for k, v in data.items() if not k.startswith("_")}
+    try:
+        LLMAnswer.model_validate(answer)
+        return None
+    except ValidationError as e:
+        errors = sorted({f"{_loc(err['loc'])}:{err['type']}" for err in e.errors(include_url=False)})
+    clamped, steps = clamp_to_schema(answer, LLMAnswer)
+    repairable = False
+    if steps:
+        try:
+            LLMAnswer.model_validate(clamped)
+            repairable = True
+        except ValidationError:
+            pass
+    return {"errors": errors, "repairable": repairable}
+
+def _result(data: dict, status: str | None, row_key: str, make_row) -> tuple[str, dict | None] | None:
+    # Kennfelder der Zelle (result_row) nur für ungültige Antworten bestimmen
+    if row_status(data, status) != "ok":
+        return None
+    failure = check_answer(data)
+    if failure is not None:
+        values = dict(zip(_COLUMNS, make_row()))
+        failure = {k: values[k] for k in ("row_key", "experiment", "model", "case_file", "case_id", "prompt", "repeat")} | failure
+    return row_key, failure
+
+def _json_task(paths: list[str], root: str) -> list[tuple[str, dict | None]]:
+    root_path = Path(root)
+    out = []
+    for name in paths:
+        f = Path(name)
+        try:
+            with f.open("r", encoding="utf-8") as h:
+                data = json.load(h)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Überspringe %s: %s", f, e)
+            continue
+        if not isinstance(data, dict) or not ("_model" in data or "error" in data):
+            continue
+        rel = f.relative_to(root_path)
+        experiment = rel.parts[0] if len(rel.parts) > 1 else ""
+        result = _result(data, None, str(rel), lambda: result_row(data, str(rel), name, experiment, f.name))
+        if result is not None:
+            out.append(result)
+    return out
+
+def _jsonl_task(name: str, root: str, start: int, end: int) -> list[tuple[str, dict | None]]:
+    # Zeilen, die in [start, end) beginnen; eine Zeile über die Grenze gehört zum Abschnitt, in dem sie beginnt
+    f = Path(name)
+    root_path = Path(root)
+    rel = f.relative_to(root_path)
+    experiment = rel.parts[0] if len(rel.parts) > 1 else ""
+    out = []
+    with f.open("rb") as h:
+        if start:
+            h.seek(start - 1)
+            h.readline()
+        while h.tell() < end:
+            line = h.readline()
+            if not line:
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            data = record.get("data") or {}
+            row_key = _jsonl_row_key(record, f.parent.parent, root_path, name)
+            result = _result(data, record.get("status"), row_key,
+                             lambda: result_row(data, row_key, name, experiment, record.get("export_name") or record.get("id", ""), record.get("status"), record))
+            if result is not None:
+                out.append(result)
+    return out
+
+def _run_task(task: tuple) -> list[tuple[str, dict | None]]:
+    # Top-Level-Funktion, damit sie im Prozess-Pool läuft
+    kind, *args = task
+    return _json_task(*args) if kind == "json" else _jsonl_task(*args)
+
+def build_tasks(root: Path, experiment: str | None = None) -> list[tuple]:
+    tasks: list[tuple] = []
+    json_files: list[str] = []
+    for f in ResultsStore._walk(root):
+        rel = f.relative_to(root)
+        if experiment is not None and (len(rel.parts) < 2 or rel.parts[0] != experiment):
+            continue
+        if f.name.endswith(RESULTS_SUFFIX):
+            size = f.stat().st_size
+            tasks.extend(("jsonl", str(f), str(root), start, min(start + CHUNK_BYTES, size)) for start in range(0, size, CHUNK_BYTES))
+        else:
+            json_files.append(str(f))
+    tasks.extend(("json", json_files[i:i + FILES_PER_TASK], str(root)) for i in range(0, len(json_files), FILES_PER_TASK))
+    return tasks
+
+def revalidate(root: str | os.PathLike, experiment: str | None = None, workers: int | None = None) -> dict:
+    # Prüft alle erfolgreichen Zellen unter root; liefert Kennzahlen und die Liste der jetzt ungültigen Zellen
+    root = Path(root).resolve()
+    tasks = build_tasks(root, experiment)
+    workers = workers or os.cpu_count() or 1
+    results: dict[str, dict | None] = {}
+    if len(tasks) >= POOL_MIN_TASKS and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = pool.map(_run_task, tasks)
+            for chunk in chunks:
+                results.update(chunk)
+    else:
+        for task in tasks:
+            results.update(_run_task(task))
+    failures = sorted((f for f in results.values() if f is not None), key=lambda f: f["row_key"])
+    by_model = Counter(f["model"] for f in failures)
+    by_error = Counter(e for f in failures for e in f["errors"])
+    summary = {
+        "schema": schema_fingerprint(),
+        "root": str(root),
+        "experiment": experiment,
+        "checked": len(results),
+        "failing": len(failures),
+        "repairable": sum(1 for f in failures if f["repairable"]),
+        "failing_by_model": dict(by_model.most_common()),
+        "errors": dict(by_error.most_common()),
+        "tasks": len(tasks),
+    }
+    logger.info("Revalidierung %s: %s von %s Zellen ungültig (Schema %s)", root, summary["failing"], summary["checked"], summary["schema"])
+    return {"summary": summary, "failures": failures}
+
+def write_report(report: dict, path: str | os.PathLike) -> Path:
+    # kompakter Bericht als JSONL: erste Zeile Zusammenfassung, danach eine Zeile pro ungültiger Zelle
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        f.write(json.dumps({"summary": report["summary"]}, ensure_ascii=False) + "\n")
+        for failure in report["failures"]:
+            f.write(json.dumps(failure, ensure_ascii=False) + "\n")
+    return path
+
+def print_report(report: dict, top: int = 10) -> None:
+    s = report["summary"]
+    print(f"\n=== Revalidierung gegen Schema {s['schema']}: {s['failing']} von {s['checked']} Zellen ungültig "
+          f"({s['repairable']} lokal reparierbar) ===")
+    for model, n in s["failing_by_model"].items():
+        print(f"  {model}: {n}")
+    if s["errors"]:
+        print("Häufigste Fehler (Feld:Typ):")
+        for error, n in list(s["errors"].items())[:top]:
+            print(f"  {n:>6}  {error}")
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # env laden
@@ -17,4 +18,85 @@ MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "4000"))
 
-assert OPENAI_API_KEY, "OPENAI_API_KEY in .env setzen"
\ No newline at end of file
+# Connection-Pool der HTTP-Clients (ein Pool pro base_url + api_key für den gesamten Lauf)
+POOL_MAX_CONNECTIONS = int(os.getenv("POOL_MAX_CONNECTIONS", "128"))
+POOL_MAX_KEEPALIVE = int(os.getenv("POOL_MAX_KEEPALIVE", "64"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Persistenter Antwort-Cache (siehe --cache / --replay-only)
+CACHE_PATH = os.getenv("CACHE_PATH", "outputs/cache/responses.sqlite")
+CACHE_MAX_AGE_DAYS = float(os.getenv("CACHE_MAX_AGE_DAYS", "90"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "512"))
+
+# Pro-Modell-Limits als JSON, z.B. {"gpt-5-2025-08-07": {"max_concurrency": 16, "rpm": 500, "tpm": 400000}}
+# Fehlende Werte: max_concurrency = --concurrency, rpm/tpm = unbegrenzt
+MODEL_LIMITS = json.loads(os.getenv("MODEL_LIMITS", "{}"))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", "5"))
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("EXPECTED_OUTPUT_TOKENS", "1500"))
+
+# Historische Statistiken für die Planung (erwartete Dauer pro Modell)
+HISTORY_STATS_PATH = os.getenv("HISTORY_STATS_PATH", "outputs/final_experiment/model_statistics.json")
+DEFAULT_EXPECTED_SECONDS = float(os.getenv("DEFAULT_EXPECTED_SECONDS", "30"))
+
+# Streaming: wie oft ein vom Schema abweichender Stream abgebrochen und neu gestartet wird
+STREAM_MAX_RESTARTS = int(os.getenv("STREAM_MAX_RESTARTS", "1"))
+
+# Testfall-Loader: Cache-Index der geparsten YAML-Dateien (Pfad + mtime + Größe) und Prozesse zum Parsen
+CASE_CACHE_DIR = os.getenv("CASE_CACHE_DIR", "outputs/cache/cases")
+CASE_LOADER_WORKERS = int(os.getenv("CASE_LOADER_WORKERS", "0")) or None
+
+# Indexierter Ergebnis-Speicher für die Auswertung (siehe Befehl ingest)
+RESULTS_DB_PATH = os.getenv("RESULTS_DB_PATH", "outputs/results.sqlite")
+
+# Konsistenzanalyse (Befehl consistency): Länge der MinHash-Signaturen und Anzahl LSH-Bänder
+# (Zeilen pro Band = Permutationen / Bänder; 64/16 findet Near-Duplicates ab etwa 0.5 Jaccard-Ähnlichkeit)
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", "64"))
+LSH_BANDS = int(os.getenv("LSH_BANDS", "16"))
+
+# Verteilte Ausführung: Dauer einer Lease in der SQLite-Queue (wird per Heartbeat verlängert)
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "120"))
+# Höchstzahl Leases pro Zelle: eine Zelle, deren Worker wiederholt abstürzt, wird danach als Fehler markiert
+LEASE_MAX_ATTEMPTS = int(os.getenv("LEASE_MAX_ATTEMPTS", "3"))
+
+# Strikte json_schema-Ausgabe: erkannte Stufe pro Modell (json_schema, json_schema_compat, json_object)
+SCHEMA_SUPPORT_PATH = os.getenv("SCHEMA_SUPPORT_PATH", "outputs/cache/schema_support.json")
+
+# Wiederholungen mit gleichem Prompt: höchstens so viele Choices (n) pro Request, 1 = nur Einzel-Requests;
+# Zeitfenster, in dem gleiche Prompts zu einem Request zusammengefasst werden
+MAX_CHOICES_PER_REQUEST = int(os.getenv("MAX_CHOICES_PER_REQUEST", "8"))
+SAMPLE_BATCH_WINDOW = float(os.getenv("SAMPLE_BATCH_WINDOW", "0.05"))
+
+# Lokaler Ersatz für den Batch-Endpunkt (batch submit --backend local): Spool-Ordner für Ein- und Ausgabedateien
+BATCH_SPOOL_DIR = os.getenv("BATCH_SPOOL_DIR", "outputs/batch/local")
+
+# Verdichtung des User-Prompts (--compact-prompt): Token-Budget pro Modell als JSON, z.B. {"gpt-5-2025-08-07": 6000, "*": 8000}
+# (<= 0 = kein Budget, es wird nur verdichtet, aber keine Zeilen-Stichprobe gezogen)
+PROMPT_TOKEN_BUDGETS = json.loads(os.getenv("PROMPT_TOKEN_BUDGETS", "{}"))
+DEFAULT_PROMPT_TOKEN_BUDGET = int(os.getenv("DEFAULT_PROMPT_TOKEN_BUDGET", "8000"))
+
+# Hedged Requests (--hedge): zweiter Request nach dieser Latenz-Perzentile, höchstens dieser Anteil der Requests
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_MAX_SHARE = float(os.getenv("HEDGE_MAX_SHARE", "0.1"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "1.0"))
+
+# Logging: Ordner der Logdateien (eine Datei pro Lauf), höchstens so viele INFO/DEBUG-Zeilen pro Sekunde auf der Konsole (0 = unbegrenzt)
+LOG_DIR = os.getenv("LOG_DIR", "outputs/log")
+LOG_CONSOLE_RATE = float(os.getenv("LOG_CONSOLE_RATE", "20"))
+
+# Live-Metriken (--metrics-port / --metrics-file): Adresse des HTTP-Endpunkts, Intervall der Textdatei in Sekunden,
+# gleitendes Fenster für Zeichen/s und Tokens/s, Bucket-Grenzen des Latenz-Histogramms in Sekunden (JSON-Liste)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+METRICS_WINDOW = float(os.getenv("METRICS_WINDOW", "60"))
+METRICS_LATENCY_BUCKETS = json.loads(os.getenv("METRICS_LATENCY_BUCKETS", "[1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300]"))
+
+# Planung (run --dry-run): Preise pro Modell in USD je 1 Mio. Tokens als JSON, z.B.
+# {"gpt-5-2025-08-07": {"input": 1.25, "output": 10.0}}; ohne Eintrag wird keine Kostenschätzung ausgegeben
+MODEL_PRICES = json.loads(os.getenv("MODEL_PRICES", "{}"))
+
+# Der API-Key wird erst beim Erstellen eines Clients geprüft (--help und --dry-run funktionieren ohne .env)
+def require_api_key() -> str:
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY in .env setzen")
+    return OPENAI_API_KEY
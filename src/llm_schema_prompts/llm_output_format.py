@@ -1,4 +1,5 @@
 from typing import Literal, Optional, List
+from functools import lru_cache
 from pydantic import BaseModel, Field, ConfigDict, constr
 import json
 
@@ -29,6 +30,30 @@ class LLMAnswer(BaseModel):
     final_feedback: str = Field(..., min_length=3, max_length=2000, description="Endgültige Einschätzung")
 
     @classmethod
-    def json_schema_str(cls) -> str:
+    def json_schema_str(cls, compact: bool = False, minify: bool = False) -> str:
         # gibt das JSON-Schema als formatierten String zurück mithilfe von Pydantic (cls referenziert die Klasse selbst)
-        return json.dumps(cls.model_json_schema(), ensure_ascii=False, indent=2)
\ No newline at end of file
+        # compact=True: ohne Einrückung und Leerzeichen (weniger Prompt-Tokens); Ergebnis wird zwischengespeichert
+        # minify=True: zusätzlich ohne title und default (für das Modell redundant)
+        return _schema_str(cls, compact or minify, minify)
+
+def _strip_keys(node, keys: tuple):
+    if isinstance(node, list):
+        return [_strip_keys(n, keys) for n in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        if key == "properties":
+            # Feldnamen bleiben erhalten, auch wenn ein Feld z.B. "title" heißt
+            out[key] = {name: _strip_keys(field, keys) for name, field in value.items()}
+        elif key not in keys:
+            out[key] = _strip_keys(value, keys)
+    return out
+
+@lru_cache(maxsize=None)
+def _schema_str(model_cls: type[BaseModel], compact: bool, minify: bool = False) -> str:
+    if minify:
+        return json.dumps(_strip_keys(model_cls.model_json_schema(), ("title", "default")), ensure_ascii=False, separators=(",", ":"))
+    if compact:
+        return json.dumps(model_cls.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(model_cls.model_json_schema(), ensure_ascii=False, indent=2)
\ No newline at end of file
@@ -17,16 +17,18 @@ Stilhinweis: Verwende fachliche, knappe Formulierungen. Keine Floskeln, Kommenta
 Antworte ausschließlich in der vorgegebenen JSON-Struktur.
 """
 
+# Aufbau der User-Prompts: statischer Teil (Schema) zuerst, fallspezifische Teile danach.
+# System-Prompt + Schema bilden so einen stabilen Präfix, den das Prompt-Caching der Provider wiederverwenden kann.
 USER_PROMPT_TEMPLATE = """
+Gib die Antwort ausschließlich als JSON entsprechend des folgenden Schemas aus:
+{schema_json}
+
 Eingabetabellen und Attribute (Ausschnitt als JSON):
 {inputs}
 
 SQL-Transformation:
 {sql_transformation}
 
-Gib die Antwort ausschließlich als JSON entsprechend des folgenden Schemas aus:
-{schema_json}
-
 Achte besonders auf folgende Aspekte: 
 {focus}
 """
@@ -50,15 +52,15 @@ Antworte ausschließlich im definierten JSON-Format.
 """
 
 USER_PROMPT_TEMPLATE_ROBUST = """
+Liefere die Antwort ausschließlich als JSON nach folgendem Schema:
+{schema_json}
+
 Eingangstabellen und Attribute (Ausschnitt in JSON):
 {inputs}
 
 SQL-Transformation:
 {sql_transformation}
 
-Liefere die Antwort ausschließlich als JSON nach folgendem Schema:
-{schema_json}
-
 Beachte insbesondere die folgenden Aspekte: 
 {focus}
 """
@@ -66,9 +68,9 @@ Beachte insbesondere die folgenden Aspekte:
 FIX_JSON_PROMPT = """
 Die vorherige Antwort entsprach nicht dem geforderten JSON-Schema.
 Bitte korrigiere die Antwort und stelle sicher, dass sie dem JSON-Schema entspricht.
-Hier ist die fehlerhafte Antwort:
-{raw_response}
-
 Das erwartete JSON-Schema ist:
 {schema_json}
+
+Hier ist die fehlerhafte Antwort:
+{raw_response}
 """
\ No newline at end of file
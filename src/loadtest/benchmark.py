@@ -0,0 +1,127 @@
+import asyncio
+import json
+import multiprocessing
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from src import config
+from src.runner.runner import _run_async
+from src.loadtest.mock_server import serve
+from src.runner.sampling import request_share
+from utils.result_sink import RESULTS_SUFFIX, iter_results
+from utils.utils import write_json
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+def _wait_for_port(host: str, port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Mock-Server auf {host}:{port} nicht erreichbar")
+
+def _peak_rss_mb() -> float | None:
+    # maximaler Speicherverbrauch des Prozesses (nur Unix)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux liefert KB, macOS Bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+def summarize_run(out_dir: Path, makespan: float, concurrency: int) -> dict:
+    # Durchsatz und Overhead des Runners aus der Ergebnisdatei des Laufs
+    rows = [r for f in sorted((Path(out_dir) / "runs").glob(f"*{RESULTS_SUFFIX}")) for r in iter_results(f)]
+    ok = [r["data"] for r in rows if r["status"] == "ok"]
+    overheads = [
+        d["_wall_seconds"] - d.get("_network_seconds", 0) - d.get("_queue_wait_seconds", 0) - d.get("_batch_wait_seconds", 0) - d.get("_backoff_seconds", 0)
+        - d.get("_repair_network_seconds", 0) - d.get("_repair_queue_wait_seconds", 0) - d.get("_repair_backoff_seconds", 0)
+        for d in ok if "_wall_seconds" in d
+    ]
+    network_by_model: dict[str, float] = {}
+    for d in ok:
+        # Netzwerkzeit eines gebündelten Requests (n Choices) nur einmal zählen
+        network_by_model[d["_model"]] = network_by_model.get(d["_model"], 0.0) + request_share(d, "_network_seconds") + d.get("_repair_network_seconds", 0)
+    # Untergrenze der Makespan: Netzwerkzeit des langsamsten Modells verteilt auf seine Slots
+    ideal = max((t / max(concurrency, 1) for t in network_by_model.values()), default=0.0)
+    return {
+        "requests": len(rows),
+        "ok": len(ok),
+        "errors": len(rows) - len(ok),
+        "repaired": sum(1 for d in ok if d.get("_correction_attempted")),
+        "locally_repaired": sum(1 for d in ok if d.get("_local_repair")),
+        "makespan_seconds": round(makespan, 3),
+        "throughput_rps": round(len(rows) / makespan, 2) if makespan > 0 else 0,
+        "runner_overhead_ms_mean": round(statistics.fmean(overheads) * 1000, 3) if overheads else None,
+        "runner_overhead_ms_p99": round(sorted(overheads)[int(0.99 * (len(overheads) - 1))] * 1000, 3) if overheads else None,
+        "batch_wait_ms_mean": round(statistics.fmean(d.get("_batch_wait_seconds", 0) for d in ok) * 1000, 3) if ok else None,
+        "ideal_makespan_seconds": round(ideal, 3),
+        "scheduler_efficiency": round(ideal / makespan, 3) if makespan > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def run_benchmark(
+    model_list: list[str],
+    cases: str,
+    prompt_configs: list[dict],
+    repeat: int,
+    concurrency: int,
+    stream: bool = False,
+    latency_scale: float = 0.001,
+    p_429: float = 0.0,
+    p_timeout: float = 0.0,
+    p_malformed: float = 0.0,
+    answers_dir: str = "outputs/final_experiment",
+    port: int = 8799,
+    output: str | None = None,
+    loglevel: str = "WARNING",
+    run_kwargs: dict | None = None,
+) -> dict:
+    # Startet den Mock-Server in einem eigenen Prozess und treibt _run_async dagegen
+    host = "127.0.0.1"
+    server = multiprocessing.Process(
+        target=serve,
+        args=(host, port, answers_dir, config.HISTORY_STATS_PATH, latency_scale, p_429, p_timeout, p_malformed),
+        kwargs={"timeout_seconds": 3600.0, "seed": 42},
+        daemon=True,
+    )
+    server.start()
+    out_dir = Path(output) if output else Path(tempfile.mkdtemp(prefix="llm_bench_"))
+    try:
+        _wait_for_port(host, port)
+        # Runner auf den Mock umbiegen; Timeouts kurz, damit injizierte Timeouts den Lauf nicht dominieren
+        config.OPENAI_BASE_URL = f"http://{host}:{port}/v1"
+        config.OPENAI_API_KEY = config.OPENAI_API_KEY or "mock"
+        config.TIMEOUT = max(1, int(latency_scale * 200))
+        t0 = time.perf_counter()
+        asyncio.run(_run_async(
+            False, model_list, cases, None, str(out_dir), loglevel, False, concurrency, repeat, prompt_configs,
+            stream=stream, export_json=False, **(run_kwargs or {}),
+        ))
+        makespan = time.perf_counter() - t0
+    finally:
+        server.terminate()
+        server.join(5)
+    report = {
+        "models": model_list,
+        "repeat": repeat,
+        "concurrency": concurrency,
+        "stream": stream,
+        "latency_scale": latency_scale,
+        "p_429": p_429,
+        "p_timeout": p_timeout,
+        "p_malformed": p_malformed,
+        **summarize_run(out_dir, makespan, concurrency),
+    }
+    write_json(out_dir / "benchmark.json", report)
+    logger.info(f"Benchmark-Ergebnis: {json.dumps(report, ensure_ascii=False)}")
+    return report
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Import-Budget der CLI (python -X importtime): Summe der Importzeiten pro Befehl und Module, die für den Befehl
+# nicht geladen werden dürfen. Läuft ohne OPENAI_API_KEY, damit auch die Prüfung auf fehlende Zugangsdaten greift.
+# Budgets bewusst mit Abstand zum Messwert, damit Schwankungen zwischen Rechnern nicht auslösen; neue schwere
+# Top-Level-Imports (openai, httpx, pydantic, yaml) fallen über die Modulliste auf.
+
+ROOT = Path(__file__).resolve().parents[2]
+
+BUDGETS = [
+    {"args": ["--help"], "max_ms": 350, "forbidden": ["openai", "httpx", "pydantic", "yaml"]},
+    {"args": ["run", "--help"], "max_ms": 350, "forbidden": ["openai", "httpx", "pydantic", "yaml"]},
+    {"args": ["run", "--dry-run", "--limit", "1"], "max_ms": 700, "forbidden": ["openai", "httpx"]},
+]
+
+def _importtime(cmd: list[str], env: dict) -> tuple[int, set[str], int]:
+    # Summe der Importzeiten in µs, geladene Top-Level-Pakete und Exit-Code
+    proc = subprocess.run([sys.executable, "-X", "importtime", *cmd], cwd=ROOT, env=env, capture_output=True, text=True)
+    total_us = 0
+    modules: set[str] = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") < 2:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip().split(".")[0])
+        # nur Imports der obersten Ebene summieren (verschachtelte sind in deren kumulierter Zeit enthalten)
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us, modules, proc.returncode
+
+def measure(args: list[str], runs: int = 3) -> tuple[float, set[str], int]:
+    # Importzeit der CLI in ms ohne den Interpreter-Start (site, encodings), Minimum aus mehreren Läufen
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT / "src"), env.get("PYTHONPATH")]))
+    baseline = min(_importtime(["-c", "pass"], env)[0] for _ in range(runs))
+    best = None
+    modules: set[str] = set()
+    code = 0
+    for _ in range(runs):
+        total_us, modules, code = _importtime(["run_experiments.py", *args], env)
+        best = total_us if best is None else min(best, total_us)
+    return max(0, (best or 0) - baseline) / 1000, modules, code
+
+def check_budgets(budgets: list[dict] = BUDGETS, runs: int = 3) -> list[dict]:
+    results = []
+    for budget in budgets:
+        ms, modules, code = measure(budget["args"], runs)
+        loaded = sorted(m for m in budget["forbidden"] if m in modules)
+        results.append({
+            "command": " ".join(budget["args"]),
+            "import_ms": round(ms, 1),
+            "max_ms": budget["max_ms"],
+            "forbidden_loaded": loaded,
+            "exit_code": code,
+            "ok": code == 0 and ms <= budget["max_ms"] and not loaded,
+        })
+    return results
+
+def format_results(results: list[dict]) -> str:
+    lines = [f"{'Befehl':<32}{'Import ms':>11}{'Budget':>9}  Status"]
+    for r in results:
+        status = "ok" if r["ok"] else "ÜBERSCHRITTEN"
+        if r["forbidden_loaded"]:
+            status += f" (geladen: {', '.join(r['forbidden_loaded'])})"
+        if r["exit_code"]:
+            status += f" (Exit-Code {r['exit_code']})"
+        lines.append(f"{r['command']:<32}{r['import_ms']:>11}{r['max_ms']:>9}  {status}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    results = check_budgets()
+    print(format_results(results))
+    sys.exit(0 if all(r["ok"] for r in results) else 1)
@@ -0,0 +1,124 @@
+import asyncio
+import io
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from rich.console import Console
+from rich.logging import RichHandler
+
+from src.utils import logger as log_setup
+
+# Mikro-Benchmark der Logging-Pipeline: Zeit, die die Logzeilen eines Requests auf dem Event-Loop kosten.
+# "before" bildet die frühere Konfiguration nach (RichHandler + FileHandler direkt am Root-Logger, f-Strings mit
+# Prompt-/Antwort-Ausschnitten), "after" nutzt setup() mit Queue-Listener und den Logzeilen des aktuellen Runners.
+
+CASE_ID = "CASE_01"
+MODEL = "gpt-5-2025-08-07"
+
+def _legacy_setup(level: str, log_file: str, console: Console) -> None:
+    # frühere utils/logger.setup: alle Handler laufen synchron im aufrufenden Thread
+    lvl = getattr(logging, level.upper(), logging.INFO)
+    fh = logging.FileHandler(log_file, mode="a", encoding="utf-8", delay=True)
+    fh.setLevel(lvl)
+    fh.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+    logging.basicConfig(level=lvl, format="%(message)s", handlers=[RichHandler(console=console, show_time=True, markup=True), fh], force=True)
+
+async def _legacy_request(logger: logging.Logger, case: dict, model: str, prompt: str, response: str, timings: list[float]) -> None:
+    # Logzeilen eines Requests wie vor der Umstellung (process_case, build_user_prompt, async_prompt_llm, parse_answer)
+    t = time.perf_counter()
+    logger.info(f"Starte Fall {case.get('id', 'unbekannt')} mit Modell: {model}")
+    logger.debug(f"Verarbeite Fall: {case.get('id', 'unbekannt')} mit Modell: {model}")
+    logger.debug(f"Building changed user prompt for case: {case.get('id', 'unknown')}")
+    logger.debug(f"Changed user prompt built: {prompt[:200]}...")
+    logger.debug(f"User-Prompt erstellt für Fall {case.get('id', 'unbekannt')}.")
+    logger.info(f"Prompting LLM with model: {model}, stream=False")
+    spent = time.perf_counter() - t
+    await asyncio.sleep(0)
+    t = time.perf_counter()
+    logger.info(f"Received response from LLM with model: {model} (1 choices)")
+    logger.debug(f"LLM response: {response[:200]}...")
+    logger.debug(f"Rohantwort vom LLM erhalten für Fall {case.get('id', 'unbekannt')}.")
+    logger.debug("Parsing and validating LLM answer")
+    logger.info("LLM answer validated successfully")
+    logger.debug(f"Antwort geparst und validiert für Fall {case.get('id', 'unbekannt')}.")
+    logger.info(f"[OK] {case['id']} -> Zeile 1 (12.3s, {len(response)} Zeichen)")
+    timings.append(spent + time.perf_counter() - t)
+
+async def _request(logger: logging.Logger, case: dict, model: str, prompt: str, response: str, timings: list[float]) -> None:
+    # Logzeilen eines Requests im aktuellen Runner
+    t = time.perf_counter()
+    log_setup.bind_cell({"cell": f"{case['id']}/{model}/PROMPT1/REPEAT0", "case_id": case["id"], "model": model, "prompt": 1, "repeat": 0})
+    case_id = case.get("id", "unbekannt")
+    logger.info("Starte Fall %s mit Modell: %s", case_id, model)
+    logger.debug("Changed user prompt built: %.200s...", prompt)
+    logger.debug("Prompting LLM with model: %s, stream=%s", model, False)
+    spent = time.perf_counter() - t
+    await asyncio.sleep(0)
+    t = time.perf_counter()
+    logger.debug("Received response from LLM with model: %s (%d choices): %.200s...", model, 1, response)
+    logger.debug("Rohantwort vom LLM erhalten für Fall %s.", case_id)
+    logger.debug("Extracting JSON from LLM response")
+    logger.debug("LLM answer validated successfully")
+    logger.info("[OK] %s -> Zeile %s (%ss, %s Zeichen)", case_id, 1, 12.3, len(response))
+    timings.append(spent + time.perf_counter() - t)
+
+def _measure(variant: str, level: str, requests: int, concurrency: int, prompt: str, response: str, log_dir: str, console: Console) -> dict:
+    if variant == "before":
+        log_setup._stop_pipeline(logging.getLogger())
+        _legacy_setup(level, os.path.join(log_dir, "before.log"), console)
+        emit = _legacy_request
+    else:
+        log_setup.setup(level, write_file=True, run_id=f"after_{level.lower()}", log_dir=log_dir, rich_console=console)
+        emit = _request
+    logger = logging.getLogger("llm_bench")
+    timings: list[float] = []
+
+    async def worker(n: int) -> None:
+        for i in range(n):
+            await emit(logger, {"id": f"{CASE_ID}_{i % 10}"}, MODEL, prompt, response, timings)
+
+    async def main() -> None:
+        per_worker = max(1, requests // concurrency)
+        await asyncio.gather(*(worker(per_worker) for _ in range(concurrency)))
+
+    t0 = time.perf_counter()
+    asyncio.run(main())
+    loop_seconds = time.perf_counter() - t0
+    # Zeit, bis die Queue abgearbeitet ist (läuft im Listener-Thread, nicht auf dem Event-Loop)
+    log_setup.flush(timeout=60)
+    drain_seconds = time.perf_counter() - t0 - loop_seconds
+    timings.sort()
+    return {
+        "variant": variant,
+        "level": level,
+        "requests": len(timings),
+        "loop_us_per_request_mean": round(statistics.fmean(timings) * 1e6, 1),
+        "loop_us_per_request_p99": round(timings[int(0.99 * (len(timings) - 1))] * 1e6, 1),
+        "loop_seconds": round(loop_seconds, 3),
+        "drain_seconds": round(drain_seconds, 3),
+    }
+
+def run_log_benchmark(requests: int = 2000, concurrency: int = 64, levels: tuple = ("INFO", "DEBUG"), prompt_chars: int = 8000, response_chars: int = 3000) -> list[dict]:
+    # Konsole wird wie ein Terminal gerendert, aber verworfen; Logdateien in einem temporären Ordner
+    prompt = ("SELECT a.id, SUM(b.amount) FROM a JOIN b ON a.id = b.a_id GROUP BY a.id; " * (prompt_chars // 72 + 1))[:prompt_chars]
+    response = ('{"transformation_understanding": "' + "x" * response_chars)[:response_chars]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="log_bench_") as log_dir, open(os.devnull, "w", encoding="utf-8") as sink:
+        console = Console(file=sink, force_terminal=True, width=120)
+        for level in levels:
+            for variant in ("before", "after"):
+                results.append(_measure(variant, level, requests, concurrency, prompt, response, log_dir, console))
+        # Logging wieder auf die normale Konsole ohne Datei
+        log_setup.setup("INFO", write_file=False)
+    return results
+
+def format_results(results: list[dict]) -> str:
+    out = io.StringIO()
+    out.write(f"{'Level':<7}{'Variante':<9}{'µs/Req (mean)':>15}{'µs/Req (p99)':>15}{'Loop s':>9}{'Drain s':>9}\n")
+    for r in results:
+        out.write(f"{r['level']:<7}{r['variant']:<9}{r['loop_us_per_request_mean']:>15}{r['loop_us_per_request_p99']:>15}"
+                  f"{r['loop_seconds']:>9}{r['drain_seconds']:>9}\n")
+    return out.getvalue()
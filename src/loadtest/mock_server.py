@@ -0,0 +1,271 @@
+import asyncio
+import json
+import math
+import random
+import time
+from pathlib import Path
+
+from utils.logger import logging
+from utils.utils import normalize_model_name
+
+logger = logging.getLogger(__name__)
+
+# Lokaler Ersatz für einen OpenAI-kompatiblen /v1/chat/completions-Endpunkt (Streaming und Nicht-Streaming).
+# Antworten werden aus echten Ergebnissen (outputs/final_experiment) wiedergegeben, Latenzen pro Modell
+# aus einer Lognormal-Verteilung gezogen; 429er, Timeouts und fehlerhaftes JSON können injiziert werden.
+
+DEFAULT_PROFILE = {
+    "latency_median": 1.0,   # Sekunden (nach Skalierung)
+    "latency_sigma": 0.35,   # Streuung der Lognormal-Verteilung
+    "ttft_share": 0.15,      # Anteil der Latenz bis zum ersten Token (Streaming)
+    "p_429": 0.0,
+    "p_timeout": 0.0,
+    "p_malformed": 0.0,
+    "json_schema": "full",   # Unterstützung für strikte json_schema-Ausgabe: full, compat (ohne $ref/Zahlengrenzen) oder none
+    "choices": "full",       # mehrere Choices (n > 1): full, ignore (liefert nur eine) oder reject (400)
+}
+
+MALFORMED_KINDS = ("prose", "fence", "truncated", "extra_field", "trailing_comma")
+
+def load_answers(answers_dir: Path) -> dict[str, list[str]]:
+    # Echte Antworten pro Modell (ohne Metadatenfelder) für die Wiedergabe
+    answers: dict[str, list[str]] = {}
+    for f in sorted(Path(answers_dir).rglob("RESULTS_*.json")):
+        try:
+            with f.open("r", encoding="utf-8") as h:
+                data = json.load(h)
+        except (OSError, json.JSONDecodeError):
+            continue
+        model = normalize_model_name(data.get("_model", f.parent.name))
+        answer = {k: v for k, v in data.items() if not k.startswith("_")}
+        answers.setdefault(model, []).append(json.dumps(answer, ensure_ascii=False))
+    return answers
+
+def build_profiles(model_stats_path: Path | None, latency_scale: float, overrides: dict | None = None, **defaults) -> dict[str, dict]:
+    # Latenz-Profile pro Modell aus model_statistics.json (skaliert), plus globale Fehlerraten und Overrides
+    profiles = {}
+    if model_stats_path is not None and Path(model_stats_path).is_file():
+        with Path(model_stats_path).open("r", encoding="utf-8") as f:
+            history = json.load(f)
+        for model, values in history.items():
+            median = values.get("p50_duration_seconds") or values.get("average_duration_seconds") or 1.0
+            profiles[normalize_model_name(model)] = {**DEFAULT_PROFILE, **defaults, "latency_median": median * latency_scale}
+    profiles["*"] = {**DEFAULT_PROFILE, **defaults, "latency_median": DEFAULT_PROFILE["latency_median"] * latency_scale}
+    for model, values in (overrides or {}).items():
+        key = normalize_model_name(model) if model != "*" else model
+        profiles[key] = {**profiles.get(key, profiles["*"]), **values}
+    return profiles
+
+class MockLLMServer:
+    def __init__(self, answers: dict[str, list[str]], profiles: dict[str, dict], timeout_seconds: float = 3600.0, seed: int | None = None, chunk_chars: int = 40):
+        self.answers = answers
+        self.all_answers = [a for values in answers.values() for a in values] or ['{"final_feedback": "ok"}']
+        self.profiles = profiles
+        self.timeout_seconds = timeout_seconds
+        self.chunk_chars = chunk_chars
+        self.rng = random.Random(seed)
+        self.counts = {"requests": 0, "ok": 0, "stream": 0, "rate_limited": 0, "timeouts": 0, "malformed": 0, "schema_rejected": 0, "choices_rejected": 0, "choices": 0}
+        self._server: asyncio.AbstractServer | None = None
+
+    def _profile(self, model: str) -> dict:
+        return self.profiles.get(normalize_model_name(model), self.profiles.get("*", DEFAULT_PROFILE))
+
+    def _latency(self, profile: dict) -> float:
+        median = profile["latency_median"]
+        if median <= 0:
+            return 0.0
+        return median * math.exp(self.rng.gauss(0, profile["latency_sigma"]))
+
+    @staticmethod
+    def _schema_rejection(profile: dict, response_format: dict | None) -> str | None:
+        # Fehlermeldung, falls das Profil das angefragte json_schema nicht unterstützt
+        if not response_format or response_format.get("type") != "json_schema":
+            return None
+        support = profile.get("json_schema", "full")
+        if support == "none":
+            return "response_format type 'json_schema' is not supported by this model"
+        schema_text = json.dumps(response_format.get("json_schema", {}).get("schema", {}))
+        if support == "compat" and any(k in schema_text for k in ('"$ref"', '"minimum"', '"anyOf"')):
+            return "Invalid schema for response_format: '$ref', 'anyOf' and 'minimum' are not supported"
+        return None
+
+    def _answer(self, model: str, profile: dict, strict: bool = False) -> str:
+        text = self.rng.choice(self.answers.get(normalize_model_name(model)) or self.all_answers)
+        # strikte Schema-Ausgabe liefert immer gültiges JSON
+        if strict or self.rng.random() >= profile["p_malformed"]:
+            return text
+        self.counts["malformed"] += 1
+        kind = self.rng.choice(MALFORMED_KINDS)
+        if kind == "prose":
+            return f"Hier ist die Analyse:\n{text}\nIch hoffe, das hilft."
+        if kind == "fence":
+            return f"```json\n{text}\n```"
+        if kind == "truncated":
+            return text[: int(len(text) * 0.8)]
+        if kind == "extra_field":
+            return '{"confidence": 0.9, ' + text[1:]
+        return text[:-1].rstrip() + ",}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self._server = await asyncio.start_server(self._handle, host, port, limit=2**20)
+        logger.info(f"Mock-LLM-Server läuft auf http://{host}:{port}/v1")
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        await self.start(host, port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # --- HTTP/1.1 (Keep-Alive, Content-Length, Chunked für SSE) ---
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                await self._dispatch(method, path, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer, status: int, payload: dict, extra_headers: dict | None = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests"}.get(status, "OK")
+        head = [f"HTTP/1.1 {status} {reason}", "content-type: application/json", f"content-length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in (extra_headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer) -> None:
+        if method == "GET" and path.rstrip("/").endswith("/stats"):
+            await self._send(writer, 200, self.counts)
+            return
+        if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+            await self._send(writer, 404, {"error": {"message": f"unbekannter Pfad {path}", "type": "invalid_request_error"}})
+            return
+        request = json.loads(body or b"{}")
+        model = request.get("model", "mock")
+        profile = self._profile(model)
+        self.counts["requests"] += 1
+        roll = self.rng.random()
+        if roll < profile["p_429"]:
+            self.counts["rate_limited"] += 1
+            await self._send(writer, 429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, {"retry-after": "0.05"})
+            return
+        if roll < profile["p_429"] + profile["p_timeout"]:
+            self.counts["timeouts"] += 1
+            await asyncio.sleep(self.timeout_seconds)
+            return
+        rejection = self._schema_rejection(profile, request.get("response_format"))
+        if rejection is not None:
+            self.counts["schema_rejected"] += 1
+            await self._send(writer, 400, {"error": {"message": rejection, "type": "invalid_request_error", "param": "response_format"}})
+            return
+        n = max(1, int(request.get("n") or 1))
+        if n > 1 and profile.get("choices", "full") != "full":
+            if profile["choices"] == "reject":
+                self.counts["choices_rejected"] += 1
+                await self._send(writer, 400, {"error": {"message": "Unsupported parameter: 'n' must be 1 for this model", "type": "invalid_request_error", "param": "n"}})
+                return
+            n = 1
+        strict = (request.get("response_format") or {}).get("type") == "json_schema"
+        latency = self._latency(profile)
+        text = self._answer(model, profile, strict)
+        if request.get("stream"):
+            self.counts["stream"] += 1
+            await self._stream(writer, model, text, latency, profile, request)
+        else:
+            await asyncio.sleep(latency)
+            await self._send(writer, 200, self._completion(model, [text] + [self._answer(model, profile, strict) for _ in range(n - 1)], request))
+        self.counts["ok"] += 1
+        self.counts["choices"] += 1 if request.get("stream") else n
+
+    def _usage(self, request: dict, texts: list[str]) -> dict:
+        prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+        prompt_tokens = prompt_chars // 4
+        completion_tokens = sum(len(t) for t in texts) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def _completion(self, model: str, texts: list[str], request: dict) -> dict:
+        return {
+            "id": f"mock-{self.counts['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": t}, "finish_reason": "stop"}
+                for i, t in enumerate(texts)
+            ],
+            "usage": self._usage(request, texts),
+        }
+
+    async def _stream(self, writer, model: str, text: str, latency: float, profile: dict, request: dict) -> None:
+        head = "HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n"
+        writer.write(head.encode("latin-1"))
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        ttft = latency * profile["ttft_share"]
+        gap = (latency - ttft) / len(chunks)
+
+        async def event(payload) -> None:
+            data = f"data: {payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+        created = int(time.time())
+        await asyncio.sleep(ttft)
+        for i, piece in enumerate(chunks):
+            if i:
+                await asyncio.sleep(gap)
+            await event({
+                "id": f"mock-{self.counts['requests']}", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+        final = {
+            "id": f"mock-{self.counts['requests']}", "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        await event(final)
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await event({**final, "choices": [], "usage": self._usage(request, [text])})
+        await event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+def serve(host: str, port: int, answers_dir: str, model_stats: str | None, latency_scale: float,
+          p_429: float, p_timeout: float, p_malformed: float, profile_file: str | None = None,
+          timeout_seconds: float = 3600.0, seed: int | None = None) -> None:
+    # Startet den Mock-Server blockierend (auch als Ziel für einen eigenen Prozess geeignet)
+    overrides = None
+    if profile_file:
+        with open(profile_file, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    profiles = build_profiles(
+        Path(model_stats) if model_stats else None, latency_scale, overrides,
+        p_429=p_429, p_timeout=p_timeout, p_malformed=p_malformed,
+    )
+    server = MockLLMServer(load_answers(Path(answers_dir)), profiles, timeout_seconds=timeout_seconds, seed=seed)
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,428 @@
+import asyncio
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from src import config
+from utils.logger import logging
+from utils.utils import add_metadata_to_row, add_request_meta_to_row, normalize_model_name, now_stamp
+from utils.case_loader import iter_cases
+from utils.result_sink import ResultSink, results_path, export_json_files
+from src.runner.client_pool import get_client, get_async_client, aclose_clients
+from src.runner.journal import RunJournal, new_run_id
+from src.runner.llm_runner import async_prompt_llm, build_user_prompt, parse_answer
+from src.runner.rate_limit import LimiterRegistry
+from src.runner.scheduler import WorkItem, build_work_queue
+from src.runner.structured_output import response_format_for, schema_support
+from src.llm_schema_prompts.model_prompts import FIX_JSON_PROMPT
+from src.test_statistics import init_stats, record_result, record_error, print_model_statistics
+from llm_schema_prompts.llm_output_format import LLMAnswer
+
+logger = logging.getLogger(__name__)
+
+# Offline-Ausführung über die Batch-API: die Experiment-Matrix wird als JSONL im Batch-Format geschrieben
+# (eine Zeile pro Zelle, custom_id = Label der Zelle), hochgeladen, abgewartet und die Ausgabedatei über
+# denselben Pfad wie im Online-Runner ausgewertet (parse_answer, Korrektur-Prompt, Statistik, Journal).
+# Die OpenAI-Batch-API erlaubt nur ein Modell pro Eingabedatei, daher gibt es pro Modell eine Request-Datei und einen
+# Batch (Teil). Der Zustand eines Batch-Laufs steht in outputs/batch/<run-id>.batch.json.
+
+BATCH_DIR = "batch"
+ENDPOINT = "/v1/chat/completions"
+# Batch-Status, bei denen sich nichts mehr ändert
+FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+def manifest_path(out_dir: Path, run_id: str) -> Path:
+    return Path(out_dir) / BATCH_DIR / f"{run_id}.batch.json"
+
+def load_manifest(out_dir: Path, run_id: str) -> dict:
+    path = manifest_path(out_dir, run_id)
+    if not path.is_file():
+        raise FileNotFoundError(f"Kein Batch-Lauf {run_id} in {path.parent} gefunden")
+    with path.open("r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if "parts" not in manifest:
+        # ältere Batch-Läufe: eine Request-Datei für alle Modelle (model=None)
+        manifest["parts"] = [{"model": None, "requests_path": manifest.pop("requests_path"), "num_requests": manifest.get("num_requests"),
+                              **{k: manifest.pop(k) for k in ("batch_id", "output_path", "errors_path") if k in manifest}}]
+    return manifest
+
+def save_manifest(out_dir: Path, manifest: dict) -> None:
+    path = manifest_path(out_dir, manifest["run_id"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def _work_items(manifest: dict, prompt_configs: list[dict]) -> list[WorkItem]:
+    cases = iter_cases(Path(manifest["input"]), limit=manifest["limit"], cache_dir=config.CASE_CACHE_DIR, workers=config.CASE_LOADER_WORKERS)
+    return build_work_queue(len(prompt_configs), manifest["models"], list(cases), manifest["repeat"], {})
+
+def request_line(item: WorkItem, prompt_configs: list[dict], compact_schema: bool, output_mode: str, compact_prompt: bool = False) -> dict:
+    # eine Zeile im Batch-Format; custom_id ist das Label der Zelle (Fall/Modell/Prompt/Wiederholung)
+    pc = prompt_configs[item.prompt_idx]
+    level = schema_support().level(item.model, output_mode)
+    return {
+        "custom_id": item.label,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {
+            "model": item.model,
+            "messages": [
+                {"role": "system", "content": pc["system_prompt"]},
+                {"role": "user", "content": build_user_prompt(item.case, pc["user_prompt_builder"], compact_schema=compact_schema, compact_prompt=compact_prompt, model=item.model)},
+            ],
+            "temperature": config.TEMPERATURE,
+            "response_format": response_format_for(LLMAnswer, level),
+        },
+    }
+
+def write_batch(out_dir: Path, model_list: list[str], cases_dir: str, limit: int | None, repeat: int, prompt_configs: list[dict],
+                compact_schema: bool = False, output_mode: str = "json_object", run_id: str | None = None, compact_prompt: bool = False) -> dict:
+    # Schritt 1: gesamte Matrix als Batch-JSONL schreiben (eine Datei pro Modell) und den Batch-Lauf anlegen
+    run_id = run_id or new_run_id()
+    manifest = {
+        "run_id": run_id, "created": datetime.now().isoformat(timespec="seconds"),
+        "models": model_list, "input": str(cases_dir), "limit": limit, "repeat": repeat,
+        "compact_schema": compact_schema, "compact_prompt": compact_prompt, "output_mode": output_mode,
+        "parts": [], "status": "written",
+    }
+    items = sorted(_work_items(manifest, prompt_configs))
+    for model in model_list:
+        path = Path(out_dir) / BATCH_DIR / f"{run_id}.{normalize_model_name(model)}.requests.jsonl"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        count = 0
+        with path.open("w", encoding="utf-8") as f:
+            for item in items:
+                if item.model == model:
+                    f.write(json.dumps(request_line(item, prompt_configs, compact_schema, output_mode, compact_prompt), ensure_ascii=False) + "\n")
+                    count += 1
+        manifest["parts"].append({"model": model, "requests_path": str(path), "num_requests": count})
+        logger.info(f"Batch {run_id}: {count} Requests für {model} nach {path} geschrieben")
+    manifest["num_requests"] = len(items)
+    save_manifest(out_dir, manifest)
+    return manifest
+
+# Batch-Endpunkt der OpenAI-API (Files + Batches)
+class OpenAIBatchBackend:
+    name = "openai"
+
+    def __init__(self):
+        self.client = get_client()
+
+    def submit(self, requests_path: Path, run_id: str) -> str:
+        with Path(requests_path).open("rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window="24h", metadata={"run_id": run_id},
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> dict:
+        batch = self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+            "completed": counts.completed if counts else None,
+            "failed": counts.failed if counts else None,
+            "total": counts.total if counts else None,
+        }
+
+    def download(self, file_id: str, target: Path) -> None:
+        self.client.files.content(file_id).write_to_file(target)
+
+# Lokaler Ersatz für den Batch-Endpunkt (Dateien in einem Spool-Ordner). Der Batch wird beim ersten Abfragen
+# des Status abgearbeitet, indem die Requests an OPENAI_BASE_URL geschickt werden (z.B. an den Mock-Server
+# oder an einen Provider ohne Batch-API). Ausgabe- und Fehlerdateien haben dasselbe Format wie bei OpenAI.
+class LocalBatchBackend:
+    name = "local"
+
+    def __init__(self, spool_dir: str | os.PathLike = config.BATCH_SPOOL_DIR, concurrency: int = 16):
+        self.dir = Path(spool_dir)
+        self.concurrency = concurrency
+
+    def _state_path(self, batch_id: str) -> Path:
+        return self.dir / batch_id / "batch.json"
+
+    def _state(self, batch_id: str) -> dict:
+        with self._state_path(batch_id).open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, batch_id: str, state: dict) -> None:
+        tmp = self._state_path(batch_id).with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, self._state_path(batch_id))
+
+    def submit(self, requests_path: Path, run_id: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:16]}"
+        (self.dir / batch_id).mkdir(parents=True)
+        shutil.copyfile(requests_path, self.dir / batch_id / "input.jsonl")
+        self._save_state(batch_id, {"id": batch_id, "status": "validating", "run_id": run_id, "created_at": time.time()})
+        return batch_id
+
+    def status(self, batch_id: str) -> dict:
+        state = self._state(batch_id)
+        if state["status"] not in FINAL_STATES:
+            state = self._process(batch_id, state)
+        return {
+            "status": state["status"],
+            "output_file_id": state.get("output_file_id"),
+            "error_file_id": state.get("error_file_id"),
+            "completed": state.get("completed"),
+            "failed": state.get("failed"),
+            "total": state.get("total"),
+        }
+
+    def download(self, file_id: str, target: Path) -> None:
+        shutil.copyfile(self.dir / file_id, target)
+
+    def _process(self, batch_id: str, state: dict) -> dict:
+        state["status"] = "in_progress"
+        self._save_state(batch_id, state)
+        with (self.dir / batch_id / "input.jsonl").open("r", encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        outputs, errors = asyncio.run(self._run_requests(requests))
+        for name, lines in (("output.jsonl", outputs), ("errors.jsonl", errors)):
+            with (self.dir / batch_id / name).open("w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+        state.update({
+            "status": "completed", "completed_at": time.time(), "total": len(requests),
+            "completed": len(outputs), "failed": len(errors),
+            "output_file_id": f"{batch_id}/output.jsonl" if outputs else None,
+            "error_file_id": f"{batch_id}/errors.jsonl" if errors else None,
+        })
+        self._save_state(batch_id, state)
+        return state
+
+    async def _run_requests(self, requests: list[dict]) -> tuple[list[dict], list[dict]]:
+        client = get_async_client()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outputs, errors = [], []
+
+        async def one(request: dict) -> None:
+            async with semaphore:
+                try:
+                    resp = await client.chat.completions.create(**request["body"])
+                    outputs.append({
+                        "id": f"batch_req_{uuid.uuid4().hex[:16]}", "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "request_id": resp.id, "body": resp.model_dump()}, "error": None,
+                    })
+                except Exception as e:
+                    errors.append({
+                        "id": f"batch_req_{uuid.uuid4().hex[:16]}", "custom_id": request["custom_id"], "response": None,
+                        "error": {"code": type(e).__name__, "message": str(e)},
+                    })
+
+        try:
+            await asyncio.gather(*(one(r) for r in requests))
+        finally:
+            await aclose_clients()
+        return outputs, errors
+
+def get_backend(name: str):
+    if name == "openai":
+        return OpenAIBatchBackend()
+    if name == "local":
+        return LocalBatchBackend()
+    raise ValueError(f"Unbekanntes Batch-Backend '{name}', erlaubt: openai, local")
+
+def submit_batch(out_dir: Path, run_id: str, backend_name: str) -> dict:
+    # Schritt 2a: Request-Dateien hochladen und einen Batch pro Modell starten
+    manifest = load_manifest(out_dir, run_id)
+    if manifest.get("backend") and manifest["backend"] != backend_name:
+        raise ValueError(f"Batch {run_id} wurde bereits mit Backend '{manifest['backend']}' eingereicht")
+    if backend_name == "openai" and any(p["model"] is None for p in manifest["parts"]) and len(manifest["models"]) > 1:
+        raise ValueError(f"Batch {run_id} enthält mehrere Modelle in einer Request-Datei; die OpenAI-Batch-API erlaubt nur "
+                         f"ein Modell pro Datei (neu schreiben mit batch write)")
+    backend = get_backend(backend_name)
+    for part in manifest["parts"]:
+        if part.get("batch_id"):
+            logger.warning(f"Batch {run_id} ({part['model'] or 'alle Modelle'}) wurde bereits eingereicht ({part['batch_id']})")
+            continue
+        part["batch_id"] = backend.submit(Path(part["requests_path"]), run_id)
+        part["status"] = "submitted"
+        manifest["backend"] = backend.name
+        manifest["status"] = "submitted"
+        # nach jedem Teil speichern, damit ein Abbruch keinen eingereichten Batch vergisst
+        save_manifest(out_dir, manifest)
+        logger.info(f"Batch {run_id} ({part['model'] or 'alle Modelle'}) eingereicht: {part['batch_id']} ({backend.name})")
+    return manifest
+
+def _overall_status(parts: list[dict]) -> str:
+    # Gesamtstatus: läuft, solange ein Teil nicht final ist; sonst completed oder der erste abweichende Endstatus
+    states = [p.get("status") for p in parts]
+    if any(s not in FINAL_STATES for s in states):
+        return "in_progress"
+    return next((s for s in states if s != "completed"), "completed")
+
+def poll_batch(out_dir: Path, run_id: str, interval: float = 60.0, wait: bool = True) -> dict:
+    # Schritt 2b: Status aller Teile abfragen (bis zum Ende, falls wait) und Ausgabe- bzw. Fehlerdateien herunterladen
+    manifest = load_manifest(out_dir, run_id)
+    if not any(p.get("batch_id") for p in manifest["parts"]):
+        raise RuntimeError(f"Batch {run_id} wurde noch nicht eingereicht (batch submit)")
+    backend = get_backend(manifest["backend"])
+    while True:
+        for part in manifest["parts"]:
+            if not part.get("batch_id") or part.get("status") in FINAL_STATES:
+                continue
+            status = backend.status(part["batch_id"])
+            part["status"] = status["status"]
+            logger.info(f"Batch {run_id} ({part['model'] or 'alle Modelle'}): {status['status']} ({status.get('completed')}/{status.get('total')} erledigt, "
+                        f"{status.get('failed')} fehlgeschlagen)")
+            if status["status"] in FINAL_STATES:
+                name = f"{run_id}.{normalize_model_name(part['model'])}" if part["model"] else run_id
+                for key, suffix in (("output_file_id", "output"), ("error_file_id", "errors")):
+                    if status.get(key):
+                        target = Path(out_dir) / BATCH_DIR / f"{name}.{suffix}.jsonl"
+                        backend.download(status[key], target)
+                        part[f"{suffix}_path"] = str(target)
+        manifest["status"] = _overall_status(manifest["parts"])
+        save_manifest(out_dir, manifest)
+        if manifest["status"] in FINAL_STATES or not wait:
+            break
+        time.sleep(interval)
+    return manifest
+
+def _read_lines(path: str | None):
+    if not path or not Path(path).is_file():
+        return
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+async def ingest_batch(out_dir: Path, run_id: str, prompt_configs: list[dict], concurrency: int = 8, export_json: bool = True, force: bool = False) -> dict | None:
+    # Schritt 3: Ausgabedateien wie im Online-Runner auswerten; Reparatur per Korrektur-Prompt läuft online.
+    # Zellen, die laut Journal schon erfolgreich ausgewertet sind, werden übersprungen (kein doppeltes Ergebnis,
+    # kein erneuter Korrektur-Prompt); ein bereits ausgewerteter Batch nur mit force (z.B. für fehlgeschlagene Zellen)
+    manifest = load_manifest(out_dir, run_id)
+    parts = manifest["parts"]
+    if not any(p.get("output_path") or p.get("errors_path") for p in parts):
+        raise RuntimeError(f"Batch {run_id} hat noch keine Ausgabedatei (batch poll)")
+    if manifest.get("status") == "ingested" and not force:
+        logger.warning(f"Batch {run_id} wurde bereits ausgewertet; erneut nur mit --force (erfolgreiche Zellen werden übersprungen)")
+        return None
+    model_list = manifest["models"]
+    output_mode = manifest["output_mode"]
+    compact_schema = manifest["compact_schema"]
+    journal = RunJournal(out_dir, run_id)
+    done = journal.done()
+    items = {item.label: item for item in _work_items(manifest, prompt_configs) if item.label not in done}
+    if done:
+        logger.info(f"Batch {run_id}: {len(done)} Zellen bereits ausgewertet, werden übersprungen")
+    # Status des Teils pro Modell (ältere Batch-Läufe: ein Teil für alle Modelle)
+    part_status = {p["model"]: p.get("status") for p in parts}
+    stats = init_stats(model_list)
+    limiters = LimiterRegistry(concurrency)
+    for model in model_list:
+        (Path(out_dir) / normalize_model_name(model)).mkdir(parents=True, exist_ok=True)
+    sink = ResultSink(results_path(out_dir, run_id), run_id).start()
+    journal.start({"models": model_list, "input": manifest["input"], "repeat": manifest["repeat"],
+                   "prompts": len(prompt_configs), "limit": manifest["limit"], "batch_ids": [p.get("batch_id") for p in parts]})
+
+    def record_failure(item: WorkItem, error: str) -> None:
+        record_error(stats, item.model, item.prompt_idx + 1)
+        export_name = f"{normalize_model_name(item.model)}/error_results_{item.case_id}_{item.model}_PROMPT{item.prompt_idx+1}_REPEAT{item.repeat}_{now_stamp(seconds=True)}.json"
+        sink.put(
+            {"cell": item.label, "case_id": item.case_id, "case_file": item.case.get("_file"), "model": item.model,
+             "prompt": item.prompt_idx + 1, "repeat": item.repeat, "status": "error", "export_name": export_name,
+             "data": {"case_id": item.case_id, "error": error}},
+            on_durable=lambda: journal.record(item.label, "error", file=export_name, error=error),
+        )
+
+    async def handle(item: WorkItem, body: dict) -> None:
+        pc = prompt_configs[item.prompt_idx]
+        choice = body["choices"][0]
+        raw = choice["message"]["content"] or ""
+        usage = body.get("usage") or {}
+        request_meta = {
+            "batch": True,
+            "output_mode": schema_support().level(item.model, output_mode),
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+        }
+        if manifest.get("compact_prompt"):
+            # Token-Schätzungen der Verdichtung wie im Online-Runner
+            build_user_prompt(item.case, pc["user_prompt_builder"], compact_schema=compact_schema, compact_prompt=True, model=item.model, meta=request_meta)
+        t0 = time.perf_counter()
+        repaired = False
+        try:
+            try:
+                parsed = parse_answer(raw, meta=request_meta)
+            except Exception:
+                # gleicher Korrektur-Prompt wie im Online-Runner
+                fix_prompt = FIX_JSON_PROMPT.format(raw_response=raw, schema_json=LLMAnswer.json_schema_str(compact=compact_schema))
+                repair_meta = {}
+                raw_fixed = await async_prompt_llm(item.model, pc["system_prompt"], fix_prompt, limiter=limiters.get(item.model), meta=repair_meta, output_mode=output_mode)
+                parsed = parse_answer(raw_fixed)
+                repaired = True
+                request_meta["repair_seconds"] = round(time.perf_counter() - t0, 3)
+                for key in ("prompt_tokens", "completion_tokens"):
+                    if key in repair_meta:
+                        request_meta[f"repair_{key}"] = repair_meta[key]
+        except Exception as e:
+            logger.error(f"Fehler bei Fall {item.case_id} ({item.model}, Batch): {e}")
+            record_failure(item, str(e))
+            return
+        row = parsed.model_dump()
+        if repaired:
+            row["_correction_attempted"] = True
+        # Batch-Antworten haben keine messbare Latenz pro Request (None statt 0, damit sie keine Mittelwerte verfälschen)
+        row = add_metadata_to_row(row, item.case, item.model, None, raw)
+        row = add_request_meta_to_row(row, request_meta)
+        record_result(stats, item.model, item.prompt_idx + 1, row)
+        model_name = normalize_model_name(item.model)
+        case_name = Path(item.case["_file"]).stem
+        export_name = f"{model_name}/RESULTS_{model_name.upper()}_{case_name.upper()}_REPEAT{item.repeat}_PROMPT{item.prompt_idx+1}_{now_stamp(seconds=True)}.json"
+        sink.put(
+            {"cell": item.label, "case_id": item.case_id, "case_file": item.case.get("_file"), "model": item.model,
+             "prompt": item.prompt_idx + 1, "repeat": item.repeat, "status": "ok", "export_name": export_name, "data": row},
+            on_durable=lambda: journal.record(item.label, "ok", file=export_name),
+        )
+
+    tasks = []
+    seen = set()
+    unknown = 0
+    try:
+        lines = [line for p in parts for key in ("output_path", "errors_path") for line in _read_lines(p.get(key))]
+        for line in lines:
+            if line.get("custom_id") in done:
+                continue
+            item = items.get(line.get("custom_id"))
+            if item is None:
+                unknown += 1
+                continue
+            seen.add(item.label)
+            response = line.get("response") or {}
+            if line.get("error") or response.get("status_code") != 200:
+                error = (line.get("error") or {}).get("message") or f"HTTP {response.get('status_code')}: {response.get('body')}"
+                record_failure(item, error)
+                continue
+            tasks.append(asyncio.create_task(handle(item, response["body"])))
+        # Zellen ohne Zeile in Ausgabe- oder Fehlerdatei (z.B. abgelaufener Batch)
+        for label, item in items.items():
+            if label not in seen:
+                record_failure(item, f"keine Antwort im Batch ({part_status.get(item.model, part_status.get(None))})")
+        await asyncio.gather(*tasks)
+        sink.close()
+        if export_json:
+            export_json_files(sink.path, Path(out_dir))
+        print_model_statistics(model_list, stats, out_dir)
+    finally:
+        sink.close()
+        journal.close()
+        await aclose_clients()
+    if unknown:
+        logger.warning(f"Batch {run_id}: {unknown} Zeilen mit unbekannter custom_id ignoriert")
+    manifest["status"] = "ingested"
+    save_manifest(out_dir, manifest)
+    logger.info(f"Batch {run_id} ausgewertet: {len(seen)} von {len(items)} offenen Zellen mit Antwort")
+    return stats
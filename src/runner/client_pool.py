@@ -0,0 +1,90 @@
+import threading
+import httpx
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Registry der Clients, die über den gesamten Lauf leben (Key: base_url + api_key)
+_async_clients: dict[tuple[str, str], AsyncOpenAI] = {}
+_sync_clients: dict[tuple[str, str], OpenAI] = {}
+_lock = threading.Lock()
+
+def _limits() -> httpx.Limits:
+    # Pool-Limits aus der Konfiguration
+    return httpx.Limits(
+        max_connections=config.POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=config.POOL_MAX_KEEPALIVE,
+        keepalive_expiry=config.POOL_KEEPALIVE_EXPIRY,
+    )
+
+def _http2_enabled() -> bool:
+    # HTTP/2 nur, wenn gewünscht und das Paket h2 installiert ist
+    if not config.HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("HTTP2 aktiviert, aber Paket 'h2' fehlt (pip install httpx[http2]). Nutze HTTP/1.1.")
+        return False
+    return True
+
+def _key(base_url: str | None, api_key: str | None) -> tuple[str, str]:
+    return (base_url or config.OPENAI_BASE_URL, api_key or config.require_api_key())
+
+# Liefert den gepoolten AsyncOpenAI-Client für base_url + api_key (wird beim ersten Aufruf erstellt)
+def get_async_client(base_url: str | None = None, api_key: str | None = None) -> AsyncOpenAI:
+    key = _key(base_url, api_key)
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _async_clients.get(key)
+        if client is None:
+            logger.debug(f"Erstelle gepoolten AsyncOpenAI-Client für {key[0]}")
+            http_client = DefaultAsyncHttpxClient(limits=_limits(), http2=_http2_enabled(), timeout=config.TIMEOUT)
+            client = AsyncOpenAI(api_key=key[1], base_url=key[0], timeout=config.TIMEOUT,
+                                 max_retries=config.MAX_RETRIES, http_client=http_client)
+            _async_clients[key] = client
+    return client
+
+# Liefert den gepoolten synchronen OpenAI-Client für base_url + api_key
+def get_client(base_url: str | None = None, api_key: str | None = None) -> OpenAI:
+    key = _key(base_url, api_key)
+    client = _sync_clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _sync_clients.get(key)
+        if client is None:
+            logger.debug(f"Erstelle gepoolten OpenAI-Client für {key[0]}")
+            http_client = DefaultHttpxClient(limits=_limits(), http2=_http2_enabled(), timeout=config.TIMEOUT)
+            client = OpenAI(api_key=key[1], base_url=key[0], timeout=config.TIMEOUT,
+                            max_retries=config.MAX_RETRIES, http_client=http_client)
+            _sync_clients[key] = client
+    return client
+
+# Schließt alle asynchronen Clients (am Ende von _run_async aufrufen, solange der Event-Loop noch läuft)
+async def aclose_clients() -> None:
+    with _lock:
+        clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"Fehler beim Schließen eines AsyncOpenAI-Clients: {e}")
+    close_clients()
+
+# Schließt alle synchronen Clients
+def close_clients() -> None:
+    with _lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Fehler beim Schließen eines OpenAI-Clients: {e}")
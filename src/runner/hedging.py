@@ -0,0 +1,159 @@
+import asyncio
+import json
+import time
+from collections import deque
+from pathlib import Path
+
+from src import config
+from src.test_statistics import percentile
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Hedged Requests (--hedge): ist ein Request nach der gelernten Latenz-Perzentile des Modells noch nicht fertig,
+# wird ein zweiter, identischer Request gestartet. Die erste erfolgreiche Antwort gewinnt, der andere Request wird
+# abgebrochen. Der Anteil gehedgter Requests ist begrenzt (HEDGE_MAX_SHARE); der Prompt des abgebrochenen Requests
+# wird als Mehrkosten geschätzt.
+
+# Mindestanzahl gemessener Latenzen im laufenden Lauf, bevor sie die historische Perzentile ersetzen
+MIN_SAMPLES = 20
+
+def load_history(paths: list[Path]) -> dict:
+    # model_statistics.json eines früheren Laufs (erste vorhandene Datei)
+    for path in paths:
+        if path is not None and Path(path).is_file():
+            try:
+                with Path(path).open("r", encoding="utf-8") as f:
+                    history = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Konnte {path} nicht lesen: {e}")
+                continue
+            return {m: v for m, v in history.items() if isinstance(v, dict)}
+    return {}
+
+class Hedger:
+    def __init__(self, model: str, history_delay: float | None, reference_p99: float | None = None, pct: float = config.HEDGE_PERCENTILE, max_share: float = config.HEDGE_MAX_SHARE):
+        self.model = model
+        self.history_delay = history_delay
+        # p99 der Request-Latenz eines früheren Laufs ohne Hedging als Vergleichswert (gleiche Messgröße wie observed)
+        self.reference_p99 = reference_p99
+        self.pct = pct
+        self.max_share = max_share
+        self.latencies: deque[float] = deque(maxlen=500)
+        # Latenz jedes Requests bis zur ersten Antwort (mit Hedging)
+        self.observed: list[float] = []
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.extra_prompt_tokens = 0
+
+    def delay(self) -> float | None:
+        # Wartezeit bis zum Hedge: Perzentile der bisher gemessenen Latenzen, sonst historischer Wert
+        if len(self.latencies) >= MIN_SAMPLES:
+            value = percentile(list(self.latencies), self.pct)
+        else:
+            value = self.history_delay
+        return max(config.HEDGE_MIN_DELAY, value) if value else None
+
+    def _may_hedge(self) -> bool:
+        return (self.hedges + 1) / max(self.requests, 1) <= self.max_share
+
+    async def run(self, call, meta: dict, est_prompt_tokens: int = 0, limiter=None):
+        # call(attempt_meta) startet einen Request; meta erhält die Messwerte der gewinnenden Antwort
+        self.requests += 1
+        t0 = time.perf_counter()
+        primary_meta: dict = {}
+        primary = asyncio.ensure_future(call(primary_meta))
+        delay = self.delay()
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or not self._may_hedge():
+            try:
+                result = await primary
+            finally:
+                meta.update(primary_meta)
+            elapsed = time.perf_counter() - t0
+            self.latencies.append(elapsed)
+            self.observed.append(elapsed)
+            meta["hedge_latency_seconds"] = round(elapsed, 3)
+            return result
+        # Hedge zählt gegen die Rate-Limits (RPM/TPM), belegt aber keinen weiteren Slot der Nebenläufigkeit
+        if limiter is not None:
+            await limiter.requests.acquire(1)
+            await limiter.tokens.acquire(est_prompt_tokens)
+        self.hedges += 1
+        self.extra_prompt_tokens += est_prompt_tokens
+        hedge_meta: dict = {}
+        hedge = asyncio.ensure_future(call(hedge_meta))
+        meta["hedged"] = True
+        meta["hedge_delay_seconds"] = round(delay, 3)
+        meta["hedge_extra_prompt_tokens"] = est_prompt_tokens
+        logger.debug("Hedge für %s nach %.1fs gestartet", self.model, delay)
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    won = task is hedge
+                    meta.update(hedge_meta if won else primary_meta)
+                    meta["hedge_won"] = won
+                    elapsed = time.perf_counter() - t0
+                    self.observed.append(elapsed)
+                    if won:
+                        self.hedge_wins += 1
+                    else:
+                        # nur Latenzen des Primär-Requests gehen in die Perzentile ein (gewonnene Hedges verkürzen sie nicht)
+                        self.latencies.append(elapsed)
+                    meta["hedge_latency_seconds"] = round(elapsed, 3)
+                    return task.result()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def summary(self) -> dict:
+        p99 = round(percentile(self.observed, 99), 3) if self.observed else None
+        delay = self.delay()
+        return {
+            "requests": self.requests, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.requests, 3) if self.requests else 0,
+            "delay_seconds": round(delay, 2) if delay else None,
+            "extra_prompt_tokens_est": self.extra_prompt_tokens,
+            "p99_seconds": p99,
+            "reference_p99_seconds": self.reference_p99,
+            "p99_improvement_seconds": round(self.reference_p99 - p99, 3) if p99 is not None and self.reference_p99 else None,
+        }
+
+# Ein Hedger pro Modell; Startwerte aus den historischen Statistiken
+class HedgeRegistry:
+    def __init__(self, model_list: list[str], history_paths: list[Path]):
+        # gespeichert sind p50/p90/p99; andere Perzentilen starten mit p90, bis genug eigene Messwerte vorliegen
+        pct = int(config.HEDGE_PERCENTILE)
+        key = f"p{pct if pct in (50, 90, 99) else 90}_duration_seconds"
+        history = load_history(history_paths)
+        # Vergleichswert aus der ersten Datei, die ihn für das Modell enthält: Läufe mit --hedge schreiben keinen,
+        # damit die Referenz nicht selbst gehedgt ist
+        histories = [load_history([path]) for path in history_paths]
+        self._hedgers = {
+            model: Hedger(model, history.get(model, {}).get(key),
+                          next((h[model]["p99_request_latency_seconds"] for h in histories if (h.get(model) or {}).get("p99_request_latency_seconds")), None))
+            for model in model_list
+        }
+
+    def get(self, model: str) -> Hedger:
+        hedger = self._hedgers.get(model)
+        if hedger is None:
+            hedger = self._hedgers[model] = Hedger(model, None, None)
+        return hedger
+
+    def summary(self) -> dict:
+        return {model: h.summary() for model, h in self._hedgers.items() if h.requests}
@@ -0,0 +1,86 @@
+import json
+import secrets
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = "runs"
+
+def new_run_id() -> str:
+    # Zeitstempel mit Sekunden + Zufallsanteil, damit parallele Läufe nicht kollidieren
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(3)}"
+
+# Append-only Journal eines Laufs (eine JSON-Zeile pro abgeschlossener Zelle)
+class RunJournal:
+    def __init__(self, out_dir: Path, run_id: str):
+        self.run_id = run_id
+        self.path = Path(out_dir) / JOURNAL_DIR / f"{run_id}.jsonl"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # letzter Status pro Zelle, für O(1)-Lookups beim Resume
+        self.cells: dict[str, dict] = {}
+        if self.path.exists():
+            self._load()
+        self._lock = threading.Lock()
+        self._fh = self.path.open("a", encoding="utf-8")
+        if self._fh.tell() > 0 and not self.path.read_bytes().endswith(b"\n"):
+            # unvollständige letzte Zeile abschließen, damit neue Einträge lesbar bleiben
+            self._fh.write("\n")
+
+    @staticmethod
+    def exists(out_dir: Path, run_id: str) -> bool:
+        return (Path(out_dir) / JOURNAL_DIR / f"{run_id}.jsonl").is_file()
+
+    def _load(self) -> None:
+        with self.path.open("r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # abgebrochene letzte Zeile nach einem Absturz ignorieren
+                    logger.warning(f"Journal {self.path}: Zeile {line_no} unlesbar, wird ignoriert")
+                    continue
+                if "cell" in entry:
+                    self.cells[entry["cell"]] = entry
+        logger.info(f"Journal {self.run_id} geladen: {len(self.cells)} Zellen, davon {len(self.done())} erfolgreich")
+
+    def _append(self, entry: dict) -> None:
+        entry["ts"] = datetime.now().isoformat(timespec="seconds")
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+
+    def start(self, meta: dict) -> None:
+        # Kopfzeile mit den Parametern des (fortgesetzten) Laufs
+        self._append({"type": "run", "run_id": self.run_id, **meta})
+
+    def record(self, cell: str, status: str, file: str | None = None, error: str | None = None) -> None:
+        entry = {"type": "cell", "cell": cell, "status": status}
+        if file is not None:
+            entry["file"] = file
+        if error is not None:
+            entry["error"] = error
+        self._append(entry)
+        self.cells[cell] = entry
+
+    def status(self, cell: str) -> str | None:
+        entry = self.cells.get(cell)
+        return entry["status"] if entry else None
+
+    def done(self) -> set[str]:
+        return {cell for cell, entry in self.cells.items() if entry["status"] == "ok"}
+
+    def failed(self) -> set[str]:
+        return {cell for cell, entry in self.cells.items() if entry["status"] == "error"}
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._fh.closed:
+                self._fh.close()
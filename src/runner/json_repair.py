@@ -0,0 +1,259 @@
+import json
+import re
+from functools import lru_cache
+
+from pydantic import BaseModel, ValidationError
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Lokale Reparaturstufe für LLM-Antworten, bevor ein FIX_JSON_PROMPT-Roundtrip nötig wird.
+# Alle Schritte arbeiten in linearer Zeit über den Text (ein Durchlauf, string-bewusst).
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+
+class JSONRepairError(ValueError):
+    pass
+
+def strip_code_fences(text: str) -> str:
+    # ```json ... ``` um die Antwort entfernen
+    m = _FENCE_RE.match(text)
+    return m.group(1) if m else text
+
+def iter_objects(text: str):
+    # Liefert alle vollständigen JSON-Objekte der obersten Ebene (Klammern innerhalb von Strings zählen nicht)
+    depth = 0
+    start = -1
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            if depth > 0:
+                in_string = True
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+def remove_trailing_commas(text: str) -> str:
+    # Entfernt Kommas direkt vor } oder ] (außerhalb von Strings)
+    out = []
+    in_string = False
+    escape = False
+    pending_comma = None
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if pending_comma is not None:
+            if ch.isspace():
+                pending_comma.append(ch)
+                continue
+            if ch not in "}]":
+                out.extend(pending_comma)
+            else:
+                out.extend(pending_comma[1:])
+            pending_comma = None
+        if ch == ",":
+            pending_comma = [ch]
+            continue
+        if ch == '"':
+            in_string = True
+        out.append(ch)
+    if pending_comma is not None:
+        out.extend(pending_comma)
+    return "".join(out)
+
+def complete_truncated(text: str) -> list[str]:
+    # Vervollständigt abgeschnittenes JSON. Kandidaten (vollständigster zuerst): offenen Wert-String schließen,
+    # bzw. bis zum letzten vollständigen Wert zurückschneiden; danach die offenen Klammern ergänzen
+    start = text.find("{")
+    if start < 0:
+        raise JSONRepairError("Kein JSON-Objekt im Text gefunden")
+    stack: list[str] = []
+    expect_key: list[bool] = []
+    in_string = False
+    string_is_key = False
+    escape = False
+    safe_pos = -1
+    safe_stack: tuple = ()
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if not string_is_key:
+                    safe_pos, safe_stack = i + 1, tuple(stack)
+            continue
+        if ch == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1] == "}" and expect_key[-1]
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            expect_key.append(ch == "{")
+            safe_pos, safe_stack = i + 1, tuple(stack)
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            expect_key.pop()
+            safe_pos, safe_stack = i + 1, tuple(stack)
+            if not stack:
+                # Objekt der obersten Ebene ist vollständig
+                return [text[start:i + 1]]
+        elif ch == ",":
+            if stack and stack[-1] == "}":
+                expect_key[-1] = True
+            # Wert vor dem Komma ist vollständig (auch Zahlen und Literale)
+            safe_pos, safe_stack = i, tuple(stack)
+        elif ch == ":":
+            if expect_key:
+                expect_key[-1] = False
+    candidates = []
+    if in_string and not string_is_key and not escape:
+        # offenen Wert-String schließen, der Text bis hierher bleibt erhalten
+        candidates.append(text[start:] + '"' + "".join(reversed(stack)))
+    if safe_pos >= 0:
+        candidates.append(text[start:safe_pos] + "".join(reversed(safe_stack)))
+    if not candidates:
+        raise JSONRepairError("Abgeschnittenes JSON konnte nicht vervollständigt werden")
+    return candidates
+
+def extract_json(text: str) -> tuple[dict, list[str]]:
+    # Liefert das JSON-Objekt der Antwort und die angewendeten lokalen Reparaturschritte
+    steps: list[str] = []
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data, steps
+    except json.JSONDecodeError:
+        pass
+    stripped = strip_code_fences(text)
+    if stripped is not text:
+        steps.append("code_fence")
+        try:
+            data = json.loads(stripped)
+            if isinstance(data, dict):
+                return data, steps
+        except json.JSONDecodeError:
+            pass
+    # vollständige Objekte im Text (z.B. mit Prosa davor oder danach)
+    for candidate in iter_objects(stripped):
+        for variant, extra in ((candidate, []), (remove_trailing_commas(candidate), ["trailing_comma"])):
+            try:
+                data = json.loads(variant)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict):
+                step = ["object_scan"] if candidate.strip() != stripped.strip() else []
+                return data, steps + step + extra
+    # abgeschnittene Antwort vervollständigen
+    error = None
+    for completed in complete_truncated(stripped):
+        try:
+            data = json.loads(remove_trailing_commas(completed))
+        except json.JSONDecodeError as e:
+            error = e
+            continue
+        if isinstance(data, dict):
+            return data, steps + ["truncated_completion"]
+    raise JSONRepairError(f"Lokale JSON-Reparatur fehlgeschlagen: {error}")
+
+def _resolve(schema: dict, node: dict) -> dict:
+    while "$ref" in node:
+        node = schema["$defs"][node["$ref"].rsplit("/", 1)[-1]]
+    return node
+
+def _clamp(value, node: dict, schema: dict, steps: set):
+    node = _resolve(schema, node)
+    alternatives = [_resolve(schema, a) for a in node.get("anyOf", [node])]
+    if isinstance(value, str):
+        string_node = next((a for a in alternatives if a.get("type") == "string"), None)
+        if string_node is None:
+            return value
+        if "enum" in string_node and value not in string_node["enum"]:
+            lowered = value.strip().lower()
+            if lowered in string_node["enum"]:
+                steps.add("enum_case")
+                return lowered
+            return value
+        max_len = string_node.get("maxLength")
+        if max_len is not None and len(value) > max_len:
+            steps.add("clamp_length")
+            return value[: max_len - 3].rstrip() + "..."
+        min_len = string_node.get("minLength")
+        if min_len is not None and len(value.strip()) < min_len and any(a.get("type") == "null" for a in alternatives):
+            # zu kurzer optionaler Text -> null
+            steps.add("clamp_length")
+            return None
+        return value
+    if isinstance(value, list):
+        array_node = next((a for a in alternatives if a.get("type") == "array"), None)
+        if array_node is None or "items" not in array_node:
+            return value
+        return [_clamp(v, array_node["items"], schema, steps) for v in value]
+    if isinstance(value, dict):
+        object_node = next((a for a in alternatives if a.get("type") == "object"), None)
+        if object_node is None:
+            return value
+        props = object_node.get("properties", {})
+        result = {}
+        for key, v in value.items():
+            if key not in props:
+                if object_node.get("additionalProperties") is False:
+                    steps.add("drop_extra_field")
+                    continue
+                result[key] = v
+                continue
+            result[key] = _clamp(v, props[key], schema, steps)
+        return result
+    return value
+
+@lru_cache(maxsize=None)
+def _model_schema(model: type[BaseModel]) -> dict:
+    # JSON-Schema einmal pro Modellklasse erzeugen (model_json_schema baut es bei jedem Aufruf neu)
+    return model.model_json_schema()
+
+def clamp_to_schema(data: dict, model: type[BaseModel]) -> tuple[dict, list[str]]:
+    # Kürzt zu lange Strings, entfernt unbekannte Felder und normalisiert Enum-Schreibweisen
+    schema = _model_schema(model)
+    steps: set = set()
+    return _clamp(data, schema, schema, steps), sorted(steps)
+
+def local_repair(text: str, model: type[BaseModel]) -> tuple[BaseModel, list[str]]:
+    # Schneller Weg: pydantic-core parst und validiert den Rohtext in einem Durchlauf (kein json.loads vorab).
+    # Erst wenn das scheitert: Extraktion + Validierung, bei Schemafehlern einmal gegen die Constraints geklemmt
+    try:
+        return model.model_validate_json(text), []
+    except ValidationError:
+        pass
+    data, steps = extract_json(text)
+    try:
+        return model.model_validate(data), steps
+    except ValidationError:
+        clamped, clamp_steps = clamp_to_schema(data, model)
+        if not clamp_steps:
+            raise
+        return model.model_validate(clamped), steps + clamp_steps
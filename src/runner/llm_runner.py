@@ -1,53 +1,57 @@
-import json
-import re
+import asyncio
+import statistics
+import time
+from functools import lru_cache
 from pydantic import ValidationError
 from openai import AsyncOpenAI, OpenAI
 from openai import OpenAIError
 import httpx
 
 from src import config
+from src.runner.client_pool import get_client, get_async_client
+from src.runner.response_cache import ResponseCache, CacheMissError, cache_key
+from src.runner.rate_limit import ModelLimiter, estimate_tokens
+from src.runner.stream_parser import StreamingSchemaValidator, SchemaDivergence
+from src.runner.structured_output import response_format_for, schema_support, is_format_rejection
+from src.runner.sampling import choice_support, is_choices_rejection, split_meta
+from src.runner.prompt_compaction import count_tokens
+from src.runner.prompt_builder import build_user_prompt
+from src.runner.hedging import Hedger
+from src.runner.json_repair import JSONRepairError, extract_json, local_repair
 from utils.logger import logging
 from llm_schema_prompts.llm_output_format import LLMAnswer
 
 logger = logging.getLogger(__name__)
 
-def build_user_prompt(case: dict, user_prompt: str) -> str:
-    # Creates user prompt
-    logger.debug(f"Building changed user prompt for case: {case.get('id', 'unknown')}")
-    case_id = case["id"]
-    inputs = case["input_tables"]
-    sql_transformation = case["sql_script"]
-    focus = case.get("focus", "Datentypen, Transformationen, Rechenlogik + Performance")
-    schema_json = LLMAnswer.json_schema_str()
-
-    prompt = user_prompt.format(
-        case_id=case_id,
-        inputs=json.dumps(inputs, ensure_ascii=False),
-        sql_transformation=sql_transformation,
-        focus=focus,
-        schema_json=schema_json
-    )
-    logger.debug(f"Changed user prompt built: {prompt[:200]}...")  # Log only the first 200 chars
-    return prompt
+# erzwungener JSON-Output
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+def _record_usage(usage, meta: dict | None) -> None:
+    # Token-Verbrauch inkl. gecachter Prompt-Tokens (Prompt-Caching des Providers) übernehmen
+    if usage is None or meta is None:
+        return
+    meta["prompt_tokens"] = usage.prompt_tokens
+    meta["completion_tokens"] = usage.completion_tokens
+    details = getattr(usage, "prompt_tokens_details", None)
+    meta["cached_tokens"] = (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
 
-# Aufruf der OpenAI-kompatiblen API (llm-stats.com mit api_key)
+@lru_cache(maxsize=1)
+def _answer_schema() -> dict:
+    # JSON-Schema von LLMAnswer für die Prüfung gestreamter Antworten
+    return LLMAnswer.model_json_schema()
+
+# Aufruf der OpenAI-kompatiblen API (llm-stats.com mit api_key), Client kommt aus dem Pool
 def _client() -> OpenAI:
-    logger.debug("Initializing OpenAI client")
     try:
-        client = OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL, timeout=config.TIMEOUT, max_retries=config.MAX_RETRIES)
-        logger.info("OpenAI client initialized successfully")
-        return client
+        return get_client()
     except Exception as e:
         logger.error(f"Failed to initialize OpenAI client: {e}")
         raise
 
-# Aufruf der AsyncOpenAI-kompatiblen API (llm-stats.com mit api_key)
+# Aufruf der AsyncOpenAI-kompatiblen API (llm-stats.com mit api_key), Client kommt aus dem Pool
 def _async_client() -> AsyncOpenAI:
-    logger.debug("Initializing AsyncOpenAI client")
     try:
-        client = AsyncOpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL, timeout=config.TIMEOUT, max_retries=config.MAX_RETRIES)
-        logger.info("AsyncOpenAI client initialized successfully")
-        return client
+        return get_async_client()
     except Exception as e:
         logger.error(f"Failed to initialize AsyncOpenAI client: {e}")
         raise
@@ -65,7 +69,7 @@ def prompt_llm(model: str, system_prompt: str, user_prompt: str) -> str:
             ],
             temperature=config.TEMPERATURE,
             # testen des forced JSON-Outputs
-            response_format={"type": "json_object"}
+            response_format=JSON_RESPONSE_FORMAT
         )
         logger.info("Received response from LLM")
         logger.debug(f"LLM response: {resp.choices[0].message.content[:200]}...")
@@ -79,48 +83,214 @@ def prompt_llm(model: str, system_prompt: str, user_prompt: str) -> str:
         raise
 
 # Asynchroner API-Aufruf für parallele Anfragen mit optionalem Streaming
-async def async_prompt_llm(model: str, system_prompt: str, user_prompt: str, stream: bool = False):
-    logger.info(f"Prompting LLM with model: {model}, stream={stream}")
+async def async_prompt_llm(model: str, system_prompt: str, user_prompt: str, stream: bool = False, cache: ResponseCache | None = None, limiter: ModelLimiter | None = None, meta: dict | None = None, output_mode: str = "json_object", hedger: Hedger | None = None, sample: int | str = 0):
+    # meta (optional) wird mit Messwerten des Requests befüllt (Cache-Treffer, Wartezeit, Netzwerkzeit, TTFT, Tokens, Ausgabestufe)
+    # sample: Kennung der Antwort im Cache (z.B. Prompt-Config und Wiederholung der Zelle)
+    logger.debug("Prompting LLM with model: %s, stream=%s", model, stream)
+    meta = {} if meta is None else meta
+    level = schema_support().level(model, output_mode)
+    key = None
+    if cache is not None and cache.mode != "off":
+        # Antwort aus dem Cache, falls vorhanden (im Replay-Modus ohne Netzwerkzugriff)
+        key = cache_key(model, system_prompt, user_prompt, config.TEMPERATURE, response_format_for(LLMAnswer, level), sample)
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("Antwort aus dem Cache für Modell: %s", model)
+            meta["cache_hit"] = True
+            meta["output_mode"] = level
+            return cached
+        if cache.replay_only:
+            raise CacheMissError(f"Keine gespeicherte Antwort im Cache für Modell {model} (Replay-Modus)")
+
+    async def timed_request():
+        # reine Netzwerkzeit (inkl. fehlgeschlagener Versuche), ohne Wartezeit im Limiter
+        t_net = time.perf_counter()
+        try:
+            if hedger is not None:
+                # bei Nachzüglern zweiter Request nach der gelernten Latenz-Perzentile, die schnellere Antwort gewinnt
+                texts = await hedger.run(lambda m: _request_llm(model, system_prompt, user_prompt, stream, m, output_mode), meta, count_tokens(system_prompt) + count_tokens(user_prompt), limiter)
+                return texts[0]
+            return (await _request_llm(model, system_prompt, user_prompt, stream, meta, output_mode))[0]
+        finally:
+            meta["network_seconds"] = round(meta.get("network_seconds", 0) + time.perf_counter() - t_net, 3)
+
+    if limiter is not None:
+        # Pro-Modell-Limits (RPM/TPM, adaptive Nebenläufigkeit, Backoff bei 429/Timeout)
+        raw = await limiter.run(timed_request, est_tokens=estimate_tokens(system_prompt, user_prompt), meta=meta)
+    else:
+        raw = await timed_request()
+    if key is not None:
+        if meta.get("output_mode", level) != level:
+            # Stufe wurde während des Requests herabgesetzt
+            key = cache_key(model, system_prompt, user_prompt, config.TEMPERATURE, response_format_for(LLMAnswer, meta["output_mode"]), sample)
+        cache.put(key, model, raw)
+    return raw
+
+# Mehrere unabhängige Antworten auf denselben Prompt (Wiederholungen): ein Request mit n Choices, wo der
+# Provider das unterstützt, sonst bzw. für den Rest parallele Einzel-Requests. Liefert (Antwort, meta) pro Choice.
+async def async_sample_llm(model: str, system_prompt: str, user_prompt: str, n: int, stream: bool = False, limiter: ModelLimiter | None = None, output_mode: str = "json_object", hedger: Hedger | None = None, cache: ResponseCache | None = None, samples: list | None = None) -> list[tuple[str, dict]]:
+    if cache is not None and cache.mode != "off":
+        # jede Choice hat ihren eigenen Cache-Eintrag (samples, z.B. Prompt-Config und Wiederholung der Zelle);
+        # angefragt werden nur die fehlenden, cache_hit steht nur an echten Treffern
+        samples = list(samples) if samples is not None else list(range(n))
+        level = schema_support().level(model, output_mode)
+        results: list = [None] * n
+        missing = []
+        for i, sample in enumerate(samples):
+            cached = cache.get(cache_key(model, system_prompt, user_prompt, config.TEMPERATURE, response_format_for(LLMAnswer, level), sample))
+            if cached is not None:
+                results[i] = (cached, {"cache_hit": True, "output_mode": level})
+            else:
+                missing.append(i)
+        if missing and cache.replay_only:
+            raise CacheMissError(f"Keine gespeicherte Antwort im Cache für Modell {model} (Replay-Modus)")
+        if missing:
+            fetched = await async_sample_llm(model, system_prompt, user_prompt, len(missing), stream, limiter, output_mode, hedger)
+            for i, (raw, meta) in zip(missing, fetched):
+                key = cache_key(model, system_prompt, user_prompt, config.TEMPERATURE, response_format_for(LLMAnswer, meta.get("output_mode", level)), samples[i])
+                cache.put(key, model, raw)
+                results[i] = (raw, meta)
+        return results
+    if n <= 1 or stream:
+        metas = [{} for _ in range(n)]
+        texts = await asyncio.gather(*(async_prompt_llm(model, system_prompt, user_prompt, stream=stream, limiter=limiter, meta=m, output_mode=output_mode, hedger=hedger) for m in metas))
+        return list(zip(texts, metas))
+    meta: dict = {}
+
+    async def timed_request():
+        t_net = time.perf_counter()
+        try:
+            if hedger is not None:
+                return await hedger.run(lambda m: _request_llm(model, system_prompt, user_prompt, stream, m, output_mode, n), meta, count_tokens(system_prompt) + count_tokens(user_prompt), limiter)
+            return await _request_llm(model, system_prompt, user_prompt, stream, meta, output_mode, n)
+        finally:
+            meta["network_seconds"] = round(meta.get("network_seconds", 0) + time.perf_counter() - t_net, 3)
+
+    # Prompt wird einmal verarbeitet, Ausgabe n-mal erwartet
+    est_tokens = estimate_tokens(system_prompt, user_prompt) + (n - 1) * config.EXPECTED_OUTPUT_TOKENS
+    if limiter is not None:
+        texts = await limiter.run(timed_request, est_tokens=est_tokens, meta=meta)
+    else:
+        texts = await timed_request()
+    results = list(zip(texts, split_meta(meta, len(texts))))
+    if len(texts) < n:
+        # fehlende Choices (n nicht unterstützt) einzeln und parallel nachholen
+        results += await async_sample_llm(model, system_prompt, user_prompt, n - len(texts), stream, limiter, output_mode, hedger)
+    return results
+
+async def _stream_llm(client: AsyncOpenAI, model: str, system_prompt: str, user_prompt: str, meta: dict | None, validate: bool, response_format: dict = JSON_RESPONSE_FORMAT) -> str:
+    # Liest den Stream, misst Time-to-First-Token und Abstände zwischen Chunks
+    validator = StreamingSchemaValidator(_answer_schema()) if validate else None
+    parts: list[str] = []
+    gaps: list[float] = []
+    t_start = time.perf_counter()
+    ttft = None
+    last = None
+    stream_resp = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=config.TEMPERATURE,
+        response_format=response_format,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    try:
+        async for chunk in stream_resp:
+            if getattr(chunk, "usage", None) is not None:
+                _record_usage(chunk.usage, meta)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            now = time.perf_counter()
+            if ttft is None:
+                ttft = now - t_start
+            else:
+                gaps.append(now - last)
+            last = now
+            parts.append(delta)
+            if validator is not None:
+                validator.feed(delta)
+    finally:
+        # bei Abbruch die Verbindung sofort schließen
+        await stream_resp.close()
+    if meta is not None:
+        meta["ttft_seconds"] = round(ttft, 3) if ttft is not None else None
+        meta["stream_chunks"] = len(parts)
+        if gaps:
+            meta["inter_token_p50_seconds"] = round(statistics.median(gaps), 4)
+            meta["inter_token_max_seconds"] = round(max(gaps), 3)
+    logger.debug("Streaming response received from LLM with model: %s", model)
+    return "".join(parts)
+
+async def _request_llm(model: str, system_prompt: str, user_prompt: str, stream: bool, meta: dict | None = None, output_mode: str = "json_object", n: int = 1) -> list[str]:
+    # liefert bis zu n Antworten (weniger, falls der Provider n nicht unterstützt; der Aufrufer fordert den Rest einzeln an)
     client = _async_client()
+    support = schema_support()
+    level = support.level(model, output_mode)
+    choices = choice_support()
+    n = 1 if stream else min(n, choices.limit(model))
     try:
-        if not stream:
-            resp = await client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=config.TEMPERATURE,
-                response_format={"type": "json_object"}
-            )
-            logger.info(f"Received response from LLM with model: {model}")
-            logger.debug(f"LLM response: {resp.choices[0].message.content[:200]}...")
-            return resp.choices[0].message.content
-        else:
-            # Streaming mode
-            result = ""
-            async with client.chat.completions.stream(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                response_format={"type": "json_object"}
-            ) as stream_resp:
-                async for event in stream_resp:
-                    if event.type == "message.delta":
-                        delta = event.delta.get("content", "")
-                        result += delta
-                        print(delta, end="", flush=True)
-            logger.info(f"Streaming response received from LLM with model: {model}")
-            return result
+        while True:
+            try:
+                texts = await _request_once(client, model, system_prompt, user_prompt, stream, meta, response_format_for(LLMAnswer, level), n)
+            except OpenAIError as e:
+                if n > 1 and is_choices_rejection(e):
+                    # Provider lehnt mehrere Choices pro Request ab -> für dieses Modell nur noch einzelne Requests
+                    n = choices.reduce(model, 1, e)
+                    continue
+                # Provider lehnt das strikte Schema ab -> nächste (lockerere) Stufe für dieses Modell
+                if level == "json_object" or not is_format_rejection(e):
+                    raise
+                level = support.downgrade(model, level, e)
+                if meta is not None:
+                    meta["schema_fallbacks"] = meta.get("schema_fallbacks", 0) + 1
+                continue
+            if len(texts) < n:
+                # n wurde ignoriert (weniger Choices als angefragt)
+                choices.reduce(model, len(texts), f"{len(texts)} statt {n} Choices erhalten")
+            if meta is not None:
+                meta["output_mode"] = level
+            return texts
     except (httpx.TimeoutException, OpenAIError) as e:
-        logger.error(f"Timeout or OpenAI error during async LLM prompt: {e}")
+        logger.error("Timeout or OpenAI error during async LLM prompt: %s", e)
         raise TimeoutError("Async LLM request timed out or failed.") from e
     except Exception as e:
-        logger.error(f"Error during LLM prompt: {e}")
+        logger.error("Error during LLM prompt: %s", e)
         raise
 
+async def _request_once(client: AsyncOpenAI, model: str, system_prompt: str, user_prompt: str, stream: bool, meta: dict | None, response_format: dict, n: int = 1) -> list[str]:
+    if not stream:
+        # n nur mitsenden, wenn mehrere Choices gewünscht sind (nicht jeder Provider kennt den Parameter)
+        extra = {"n": n} if n > 1 else {}
+        resp = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=config.TEMPERATURE,
+            response_format=response_format,
+            **extra,
+        )
+        logger.debug("Received response from LLM with model: %s (%d choices): %.200s...", model, len(resp.choices), resp.choices[0].message.content)
+        _record_usage(resp.usage, meta)
+        return [c.message.content for c in sorted(resp.choices, key=lambda c: c.index)]
+    # Streaming mode mit inkrementeller Schema-Prüfung, Abbruch + Neustart bei Abweichung
+    for attempt in range(config.STREAM_MAX_RESTARTS + 1):
+        # im letzten Versuch wird nicht mehr abgebrochen, sondern die Reparatur-Pipeline genutzt
+        validate = attempt < config.STREAM_MAX_RESTARTS
+        try:
+            return [await _stream_llm(client, model, system_prompt, user_prompt, meta, validate, response_format)]
+        except SchemaDivergence as e:
+            if meta is not None:
+                meta["stream_aborts"] = meta.get("stream_aborts", 0) + 1
+            logger.warning("Stream von %s weicht vom Schema ab, Abbruch und Neustart (%d/%d): %s", model, attempt + 1, config.STREAM_MAX_RESTARTS, e)
+
 def ping_llm():
     try:
         # Funktion zum Pingen des LLMs
@@ -138,35 +308,33 @@ def ping_llm():
 # JSON-Extraktion aus der LLM-Antwort
 def _extract_json(text: str) -> dict:
     """
-    Erwartet die JSON LLMANSWER. Textangaben außerhalb der JSON wird der Text abgeschnitten.
+    Erwartet die JSON LLMANSWER. Code-Fences, Text außerhalb der JSON, Kommas vor } oder ] und
+    abgeschnittene Antworten werden lokal repariert (siehe json_repair).
     """
     logger.debug("Extracting JSON from LLM response")
     try:
-        result = json.loads(text)
-        logger.debug("JSON extraction successful")
-        return result
-    except json.JSONDecodeError:
-        logger.warning("Direct JSON load failed, trying regex extraction")
-        m = re.search(r"\{.*\}", text, flags=re.DOTALL)
-        if not m:
-            logger.error("No JSON object found in text")
-            raise ValueError(f"Es konnte kein JSON-Objekt im Text gefunden werden. {text}")
-        try:
-            result = json.loads(m.group(0))
-            logger.debug("Regex JSON extraction successful")
-            return result
-        except Exception as e:
-            logger.error(f"Regex JSON extraction failed: {e}")
-            raise
-
-# parse Antwort und validiere gegen das Schema LLMAnswer
-def parse_answer(raw: str) -> LLMAnswer:
-    logger.debug("Parsing and validating LLM answer")
-    data = _extract_json(raw)
+        result, steps = extract_json(text)
+    except JSONRepairError as e:
+        logger.error(f"JSON extraction failed: {e}")
+        raise ValueError(f"Es konnte kein JSON-Objekt im Text gefunden werden. {text}") from e
+    if steps:
+        logger.debug("JSON extraction needed local repair: %s", steps)
+    return result
+
+# parse Antwort und validiere gegen das Schema LLMAnswer; lokale Reparaturschritte landen in meta["local_repair"]
+def parse_answer(raw: str, meta: dict | None = None) -> LLMAnswer:
     try:
-        answer = LLMAnswer.model_validate(data)
-        logger.info("LLM answer validated successfully")
-        return answer
+        answer, steps = local_repair(raw, LLMAnswer)
+    except JSONRepairError as e:
+        logger.error("JSON extraction failed: %s", e)
+        raise ValueError(f"Es konnte kein JSON-Objekt im Text gefunden werden. {raw}") from e
     except ValidationError as e:
-        logger.error(f"Antwort entspricht nicht dem Schema: {e}")
+        logger.error("Antwort entspricht nicht dem Schema: %s", e)
         raise ValueError(f"Antwort entspricht nicht dem Schema: {e}")
+    if steps:
+        logger.info("LLM answer locally repaired: %s", ", ".join(steps))
+        if meta is not None:
+            meta["local_repair"] = steps
+    else:
+        logger.debug("LLM answer validated successfully")
+    return answer
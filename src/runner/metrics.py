@@ -0,0 +1,226 @@
+import asyncio
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Live-Metriken eines Laufs (--metrics-port / --metrics-file) im Prometheus-Textformat: pro Modell und Prompt
+# Warteschlange, laufende Zellen, Abschlüsse, Fehler, Reparaturen, gleitende Zeichen/s und Tokens/s sowie ein
+# Latenz-Histogramm. process_case schreibt nur Zähler (O(1) pro Zelle); gerendert wird erst beim Abruf im Thread
+# des HTTP-Servers bzw. beim periodischen Schreiben der Textdatei (z.B. für den Textfile-Collector des node_exporter).
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class _Series:
+    # Zähler einer Kombination aus Modell und Prompt
+    __slots__ = ("queued", "in_flight", "completed", "errors", "repairs", "chars", "tokens", "window", "window_chars", "window_tokens", "buckets", "latency_sum")
+
+    def __init__(self, bucket_count: int):
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.repairs = 0
+        self.chars = 0
+        self.tokens = 0
+        # (Zeitpunkt, Zeichen, Tokens) der Abschlüsse im gleitenden Fenster
+        self.window: deque[tuple[float, int, int]] = deque()
+        self.window_chars = 0
+        self.window_tokens = 0
+        # Anzahl pro Bucket (nicht kumuliert, letzter Bucket = +Inf)
+        self.buckets = [0] * (bucket_count + 1)
+        self.latency_sum = 0.0
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+class RunMetrics:
+    def __init__(self, run_id: str = "", limiters=None, window: float = config.METRICS_WINDOW, buckets: list[float] = config.METRICS_LATENCY_BUCKETS):
+        self.run_id = run_id
+        # LimiterRegistry (optional): Wartende, laufende Requests und aktuelles AIMD-Limit pro Modell
+        self.limiters = limiters
+        self.window = window
+        self.bucket_bounds = sorted(float(b) for b in buckets)
+        self.started = time.time()
+        self._series: dict[tuple[str, int], _Series] = {}
+        # Zugriffe vom Event-Loop und vom HTTP-Thread; der Lock ist praktisch nie umkämpft
+        self._lock = threading.Lock()
+        self._server: ThreadingHTTPServer | None = None
+
+    def _get(self, model: str, prompt: int) -> _Series:
+        series = self._series.get((model, prompt))
+        if series is None:
+            series = self._series[(model, prompt)] = _Series(len(self.bucket_bounds))
+        return series
+
+    # --- Aufrufe aus dem Runner ---
+
+    def scheduled(self, model: str, prompt: int, count: int = 1) -> None:
+        with self._lock:
+            self._get(model, prompt).queued += count
+
+    def start(self, model: str, prompt: int) -> None:
+        # Zelle hat einen Limiter-Slot (rate_limit.on_slot) bzw. ist als Cache-Treffer fertig
+        with self._lock:
+            series = self._get(model, prompt)
+            # mit Lease-Queue werden Zellen erst beim Abholen gestartet und nicht vorab eingeplant
+            if series.queued:
+                series.queued -= 1
+            series.in_flight += 1
+
+    def finish(self, model: str, prompt: int, latency: float, chars: int = 0, tokens: int = 0, repaired: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            series = self._get(model, prompt)
+            series.in_flight -= 1
+            series.completed += 1
+            series.repairs += repaired
+            series.chars += chars
+            series.tokens += tokens
+            series.buckets[bisect_left(self.bucket_bounds, latency)] += 1
+            series.latency_sum += latency
+            series.window.append((now, chars, tokens))
+            series.window_chars += chars
+            series.window_tokens += tokens
+            self._prune(series, now)
+
+    def error(self, model: str, prompt: int) -> None:
+        with self._lock:
+            series = self._get(model, prompt)
+            series.in_flight -= 1
+            series.errors += 1
+
+    def _prune(self, series: _Series, now: float) -> None:
+        while series.window and series.window[0][0] < now - self.window:
+            _, chars, tokens = series.window.popleft()
+            series.window_chars -= chars
+            series.window_tokens -= tokens
+
+    # --- Ausgabe ---
+
+    def render(self) -> str:
+        now = time.monotonic()
+        # Momentaufnahme unter dem Lock, formatiert wird danach
+        with self._lock:
+            snapshot = []
+            for (model, prompt), s in sorted(self._series.items()):
+                self._prune(s, now)
+                snapshot.append(((model, prompt), s.queued, s.in_flight, s.completed, s.errors, s.repairs, s.chars, s.tokens,
+                                 s.window_chars, s.window_tokens, list(s.buckets), s.latency_sum))
+        # Rate über das Fenster, am Laufanfang über die bisherige Laufzeit
+        span = max(1e-9, min(self.window, time.time() - self.started))
+
+        lines: list[str] = []
+
+        def family(name: str, kind: str, help_text: str, rows: list[tuple[dict, float]]) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in rows:
+                lines.append(f"{name}{_labels(**labels)} {value}")
+
+        def rows(index: int, per_second: bool = False) -> list[tuple[dict, float]]:
+            return [({"run_id": self.run_id, "model": row[0][0], "prompt": row[0][1]}, round(row[index] / span, 3) if per_second else row[index])
+                    for row in snapshot]
+
+        family("llm_cells_queued", "gauge", "Eingeplante Zellen ohne Limiter-Slot (inkl. Wartezeit im Limiter und Batcher)", rows(1))
+        family("llm_cells_in_flight", "gauge", "Zellen mit Limiter-Slot ohne Ergebnis", rows(2))
+        family("llm_cells_completed_total", "counter", "Erfolgreich abgeschlossene Zellen", rows(3))
+        family("llm_cells_errors_total", "counter", "Fehlgeschlagene Zellen", rows(4))
+        family("llm_cells_repairs_total", "counter", "Zellen mit Korrektur-Prompt", rows(5))
+        family("llm_response_chars_total", "counter", "Zeichen der Antworten", rows(6))
+        family("llm_completion_tokens_total", "counter", "Completion-Tokens der Antworten", rows(7))
+        family("llm_response_chars_per_second", "gauge", f"Zeichen pro Sekunde im gleitenden Fenster ({self.window:g}s)", rows(8, per_second=True))
+        family("llm_completion_tokens_per_second", "gauge", f"Completion-Tokens pro Sekunde im gleitenden Fenster ({self.window:g}s)", rows(9, per_second=True))
+
+        lines.append("# HELP llm_cell_latency_seconds Modell-Latenz pro Zelle ohne Wartezeit im Limiter und Backoff")
+        lines.append("# TYPE llm_cell_latency_seconds histogram")
+        for row in snapshot:
+            (model, prompt), counts, latency_sum = row[0], row[10], row[11]
+            base = {"run_id": self.run_id, "model": model, "prompt": prompt}
+            cumulative = 0
+            for bound, count in zip(self.bucket_bounds + [float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"llm_cell_latency_seconds_bucket{_labels(**base, le=le)} {cumulative}")
+            lines.append(f"llm_cell_latency_seconds_sum{_labels(**base)} {round(latency_sum, 3)}")
+            lines.append(f"llm_cell_latency_seconds_count{_labels(**base)} {cumulative}")
+
+        if self.limiters is not None:
+            limiters = self.limiters.items()
+            family("llm_limiter_waiting", "gauge", "Requests, die auf RPM/TPM/Nebenläufigkeit warten",
+                   [({"run_id": self.run_id, "model": m}, l.waiting) for m, l in limiters])
+            family("llm_limiter_in_flight", "gauge", "Laufende Requests beim Provider",
+                   [({"run_id": self.run_id, "model": m}, l.concurrency.in_flight) for m, l in limiters])
+            family("llm_limiter_limit", "gauge", "Aktuelles AIMD-Limit der Nebenläufigkeit",
+                   [({"run_id": self.run_id, "model": m}, round(l.concurrency.limit, 2)) for m, l in limiters])
+            family("llm_limiter_overloads_total", "counter", "Überlast-Antworten (429/503/Timeout)",
+                   [({"run_id": self.run_id, "model": m}, l.overloads) for m, l in limiters])
+        return "\n".join(lines) + "\n"
+
+    # --- HTTP-Endpunkt und Textdatei ---
+
+    def serve(self, port: int, host: str = config.METRICS_HOST) -> int:
+        # /metrics im Hintergrund-Thread; Port 0 = freier Port (wird zurückgegeben)
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Abrufe nicht ins Lauf-Log schreiben
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server.server_address[1]
+
+    def write_textfile(self, path: str | Path) -> None:
+        # atomar ersetzen, damit ein Collector nie eine halbe Datei liest
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    async def dump_periodically(self, path: str | Path, interval: float = config.METRICS_INTERVAL) -> None:
+        # läuft als Task bis zum Abbruch durch den Runner
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write_textfile, path)
+            except OSError as e:
+                logger.warning("Konnte Metriken nicht nach %s schreiben: %s", path, e)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+def shard_textfile(path: str, shards: int, shard_index: int) -> str:
+    # bei mehreren Shards eine Datei pro Shard (metrics.prom -> metrics.s1.prom)
+    if shards <= 1:
+        return path
+    p = Path(path)
+    return str(p.with_name(f"{p.stem}.s{shard_index}{p.suffix}"))
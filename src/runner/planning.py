@@ -0,0 +1,117 @@
+import json
+import math
+from pathlib import Path
+
+from src import config
+from utils.logger import logging
+from utils.case_loader import iter_cases
+from src.runner.prompt_builder import build_user_prompt
+from src.runner.prompt_compaction import count_tokens
+from src.runner.scheduler import build_work_queue, estimate_makespan, load_expected_durations
+
+logger = logging.getLogger(__name__)
+
+# Planung eines Laufs ohne Netzwerkzugriff (run --dry-run): Experiment-Matrix aufspannen und Prompt-Tokens,
+# Requests, Laufzeit und Kosten pro Modell schätzen. Dauer und Antwortlänge stammen aus model_statistics.json
+# früherer Läufe, Preise aus MODEL_PRICES.
+
+def _history(paths: list[Path]) -> dict:
+    for path in paths:
+        if path is not None and Path(path).is_file():
+            try:
+                with Path(path).open("r", encoding="utf-8") as f:
+                    return json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("Konnte %s nicht lesen: %s", path, e)
+    return {}
+
+def _output_tokens(history: dict, model: str) -> int:
+    # erwartete Antwortlänge: durchschnittliche Zeichen des Modells (~4 Zeichen pro Token), sonst EXPECTED_OUTPUT_TOKENS
+    entry = history.get(model)
+    chars = entry.get("average_char_count") if isinstance(entry, dict) else None
+    return int(chars) // 4 if chars else config.EXPECTED_OUTPUT_TOKENS
+
+def _cost(model: str, prompt_tokens: int, output_tokens: int) -> float | None:
+    price = config.MODEL_PRICES.get(model)
+    if not isinstance(price, dict):
+        return None
+    return round((prompt_tokens * float(price.get("input", 0)) + output_tokens * float(price.get("output", 0))) / 1e6, 4)
+
+def plan_run(
+    model_list: list[str],
+    cases: str,
+    limit: int | None,
+    out: str,
+    concurrency: int,
+    repeat: int,
+    prompt_configs: list[dict],
+    compact_schema: bool = False,
+    compact_prompt: bool = False,
+    sample_batching: bool = True,
+) -> dict:
+    out_dir = Path(out)
+    history_paths = [out_dir / "model_statistics.json", Path(config.HISTORY_STATS_PATH)]
+    cases_list = list(iter_cases(Path(cases), limit=limit, cache_dir=config.CASE_CACHE_DIR, workers=config.CASE_LOADER_WORKERS))
+    expected = load_expected_durations(model_list, history_paths)
+    history = _history(history_paths)
+    items = build_work_queue(len(prompt_configs), model_list, cases_list, repeat, expected)
+    slots = {m: int(config.MODEL_LIMITS.get(m, {}).get("max_concurrency", concurrency)) for m in model_list}
+    makespan = estimate_makespan(items, slots)
+
+    # inhaltsgleiche Prompt-Configs teilen sich wie im Runner einen Request (mit --sample-batching)
+    prompt_group = {
+        idx: next(j for j, other in enumerate(prompt_configs)
+                  if (other["system_prompt"], other["user_prompt_builder"]) == (pc["system_prompt"], pc["user_prompt_builder"]))
+        for idx, pc in enumerate(prompt_configs)
+    }
+    groups = sorted(set(prompt_group.values()))
+    group_cells = {g: repeat * sum(1 for v in prompt_group.values() if v == g) for g in groups}
+
+    models = {}
+    for model in model_list:
+        out_tokens = _output_tokens(history, model)
+        cells = requests = prompt_tokens = 0
+        for case in cases_list:
+            for g in groups:
+                pc = prompt_configs[g]
+                user_prompt = build_user_prompt(case, pc["user_prompt_builder"], compact_schema=compact_schema, compact_prompt=compact_prompt, model=model)
+                tokens = count_tokens(pc["system_prompt"]) + count_tokens(user_prompt)
+                k = group_cells[g]
+                # mit Bündelung wird der Prompt einmal pro Request (bis MAX_CHOICES_PER_REQUEST Choices) abgerechnet
+                sent = math.ceil(k / max(1, config.MAX_CHOICES_PER_REQUEST)) if sample_batching else k
+                cells += k
+                requests += sent
+                prompt_tokens += sent * tokens
+        output_tokens = cells * out_tokens
+        models[model] = {
+            "cells": cells,
+            "requests": requests,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens_est": output_tokens,
+            "expected_seconds_per_cell": round(expected[model], 2),
+            "slots": slots[model],
+            "cost_usd_est": _cost(model, prompt_tokens, output_tokens),
+        }
+    costs = [m["cost_usd_est"] for m in models.values()]
+    return {
+        "cases": len(cases_list),
+        "prompts": len(prompt_configs),
+        "repeat": repeat,
+        "cells": len(items),
+        "models": models,
+        "prompt_tokens": sum(m["prompt_tokens"] for m in models.values()),
+        "output_tokens_est": sum(m["output_tokens_est"] for m in models.values()),
+        "cost_usd_est": round(sum(costs), 4) if costs and all(c is not None for c in costs) else None,
+        "makespan_seconds_est": makespan["global_queue_seconds"],
+    }
+
+def print_plan(plan: dict) -> None:
+    print(f"\n=== Plan: {plan['cases']} Fälle x {len(plan['models'])} Modelle x {plan['prompts']} Prompts x {plan['repeat']} Wiederholungen = {plan['cells']} Zellen ===")
+    print(f"{'Modell':<34}{'Zellen':>8}{'Requests':>10}{'Prompt-Tok.':>13}{'Output-Tok.':>13}{'s/Zelle':>9}{'Slots':>7}{'Kosten $':>11}")
+    for model, m in plan["models"].items():
+        cost = "-" if m["cost_usd_est"] is None else f"{m['cost_usd_est']:.2f}"
+        print(f"{model:<34}{m['cells']:>8}{m['requests']:>10}{m['prompt_tokens']:>13}{m['output_tokens_est']:>13}"
+              f"{m['expected_seconds_per_cell']:>9}{m['slots']:>7}{cost:>11}")
+    cost = "- (Preise über MODEL_PRICES setzen)" if plan["cost_usd_est"] is None else f"{plan['cost_usd_est']:.2f} USD"
+    print(f"Prompt-Tokens gesamt: {plan['prompt_tokens']}, erwartete Output-Tokens: {plan['output_tokens_est']}, Kosten: {cost}")
+    print(f"Erwartete Laufzeit: {plan['makespan_seconds_est']}s (globale Queue, jede Zelle einzeln, ohne Rate-Limits)")
@@ -0,0 +1,55 @@
+import json
+
+from src.runner.prompt_compaction import compact_inputs, count_tokens, token_budget
+from utils.logger import logging
+from llm_schema_prompts.llm_output_format import LLMAnswer
+
+logger = logging.getLogger(__name__)
+
+# Aufbau des User-Prompts ohne Abhängigkeit vom OpenAI-Client (auch für batch write und run --dry-run)
+
+# serialisierte Eingabetabellen pro Fall (werden für alle Prompt-Configs und Wiederholungen wiederverwendet)
+_inputs_json_cache: dict[tuple, str] = {}
+# verdichtete Eingabetabellen pro Fall und Token-Budget: (JSON, angewendete Schritte)
+_compact_inputs_cache: dict[tuple, tuple[str, list[str]]] = {}
+
+def _inputs_json(case: dict) -> str:
+    key = (case.get("_file"), case.get("id"))
+    inputs_json = _inputs_json_cache.get(key)
+    if inputs_json is None:
+        inputs_json = json.dumps(case["input_tables"], ensure_ascii=False)
+        _inputs_json_cache[key] = inputs_json
+    return inputs_json
+
+def _compact_inputs_json(case: dict, max_tokens: int) -> tuple[str, list[str]]:
+    key = (case.get("_file"), case.get("id"), max_tokens)
+    entry = _compact_inputs_cache.get(key)
+    if entry is None:
+        entry = compact_inputs(case["input_tables"], case.get("sql_script", ""), max_tokens)
+        _compact_inputs_cache[key] = entry
+    return entry
+
+def build_user_prompt(case: dict, user_prompt: str, compact_schema: bool = False, compact_prompt: bool = False, model: str | None = None, meta: dict | None = None) -> str:
+    # Creates user prompt; compact_prompt=True verdichtet Eingabetabellen und Schema auf das Token-Budget des Modells
+    # (Token-Schätzungen vorher/nachher und die Schritte landen in meta)
+    fields = {
+        "case_id": case["id"],
+        "sql_transformation": case["sql_script"],
+        "focus": case.get("focus", "Datentypen, Transformationen, Rechenlogik + Performance"),
+    }
+    prompt = user_prompt.format(inputs=_inputs_json(case), schema_json=LLMAnswer.json_schema_str(compact=compact_schema), **fields)
+    if compact_prompt:
+        schema_json = LLMAnswer.json_schema_str(minify=True)
+        budget = token_budget(model)
+        # Budget für die Tabellen = Gesamtbudget abzüglich des restlichen Prompts
+        rest = count_tokens(user_prompt.format(inputs="", schema_json=schema_json, **fields))
+        inputs, steps = _compact_inputs_json(case, max(1, budget - rest) if budget > 0 else 0)
+        original_tokens = count_tokens(prompt)
+        prompt = user_prompt.format(inputs=inputs, schema_json=schema_json, **fields)
+        if meta is not None:
+            meta["user_prompt_tokens_original"] = original_tokens
+            meta["user_prompt_tokens_compacted"] = count_tokens(prompt)
+            meta["prompt_compaction"] = ["schema_minified", *steps]
+    # %.200s kürzt erst beim Formatieren im Log-Thread (und nur, wenn DEBUG aktiv ist)
+    logger.debug("Changed user prompt built: %.200s...", prompt)
+    return prompt
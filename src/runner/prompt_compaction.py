@@ -0,0 +1,117 @@
+import json
+import re
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Verdichtung der Eingabetabellen im User-Prompt (--compact-prompt). Die Prompt-Größe soll mit dem
+# analysierten SQL wachsen, nicht mit den Beispielzeilen realer Tabellen:
+# - Spalten, die im sql_script nicht vorkommen, nur noch als Namensliste (ein fehlender Bezug kann der Fehler sein)
+# - Spalten und Zeilen tabellarisch (Feldnamen einmal, danach Werte-Listen) statt Objekten mit wiederholten Schlüsseln
+# - doppelte Zeilen entfernen, danach gleichmäßig verteilte Stichprobe, bis das Token-Budget des Modells eingehalten wird
+
+_SQL_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_SQL_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_$#]*")
+_SELECT_STAR_RE = re.compile(r"(?:^|[\s,(])(?:[A-Za-z_][A-Za-z0-9_]*\.)?\*(?:\s|,|$)")
+
+def count_tokens(text: str) -> int:
+    # grobe Schätzung wie im Rate-Limiter (~4 Zeichen pro Token), ohne Tokenizer-Abhängigkeit
+    return len(text) // 4 if text else 0
+
+def token_budget(model: str | None) -> int:
+    # Budget für den gesamten User-Prompt pro Modell (PROMPT_TOKEN_BUDGETS), <= 0 = unbegrenzt
+    budgets = config.PROMPT_TOKEN_BUDGETS
+    return int(budgets.get(model, budgets.get("*", config.DEFAULT_PROMPT_TOKEN_BUDGET)))
+
+def referenced_identifiers(sql: str) -> set[str]:
+    # Bezeichner im SQL ohne Kommentare und String-Literale (Groß-/Kleinschreibung egal)
+    sql = _SQL_STRING_RE.sub(" ", _SQL_COMMENT_RE.sub(" ", sql or ""))
+    return {m.group(0).upper() for m in _IDENTIFIER_RE.finditer(sql)}
+
+def _tabular(records: list[dict]) -> dict:
+    # [{a: 1, b: 2}, {a: 3, b: 4}] -> {"fields": [a, b], "values": [[1, 2], [3, 4]]}
+    fields: list[str] = []
+    for record in records:
+        for key in record:
+            if key not in fields:
+                fields.append(key)
+    return {"fields": fields, "values": [[record.get(f) for f in fields] for record in records]}
+
+def _dedupe(rows: list[dict]) -> list[dict]:
+    seen = set()
+    out = []
+    for row in rows:
+        key = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+        if key not in seen:
+            seen.add(key)
+            out.append(row)
+    return out
+
+def _sample(rows: list, n: int) -> list:
+    # gleichmäßig verteilte, deterministische Stichprobe (gleicher Prompt für alle Wiederholungen)
+    if n >= len(rows):
+        return rows
+    if n <= 0:
+        return []
+    step = len(rows) / n
+    return [rows[int(i * step)] for i in range(n)]
+
+def _compact_table(name: str, table: dict, identifiers: set[str], select_star: bool, steps: set[str]) -> dict:
+    columns = table.get("columns") or []
+    out = {}
+    kept = columns
+    if columns and not select_star:
+        kept = [c for c in columns if str(c.get("name", "")).upper() in identifiers]
+        other = [c.get("name") for c in columns if c not in kept]
+        if other:
+            steps.add("columns_pruned")
+            out["other_columns"] = other
+    if kept:
+        out["columns"] = _tabular(kept)
+    rows = table.get("rows") or table.get("sample_rows")
+    if rows:
+        if kept and kept is not columns:
+            names = {c.get("name") for c in kept}
+            rows = [{k: v for k, v in row.items() if k in names} if isinstance(row, dict) else row for row in rows]
+        deduped = _dedupe(rows)
+        if len(deduped) < len(rows):
+            steps.add("rows_deduplicated")
+        out["rows"] = deduped
+    # weitere Angaben (z.B. Primärschlüssel, Beschreibung) unverändert übernehmen
+    for key, value in table.items():
+        if key not in ("columns", "rows", "sample_rows"):
+            out[key] = value
+    return out
+
+def _dumps(tables: dict) -> str:
+    # Zeilen erst beim Serialisieren tabellarisch, damit sie vorher noch gekürzt werden können
+    rendered = {
+        name: {**t, "rows": _tabular(t["rows"])} if t.get("rows") and all(isinstance(r, dict) for r in t["rows"]) else t
+        for name, t in tables.items()
+    }
+    return json.dumps(rendered, ensure_ascii=False, separators=(",", ":"), default=str)
+
+def compact_inputs(input_tables: dict, sql: str, max_tokens: int | None = None) -> tuple[str, list[str]]:
+    # Liefert die verdichteten Eingabetabellen als JSON und die angewendeten Schritte
+    identifiers = referenced_identifiers(sql)
+    select_star = bool(_SELECT_STAR_RE.search(_SQL_COMMENT_RE.sub(" ", sql or "")))
+    steps = {"tabular"}
+    tables = {name: _compact_table(name, table or {}, identifiers, select_star, steps) for name, table in input_tables.items()}
+    text = _dumps(tables)
+    if max_tokens is None or max_tokens <= 0:
+        return text, sorted(steps)
+    # Zeilen halbieren, bis das Budget passt (mindestens eine Zeile pro Tabelle bleibt erhalten)
+    full_rows = {name: t["rows"] for name, t in tables.items() if t.get("rows")}
+    limit = max((len(r) for r in full_rows.values()), default=0)
+    while limit > 1 and count_tokens(text) > max_tokens:
+        limit //= 2
+        for name, rows in full_rows.items():
+            tables[name]["rows"] = _sample(rows, limit)
+        text = _dumps(tables)
+        steps.add("rows_sampled")
+    if count_tokens(text) > max_tokens:
+        logger.debug("Eingabetabellen nach Verdichtung über dem Budget (%d > %d Tokens)", count_tokens(text), max_tokens)
+    return text, sorted(steps)
@@ -0,0 +1,195 @@
+import asyncio
+import time
+from contextvars import ContextVar
+import httpx
+from openai import RateLimitError, APITimeoutError
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# HTTP-Status, die auf Überlast beim Provider hindeuten
+OVERLOAD_STATUS = (429, 503, 529)
+
+# Rückrufe der Zelle(n), für die gerade ein Request läuft; ModelLimiter.run ruft sie auf, sobald ein Slot belegt ist
+# (z.B. Live-Metriken: Zelle wechselt erst dann von "queued" zu "in_flight")
+on_slot: ContextVar[tuple] = ContextVar("on_slot", default=())
+
+def _exception_chain(exc: BaseException):
+    # liefert die Exception und alle Ursachen (raise ... from ...)
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__ or exc.__context__
+
+def is_overload_error(exc: BaseException) -> bool:
+    # 429 / Timeout / Überlast irgendwo in der Exception-Kette
+    for e in _exception_chain(exc):
+        if isinstance(e, (RateLimitError, APITimeoutError, httpx.TimeoutException)):
+            return True
+        if getattr(e, "status_code", None) in OVERLOAD_STATUS:
+            return True
+    return False
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    # Retry-After-Header des Providers auslesen, falls vorhanden
+    for e in _exception_chain(exc):
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers is None:
+            continue
+        value = headers.get("retry-after")
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+    return None
+
+def estimate_tokens(*texts: str) -> int:
+    # grobe Schätzung (~4 Zeichen pro Token) plus erwartete Ausgabe
+    return sum(len(t) for t in texts if t) // 4 + config.EXPECTED_OUTPUT_TOKENS
+
+# Token-Bucket für Requests bzw. Tokens pro Minute (rate_per_minute <= 0 = unbegrenzt)
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        # Lock wird beim Warten gehalten -> Anfragen werden in Reihenfolge bedient
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+# Nebenläufigkeitslimit mit AIMD: +1 pro erfolgreichem "Fenster", Halbierung bei Überlast
+class AIMDLimiter:
+    def __init__(self, ceiling: int, floor: int = 1, decrease: float = 0.5, cooldown: float = 5.0):
+        self.ceiling = max(1, ceiling)
+        self.floor = max(1, min(floor, self.ceiling))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(self.ceiling)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(float(self.ceiling), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_overload(self) -> None:
+        # nur einmal pro Cooldown halbieren, damit ein Burst von 429ern nicht auf 1 drückt
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.floor), self.limit * self.decrease)
+
+# Limiter für ein Modell: RPM + TPM Token-Buckets und adaptive Nebenläufigkeit
+class ModelLimiter:
+    def __init__(self, model: str, max_concurrency: int, rpm: float = 0, tpm: float = 0, retries: int = config.RATE_LIMIT_RETRIES):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AIMDLimiter(max_concurrency)
+        self.retries = retries
+        self.overloads = 0
+        # Requests, die gerade auf einen der Limiter warten (für die Live-Metriken)
+        self.waiting = 0
+
+    async def run(self, call, est_tokens: int = 0, meta: dict | None = None):
+        # führt call() unter den Limits aus, bei Überlast mit Backoff und erneutem Versuch
+        # meta (optional) erhält die Wartezeit in den Limitern und die Backoff-Zeit
+        attempt = 0
+        while True:
+            t_wait = time.perf_counter()
+            self.waiting += 1
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(est_tokens)
+                await self.concurrency.acquire()
+            finally:
+                self.waiting -= 1
+            if meta is not None:
+                meta["queue_wait_seconds"] = round(meta.get("queue_wait_seconds", 0) + time.perf_counter() - t_wait, 3)
+            for callback in on_slot.get():
+                callback()
+            try:
+                result = await call()
+            except Exception as e:
+                if not is_overload_error(e) or attempt >= self.retries:
+                    raise
+                self.overloads += 1
+                self.concurrency.on_overload()
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(60.0, 2.0 ** attempt)
+                attempt += 1
+                logger.warning(f"Überlast bei {self.model} ({type(e).__name__}), Limit jetzt {int(self.concurrency.limit)}, "
+                               f"neuer Versuch {attempt}/{self.retries} in {delay:.1f}s")
+            else:
+                self.concurrency.on_success()
+                return result
+            finally:
+                await self.concurrency.release()
+            await asyncio.sleep(delay)
+            if meta is not None:
+                meta["backoff_seconds"] = round(meta.get("backoff_seconds", 0) + delay, 3)
+
+# Verwaltet einen Limiter pro Modell, Obergrenzen aus config.MODEL_LIMITS (sonst --concurrency)
+class LimiterRegistry:
+    def __init__(self, default_concurrency: int, limits: dict | None = None):
+        self.default_concurrency = default_concurrency
+        self.limits = config.MODEL_LIMITS if limits is None else limits
+        self._limiters: dict[str, ModelLimiter] = {}
+
+    def get(self, model: str) -> ModelLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            settings = self.limits.get(model, {})
+            limiter = ModelLimiter(
+                model,
+                max_concurrency=int(settings.get("max_concurrency", self.default_concurrency)),
+                rpm=float(settings.get("rpm", 0)),
+                tpm=float(settings.get("tpm", 0)),
+            )
+            self._limiters[model] = limiter
+            logger.debug(f"Limiter für {model}: max_concurrency={limiter.concurrency.ceiling}, "
+                         f"rpm={settings.get('rpm', 0)}, tpm={settings.get('tpm', 0)}")
+        return limiter
+
+    def items(self) -> list[tuple[str, ModelLimiter]]:
+        return list(self._limiters.items())
+
+    def summary(self) -> dict:
+        return {
+            model: {"limit": round(l.concurrency.limit, 2), "ceiling": l.concurrency.ceiling, "overloads": l.overloads}
+            for model, l in self._limiters.items()
+        }
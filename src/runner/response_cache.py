@@ -0,0 +1,140 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ("off", "read", "write", "readwrite")
+
+class CacheMissError(RuntimeError):
+    # Wird im Replay-Modus geworfen, wenn keine gespeicherte Antwort existiert
+    pass
+
+def cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float | None, response_format: dict | None, sample: int | str = 0) -> str:
+    # Content-Hash über alle Parameter, die die Antwort des LLMs bestimmen. sample unterscheidet unabhängige Antworten
+    # auf denselben Prompt (Prompt-Config und Wiederholung der Zelle), damit jede Wiederholung ihre eigene Antwort behält
+    payload = json.dumps(
+        {
+            "model": model,
+            "system": system_prompt,
+            "user": user_prompt,
+            "temperature": temperature,
+            "response_format": response_format,
+            "sample": sample,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Persistenter Antwort-Cache auf SQLite-Basis mit Alters- und Größenbegrenzung
+class ResponseCache:
+    def __init__(
+        self,
+        path: str | Path = config.CACHE_PATH,
+        mode: str = "readwrite",
+        replay_only: bool = False,
+        max_age_days: float = config.CACHE_MAX_AGE_DAYS,
+        max_mb: float = config.CACHE_MAX_MB,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Ungültiger Cache-Modus '{mode}', erlaubt: {', '.join(CACHE_MODES)}")
+        if replay_only and mode in ("off", "write"):
+            # Replay ohne Lesen ergibt keinen Sinn -> nur lesen
+            mode = "read"
+        self.mode = mode
+        self.replay_only = replay_only
+        self.max_age_seconds = max_age_days * 86400 if max_age_days > 0 else None
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self.path = Path(path)
+        if mode != "off":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+            self.evict()
+
+    @property
+    def readable(self) -> bool:
+        return self.mode in ("read", "readwrite")
+
+    @property
+    def writable(self) -> bool:
+        return self.mode in ("write", "readwrite")
+
+    def get(self, key: str) -> str | None:
+        if not self.readable:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age_seconds is not None and now - row[1] > self.max_age_seconds:
+                # abgelaufener Eintrag zählt als Fehlschlag
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        logger.debug("Cache-Treffer für %.12s", key)
+        return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        if not self.writable or response is None:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self._writes_since_evict += 1
+            evict_now = self._writes_since_evict >= 100
+        if evict_now:
+            self.evict()
+
+    def evict(self) -> None:
+        # Entfernt zu alte Einträge und die am längsten nicht genutzten, bis das Größenlimit eingehalten wird
+        if self._conn is None:
+            return
+        with self._lock:
+            self._writes_since_evict = 0
+            if self.max_age_seconds is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            if self.max_bytes is not None:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    excess = total - self.max_bytes
+                    freed = 0
+                    stale = []
+                    for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC"):
+                        stale.append((key,))
+                        freed += size
+                        if freed >= excess:
+                            break
+                    self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+                    logger.info(f"Cache: {len(stale)} Einträge verdrängt ({freed} Bytes)")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
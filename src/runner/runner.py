@@ -3,11 +3,31 @@ import time
 import re
 from pathlib import Path
 from llm_schema_prompts.llm_output_format import LLMAnswer
-from utils.utils import now_stamp, write_json, load_cases, add_metadata_to_row, normalize_model_name
-from src.utils.logger import setup
-from src.runner.llm_runner import async_prompt_llm, ping_llm, parse_answer, build_user_prompt
+from utils.utils import now_stamp, add_metadata_to_row, add_request_meta_to_row, normalize_model_name
+from utils.case_loader import aiter_cases
+from utils.result_sink import ResultSink, results_path, export_json_files, export_parquet
+from src.utils.logger import setup, bind_cell, log_path
+from src.runner.llm_runner import async_prompt_llm, async_sample_llm, ping_llm, parse_answer, build_user_prompt
+from src.runner.client_pool import aclose_clients
+from src.runner.response_cache import ResponseCache
+from src.runner.structured_output import OUTPUT_MODES
+from src.runner.rate_limit import LimiterRegistry, on_slot
+from src.runner.journal import RunJournal, JOURNAL_DIR, new_run_id
+from src.runner.sharding import LeaseQueue, drain_queue, shard_of, shard_run_id, worker_owner
+from src.runner.sampling import SampleBatcher
+from src.runner.hedging import HedgeRegistry
+from src.runner.metrics import RunMetrics, shard_textfile
+from src.runner.scheduler import Dispatcher, WorkItem, build_work_queue, estimate_makespan, load_expected_durations
+from src import config
 from src.llm_schema_prompts.model_prompts import FIX_JSON_PROMPT
-from src.test_statistics import print_model_statistics, init_stats
+from src.test_statistics import print_model_statistics, init_stats, record_result, record_error
+
+def _cell_fields(item: WorkItem) -> dict:
+    # Kennfelder einer Zelle für die Ergebniszeile
+    return {
+        "cell": item.label, "case_id": item.case_id, "case_file": item.case.get("_file"),
+        "model": item.model, "prompt": item.prompt_idx + 1, "repeat": item.repeat,
+    }
 
 async def _run_async(
     ping: bool,
@@ -21,118 +41,323 @@ async def _run_async(
     repeat: int,
     prompt_configs: list[dict], 
     stream: bool = False,  
+    cache_mode: str = "off",
+    replay_only: bool = False,
+    resume: str | None = None,
+    only_failed: bool = False,
+    export_json: bool = True,
+    parquet: bool = False,
+    compact_schema: bool = False,
+    output_mode: str = "json_object",
+    shards: int = 1,
+    shard_index: int = 0,
+    lease_queue: str | None = None,
+    run_id: str | None = None,
+    sample_batching: bool = True,
+    compact_prompt: bool = False,
+    hedge: bool = False,
+    log_json: bool = False,
+    metrics_port: int | None = None,
+    metrics_file: str | None = None,
 ):
-    logger = setup(level=loglevel, write_file=logfile)
+    # Run-ID vorab, damit jeder Lauf (bzw. Shard) eine eigene Logdatei bekommt
+    base_run_id = resume or run_id or new_run_id()
+    own_run_id = shard_run_id(base_run_id, shard_index) if shards > 1 else base_run_id
+    logger = setup(level=loglevel, write_file=logfile, run_id=own_run_id, json_logs=log_json)
     logger.info("LLM Runner gestartet")
-    logger.info(f"Verwendete Modelle: {model_list}")
+    logger.info("Verwendete Modelle: %s", model_list)
+    if logfile:
+        logger.info("Logdatei: %s", log_path(own_run_id, log_json))
+    if not replay_only:
+        # ohne API-Key sofort abbrechen statt jede Zelle einzeln scheitern zu lassen
+        config.require_api_key()
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"Unbekannter Ausgabemodus '{output_mode}', erlaubt: {', '.join(OUTPUT_MODES)}")
 
     # Statistikdaten pro Modell
     stats = init_stats(model_list)
 
-    # Ping-Check: Wenn --ping gesetzt ist, führe nur einen kurzen Test-Request aus und beende das Programm
-    if ping is True:
-        logger.info("Führe LLM-Ping durch...")
-        ping_llm()
-        return
+    # Persistenter Antwort-Cache (im Replay-Modus ohne Netzwerkzugriff)
+    cache = ResponseCache(mode=cache_mode, replay_only=replay_only)
+    if cache.mode != "off":
+        logger.info(f"Antwort-Cache aktiv: Modus={cache.mode}, Replay={cache.replay_only}, Datei={cache.path}")
 
-    cases_dir = Path(cases)
-    out_dir = Path(out)
-    out_dir.mkdir(parents=True, exist_ok=True)
+    journal = None
+    sink = None
+    queue = None
+    metrics = None
+    metrics_task = None
+    try:
+        # Ping-Check: Wenn --ping gesetzt ist, führe nur einen kurzen Test-Request aus und beende das Programm
+        if ping is True:
+            logger.info("Führe LLM-Ping durch...")
+            ping_llm()
+            return
 
-    # Create output folders for each model
-    model_output_dirs = {}
-    for model in model_list:
-        model_name = normalize_model_name(model)
-        model_folder = out_dir / model_name
-        model_folder.mkdir(parents=True, exist_ok=True)
-        model_output_dirs[model] = model_folder
+        cases_dir = Path(cases)
+        out_dir = Path(out)
+        out_dir.mkdir(parents=True, exist_ok=True)
 
-    logger.info("Starte Verarbeitung der Testfälle...")
+        # Create output folders for each model
+        for model in model_list:
+            (out_dir / normalize_model_name(model)).mkdir(parents=True, exist_ok=True)
 
-    # Fälle laden und nacheinander verarbeiten
-    cases_list = []
-    try:
-        cases_list = load_cases(cases_dir)
-        logger.info(f"{len(cases_list)} Fälle aus {cases_dir} geladen.")
-    except Exception as e:
-        logger.error(f"Fehler beim Laden der Testfälle: {e}")
-        raise
+        logger.info("Starte Verarbeitung der Testfälle...")
+
+        # Ein Limiter pro Modell statt einer globalen Semaphore
+        limiters = LimiterRegistry(concurrency)
+
+        # Live-Metriken (Prometheus-Textformat), bei mehreren Shards ein Port bzw. eine Datei pro Shard
+        if metrics_port is not None or metrics_file:
+            metrics = RunMetrics(own_run_id, limiters)
+            if metrics_port is not None:
+                port = metrics.serve(metrics_port + shard_index if shards > 1 and metrics_port else metrics_port)
+                logger.info("Metriken unter http://%s:%s/metrics", config.METRICS_HOST, port)
+            if metrics_file:
+                metrics_file = shard_textfile(metrics_file, shards, shard_index)
+                metrics_task = asyncio.create_task(metrics.dump_periodically(metrics_file))
+                logger.info("Metriken alle %ss nach %s", config.METRICS_INTERVAL, metrics_file)
 
-    # Limit, wenn nicht alle Fälle getestet werden sollen
-    if limit is not None and limit > 0:
-        logger.info(f"Limit gesetzt: {limit}. Es werden nur die ersten {limit} Fälle verarbeitet.")
-        cases_list = cases_list[:limit]
+        # Hedging gegen Nachzügler, Startwerte der Latenz-Perzentilen aus früheren Statistiken
+        hedges = HedgeRegistry(model_list, [out_dir / "model_statistics.json", Path(config.HISTORY_STATS_PATH)]) if hedge else None
 
-    logger.info(f"Starte {len(cases_list)*len(model_list)*repeat} Fälle")
+        def hedger(model: str):
+            return hedges.get(model) if hedges is not None else None
 
-    sem = asyncio.Semaphore(concurrency)
+        # Zellen mit gleichem Prompt (Wiederholungen, inhaltsgleiche Prompt-Configs) pro Fall und Modell bündeln
+        batcher = SampleBatcher() if sample_batching else None
+        prompt_group = {}
+        for idx, pc in enumerate(prompt_configs):
+            prompt_group[idx] = next(j for j, other in enumerate(prompt_configs)
+                                     if (other["system_prompt"], other["user_prompt_builder"]) == (pc["system_prompt"], pc["user_prompt_builder"]))
+        group_sizes: dict[tuple, int] = {}
 
-    # Loop over prompt configs
-    for prompt_idx, prompt_config in enumerate(prompt_configs):
-        logger.info(f"Running with prompt config {prompt_idx+1}/{len(prompt_configs)}")
-        system_prompt = prompt_config["system_prompt"]
-        user_prompt = prompt_config["user_prompt_builder"]
+        def sample_key(item: WorkItem) -> tuple:
+            return (item.case.get("_file"), item.case_id, item.model, prompt_group[item.prompt_idx])
 
-        # Asynchrone Funktion zur Verarbeitung eines einzelnen Falls
-        async def process_case(case, model, out_dir, logger, repeatcount):
+        async def send_samples(model: str, system_prompt: str, user_prompt: str, samples: list) -> list[tuple[str, dict]]:
+            # mit Cache hat jede Zelle ihren eigenen Eintrag, nur fehlende Antworten werden (gebündelt) angefragt
+            return await async_sample_llm(model, system_prompt, user_prompt, len(samples), stream=stream, limiter=limiters.get(model), output_mode=output_mode, hedger=hedger(model),
+                                          cache=cache, samples=samples)
+
+        # Asynchrone Funktion zur Verarbeitung einer Zelle der Experiment-Matrix
+        async def process_case(item: WorkItem):
+            case, model, repeatcount, prompt_idx = item.case, item.model, item.repeat, item.prompt_idx
+            system_prompt = prompt_configs[prompt_idx]["system_prompt"]
+            user_prompt = prompt_configs[prompt_idx]["user_prompt_builder"]
             t0 = time.perf_counter()
-            logger.info(f"Starte Fall {case.get('id', 'unbekannt')} mit Modell: {model}")
-            async with sem:
+            # Logzeilen dieser Zelle (auch aus llm_runner) tragen Fall, Modell, Prompt und Wiederholung
+            bind_cell(_cell_fields(item))
+            case_id = case.get('id', 'unbekannt')
+            logger.info("Starte Fall %s mit Modell: %s", case_id, model)
+            started = False
+
+            def cell_started():
+                # Zelle gilt als laufend, sobald ihr (erster) Request einen Limiter-Slot hat; Cache-Treffer beim Abschluss
+                nonlocal started
+                if metrics is not None and not started:
+                    started = True
+                    metrics.start(model, prompt_idx + 1)
+
+            on_slot.set((cell_started,))
+            try:
+                # Build prompt, call LLM, parse and validate response
+                prompt_meta = {}
+                built_user_prompt = build_user_prompt(case, user_prompt, compact_schema=compact_schema, compact_prompt=compact_prompt, model=model, meta=prompt_meta)  # use builder from config
+                # Messwerte pro Request (Wartezeit, Netzwerk, TTFT, Parsen, Reparatur, Tokens)
+                if batcher is not None:
+                    key = sample_key(item)
+                    batch_meta = {}
+                    raw, request_meta = await batcher.submit(key, group_sizes.get(key, 1), lambda samples: send_samples(model, system_prompt, built_user_prompt, samples), item.sample, batch_meta)
+                    request_meta = {**request_meta, **batch_meta}
+                else:
+                    request_meta = {}
+                    raw = await async_prompt_llm(model, system_prompt, built_user_prompt, stream=stream, cache=cache, limiter=limiters.get(model), meta=request_meta, output_mode=output_mode, hedger=hedger(model), sample=item.sample)
+                request_meta.update(prompt_meta)
+                logger.debug("Rohantwort vom LLM erhalten für Fall %s.", case_id)
+                t_parse = time.perf_counter()
+                repaired = False
                 try:
-                    # Build prompt, call LLM, parse and validate response
-                    logger.debug(f"Verarbeite Fall: {case.get('id', 'unbekannt')} mit Modell: {model}")
-                    built_user_prompt = build_user_prompt(case, user_prompt)  # use builder from config
-                    logger.debug(f"User-Prompt erstellt für Fall {case.get('id', 'unbekannt')}.")
-                    raw = await async_prompt_llm(model, system_prompt, built_user_prompt, stream=stream)
-                    logger.debug(f"Rohantwort vom LLM erhalten für Fall {case.get('id', 'unbekannt')}.")
-                    try:
-                        parsed = parse_answer(raw)
-                        logger.debug(f"Antwort geparst und validiert für Fall {case.get('id', 'unbekannt')}.")
-                        # Ergebnis + Quelldatei speichern
-                        duration = round(time.perf_counter() - t0, 3)
-                        row = parsed.model_dump()
-                        row = add_metadata_to_row(row, case, model, duration, raw)
-                    except Exception as e:
-                        # Versuche, die Antwort mit einem Korrektur-Prompt zu reparieren
-                        fix_prompt = FIX_JSON_PROMPT.format(raw_response=raw, schema_json=LLMAnswer.json_schema_str())
-                        logger.info(f"Versuche, die Antwort mit einem Korrektur-Prompt zu reparieren für Fall {case.get('id', 'unbekannt')}.")
-                        # Korrektur-Prompt an LLM senden
-                        raw_fixed = await async_prompt_llm(model, system_prompt, fix_prompt, stream=stream)
-                        parsed = parse_answer(raw_fixed)
-                        logger.debug(f"Reparierte Antwort geparst und validiert für Fall {case.get('id', 'unbekannt')}.")
-                        duration = round(time.perf_counter() - t0, 3)
-                        # Ergebnis + Quelldatei speichern
-                        row = parsed.model_dump()
-                        row["_correction_attempted"] = True
-                        row = add_metadata_to_row(row, case, model, duration, raw)
-                    # Statistikdaten sammeln
-                    stats[model]["char_counts"].append(row["_response_char_count"])
-                    stats[model]["durations"].append(row["_duration_seconds"])
-
-                    # Output-Dateinamen mit Case-Name und Modell generieren
-                    case_name: str = Path(case["_file"]).stem
-                    model_name: str = normalize_model_name(model)
-                    model_folder = model_output_dirs[model]
-                    out_file = model_folder / f"RESULTS_{model_name.upper()}_{case_name.upper()}_REPEAT{str(repeatcount)}_PROMPT{prompt_idx+1}_{now_stamp()}.json"
-                    write_json(out_file, row)
-                    logger.info(f"[OK] {case['id']} -> gespeichert in {out_file} "
-                                f"({row['_duration_seconds']}s, {row['_response_char_count']} Zeichen)")
+                    parsed = parse_answer(raw, meta=request_meta)
+                    request_meta["parse_seconds"] = round(time.perf_counter() - t_parse, 3)
                 except Exception as e:
-                    # Fehler speichern (z.B. Fehler der YAML-Datei, JSON-Parsing-Fehler, Validierungsfehler)
-                    duration = round(time.perf_counter() - t0, 3)
-                    logger.error(f"Fehler bei Fall {case.get('id')}: {e} (nach {duration}s)")
-                    # Use model-specific output folder for errors as well
-                    model_folder = model_output_dirs.get(model, out_dir)
-                    out_file = model_folder / f"error_results_{case.get('id', 'unknown')}_{model}_PROMPT{prompt_idx+1}_{now_stamp()}.json"
-                    write_json(out_file, {"case_id": case.get("id"), "error": str(e)})
-
-        # Run all cases for all models and repeat as many times as specified
-        tasks = [
-            process_case(case, model, out_dir, logger, repeatcount)
-            for model in model_list
-            for case in cases_list
-            for repeatcount in range(repeat)
-        ]
-        await asyncio.gather(*tasks)
-
-    print_model_statistics(model_list, stats, out_dir)
\ No newline at end of file
+                    request_meta["parse_seconds"] = round(time.perf_counter() - t_parse, 3)
+                    # Versuche, die Antwort mit einem Korrektur-Prompt zu reparieren
+                    t_repair = time.perf_counter()
+                    fix_prompt = FIX_JSON_PROMPT.format(raw_response=raw, schema_json=LLMAnswer.json_schema_str(compact=compact_schema))
+                    logger.info("Versuche, die Antwort mit einem Korrektur-Prompt zu reparieren für Fall %s.", case_id)
+                    # Korrektur-Prompt an LLM senden
+                    repair_meta = {}
+                    raw_fixed = await async_prompt_llm(model, system_prompt, fix_prompt, stream=stream, cache=cache, limiter=limiters.get(model), meta=repair_meta, output_mode=output_mode, sample=item.sample)
+                    parsed = parse_answer(raw_fixed)
+                    logger.debug("Reparierte Antwort geparst und validiert für Fall %s.", case_id)
+                    repaired = True
+                    request_meta["repair_seconds"] = round(time.perf_counter() - t_repair, 3)
+                    for key in ("queue_wait_seconds", "backoff_seconds", "network_seconds", "prompt_tokens", "completion_tokens", "cached_tokens"):
+                        if key in repair_meta:
+                            request_meta[f"repair_{key}"] = repair_meta[key]
+                # Modell-Latenz ohne Wartezeit in den Limitern, im Bündelungsfenster und Backoff, Gesamtzeit separat
+                wall = time.perf_counter() - t0
+                waited = sum(request_meta.get(k, 0) for k in ("queue_wait_seconds", "batch_wait_seconds", "backoff_seconds", "repair_queue_wait_seconds", "repair_backoff_seconds"))
+                duration = round(wall - waited, 3)
+                # Ergebnis + Quelldatei speichern
+                row = parsed.model_dump()
+                if repaired:
+                    row["_correction_attempted"] = True
+                row = add_metadata_to_row(row, case, model, duration, raw)
+                row["_wall_seconds"] = round(wall, 3)
+                row = add_request_meta_to_row(row, request_meta)
+                # Statistikdaten sammeln
+                record_result(stats, model, prompt_idx + 1, row)
+
+                # Exportname mit Case-Name und Modell generieren, Zeile an den Result-Sink übergeben
+                case_name: str = Path(case["_file"]).stem
+                model_name: str = normalize_model_name(model)
+                export_name = f"{model_name}/RESULTS_{model_name.upper()}_{case_name.upper()}_REPEAT{str(repeatcount)}_PROMPT{prompt_idx+1}_{now_stamp(seconds=True)}.json"
+                row_id = sink.put(
+                    {**_cell_fields(item), "status": "ok", "export_name": export_name, "data": row},
+                    on_durable=lambda: mark_done(item.label, "ok", export_name),
+                )
+                logger.info("[OK] %s -> Zeile %s (%ss, %s Zeichen)", case_id, row_id, row['_duration_seconds'], row['_response_char_count'])
+                if metrics is not None:
+                    cell_started()
+                    metrics.finish(model, prompt_idx + 1, duration, row["_response_char_count"], row.get("_completion_tokens") or 0, repaired)
+            except Exception as e:
+                # Fehler speichern (z.B. Fehler der YAML-Datei, JSON-Parsing-Fehler, Validierungsfehler)
+                duration = round(time.perf_counter() - t0, 3)
+                logger.error("Fehler bei Fall %s: %s (nach %ss)", case_id, e, duration)
+                record_error(stats, model, prompt_idx + 1)
+                if metrics is not None:
+                    cell_started()
+                    metrics.error(model, prompt_idx + 1)
+                # Use model-specific output folder for errors as well
+                export_name = f"{normalize_model_name(model)}/error_results_{case.get('id', 'unknown')}_{model}_PROMPT{prompt_idx+1}_REPEAT{repeatcount}_{now_stamp(seconds=True)}.json"
+                error = str(e)
+                sink.put(
+                    {**_cell_fields(item), "status": "error", "export_name": export_name, "data": {"case_id": case.get("id"), "error": error}},
+                    on_durable=lambda: mark_done(item.label, "error", export_name, error),
+                )
+
+        # Erwartete Dauer pro Modell für die Reihenfolge der Zellen (längste zuerst)
+        expected = load_expected_durations(model_list, [out_dir / "model_statistics.json", Path(config.HISTORY_STATS_PATH)])
+
+        # Journal des Laufs: bei --resume nur fehlende bzw. fehlgeschlagene Zellen einplanen
+        # (bei mehreren Shards hat jeder Shard ein eigenes Journal und eine eigene Ergebnisdatei)
+        if resume is not None and not RunJournal.exists(out_dir, own_run_id) and lease_queue is None:
+            raise FileNotFoundError(f"Kein Journal für Run-ID {own_run_id} in {out_dir / JOURNAL_DIR} gefunden")
+        journal = RunJournal(out_dir, own_run_id)
+        sink = ResultSink(results_path(out_dir, own_run_id), own_run_id).start()
+        journal.start({
+            "models": model_list, "input": str(cases_dir), "repeat": repeat,
+            "prompts": len(prompt_configs), "resumed": resume is not None, "limit": limit,
+            "shards": shards, "shard_index": shard_index,
+        })
+        logger.info(f"Run-ID: {own_run_id} (fortsetzen mit --resume {base_run_id})")
+        if limit is not None and limit > 0:
+            logger.info(f"Limit gesetzt: {limit}. Es werden nur die ersten {limit} Fälle geladen und verarbeitet.")
+
+        queue = LeaseQueue(lease_queue, worker_owner(shard_index), config.LEASE_SECONDS, only_retry=resume is not None and only_failed) if lease_queue else None
+
+        def mark_done(label: str, status: str, file: str, error: str | None = None) -> None:
+            # erst wenn die Ergebniszeile dauerhaft geschrieben ist: Journal und ggf. Lease abschließen
+            journal.record(label, status, file=file, error=error)
+            if queue is not None:
+                queue.complete(label, status)
+
+        def wanted(item: WorkItem) -> bool:
+            # statische Aufteilung ohne Queue: jede Zelle gehört genau einem Shard
+            if queue is None and shards > 1 and shard_of(item.label, shards) != shard_index:
+                return False
+            if resume is not None and queue is None:
+                if only_failed:
+                    return journal.status(item.label) == "error"
+                return journal.status(item.label) != "ok"
+            return True
+
+        # Fälle werden im Hintergrund geladen (libyaml, Prozess-Pool, Cache-Index); die Zellen eines Falls
+        # (Prompt x Modell x Wiederholung) werden eingeplant, sobald er geladen ist, statt auf den gesamten Korpus zu warten.
+        # Der Dispatcher startet sie pro Modell längste zuerst über alle geladenen Fälle (2 Gruppen pro Limiter-Slot).
+        # Mit Lease-Queue wird zuerst die gesamte Matrix eingestellt, die Zellen holen sich die Worker dann dynamisch.
+        t_run = time.perf_counter()
+        work_items: list[WorkItem] = []
+        dispatcher = Dispatcher(process_case, {m: 2 * limiters.get(m).concurrency.ceiling for m in model_list},
+                                sample_key if batcher is not None else (lambda item: item.label))
+        loaded = 0
+        skipped = 0
+        try:
+            async for case in aiter_cases(cases_dir, limit=limit, cache_dir=config.CASE_CACHE_DIR, workers=config.CASE_LOADER_WORKERS):
+                loaded += 1
+                items = build_work_queue(len(prompt_configs), model_list, [case], repeat, expected)
+                total = len(items)
+                items = [item for item in items if wanted(item)]
+                skipped += total - len(items)
+                for item in items:
+                    key = sample_key(item)
+                    group_sizes[key] = group_sizes.get(key, 0) + 1
+                work_items.extend(items)
+                if queue is None:
+                    if metrics is not None:
+                        for item in items:
+                            metrics.scheduled(item.model, item.prompt_idx + 1)
+                    dispatcher.add(items)
+        except Exception as e:
+            logger.error(f"Fehler beim Laden der Testfälle: {e}")
+            await dispatcher.cancel()
+            raise
+        logger.info(f"{loaded} Fälle aus {cases_dir} geladen ({time.perf_counter() - t_run:.2f}s), {len(work_items)} Zellen eingeplant")
+        if skipped:
+            logger.info(f"Run {own_run_id}: {skipped} von {skipped + len(work_items)} Zellen übersprungen (Resume bzw. anderer Shard)")
+
+        makespan = estimate_makespan(work_items, {m: limiters.get(m).concurrency.ceiling for m in model_list})
+        logger.info(f"Geschätzte Makespan: {makespan['global_queue_seconds']}s (globale Queue) vs. "
+                    f"{makespan['per_prompt_barriers_seconds']}s (Barriere pro Prompt-Config)")
+
+        if queue is not None:
+            work_items.sort()
+            await asyncio.to_thread(queue.add, [item.label for item in work_items])
+            if resume is not None:
+                # wie ohne Queue: --resume führt fehlgeschlagene Zellen erneut aus, mit --only-failed nur diese
+                await asyncio.to_thread(queue.retry_failed, [item.label for item in work_items])
+            in_flight = 2 * sum(limiters.get(m).concurrency.ceiling for m in model_list)
+            done = await drain_queue(queue, {item.label: item for item in work_items}, process_case, in_flight)
+            logger.info(f"Shard {shard_index}: {done} Zellen aus der Queue bearbeitet")
+        else:
+            await dispatcher.join()
+        logger.info(f"Tatsächliche Makespan: {time.perf_counter() - t_run:.1f}s "
+                    f"(geschätzt {makespan['global_queue_seconds']}s)")
+
+        # Ergebnisse vollständig auf die Platte bringen, danach optionale Exporte
+        sink.close()
+        if export_json:
+            export_json_files(sink.path, out_dir)
+        if parquet:
+            export_parquet(sink.path)
+
+        # Shards schreiben eigene Statistiken, die der Koordinator zusammenführt
+        print_model_statistics(model_list, stats, out_dir, "model_statistics.json" if shards <= 1 else f"model_statistics.s{shard_index}.json",
+                               extra={"hedging": hedges.summary()} if hedges is not None else None)
+        logger.info(f"Limiter pro Modell: {limiters.summary()}")
+        if batcher is not None and batcher.answers:
+            logger.info(f"Gebündelte Prompts: {batcher.answers} Zellen in {batcher.requests} Gruppen")
+        if cache.mode != "off":
+            logger.info(f"Antwort-Cache: {cache.hits} Treffer, {cache.misses} Fehlschläge")
+    finally:
+        if metrics_task is not None:
+            metrics_task.cancel()
+            await asyncio.gather(metrics_task, return_exceptions=True)
+            # Endstand des Laufs für den Collector
+            try:
+                metrics.write_textfile(metrics_file)
+            except OSError as e:
+                logger.warning("Konnte Metriken nicht nach %s schreiben: %s", metrics_file, e)
+        if metrics is not None:
+            metrics.close()
+        if sink is not None:
+            sink.close()
+        cache.close()
+        if journal is not None:
+            journal.close()
+        if queue is not None:
+            queue.close()
+        # Gepoolte HTTP-Clients sauber schließen, solange der Event-Loop noch läuft
+        await aclose_clients()
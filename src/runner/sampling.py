@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+
+from src import config
+from src.runner.rate_limit import on_slot
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Wiederholungen (--repeat) und inhaltsgleiche Prompt-Configs schicken denselben Prompt mehrfach. Statt k
+# unabhängiger Requests werden sie pro Modell gebündelt: ein Request mit n=k Choices (Prompt wird nur einmal
+# verarbeitet und abgerechnet), Rest bzw. Provider ohne n als parallele Einzel-Requests. Mit aktivem Antwort-Cache
+# hat jede Zelle ihren eigenen Eintrag (Prompt-Config und Wiederholung), angefragt werden nur die fehlenden Choices.
+
+# Messwerte, die bei n Choices für den gesamten Request gelten und auf die Choices aufgeteilt werden.
+# Zeiten (network_seconds, queue_wait_seconds, backoff_seconds) bleiben pro Choice vollständig, weil jede Zelle so lange
+# gewartet hat; Summen über Zellen (Tokens/s, ideale Makespan) zählen sie über sample_batch nur einmal pro Request.
+_SPLIT_KEYS = ("prompt_tokens", "completion_tokens", "cached_tokens")
+
+def request_share(row: dict, key: str) -> float:
+    # Anteil einer Zelle an einer gemeinsamen Request-Zeit (Metadatenfeld der Ergebniszeile, z.B. "_network_seconds")
+    return (row.get(key) or 0) / max(1, row.get("_sample_batch") or 1)
+
+def is_choices_rejection(exc: BaseException) -> bool:
+    # 400/422 des Providers, der den Parameter n (mehrere Choices) nicht unterstützt
+    if getattr(exc, "status_code", None) not in (400, 422):
+        return False
+    message = str(exc).lower()
+    return any(word in message for word in ("'n'", '"n"', "choices", "param: n", "parameter n"))
+
+def split_meta(meta: dict, k: int) -> list[dict]:
+    # Kopie der Messwerte pro Choice; Tokens werden aufgeteilt, damit Summen dem abgerechneten Verbrauch entsprechen
+    parts = []
+    for i in range(k):
+        part = dict(meta)
+        for key in _SPLIT_KEYS:
+            value = meta.get(key)
+            if isinstance(value, int):
+                part[key] = value // k + (1 if i < value % k else 0)
+        part["sample_batch"] = k
+        part["sample_index"] = i
+        parts.append(part)
+    return parts
+
+# Merkt sich pro Modell, wie viele Choices ein Request liefern darf (nur für die Laufzeit des Prozesses)
+class ChoiceSupport:
+    def __init__(self, max_choices: int):
+        self.max_choices = max(1, max_choices)
+        self._limits: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def limit(self, model: str) -> int:
+        return self._limits.get(model, self.max_choices)
+
+    def reduce(self, model: str, limit: int, reason) -> int:
+        limit = max(1, limit)
+        with self._lock:
+            if limit < self.limit(model):
+                self._limits[model] = limit
+                logger.warning("%s: höchstens %d Choice(s) pro Request, Rest als Einzel-Requests: %s", model, limit, reason)
+            return self._limits.get(model, self.max_choices)
+
+_choices: ChoiceSupport | None = None
+
+def choice_support() -> ChoiceSupport:
+    global _choices
+    if _choices is None:
+        _choices = ChoiceSupport(config.MAX_CHOICES_PER_REQUEST)
+    return _choices
+
+class _Group:
+    def __init__(self, expected: int):
+        self.expected = expected
+        self.waiters: list[asyncio.Future] = []
+        self.samples: list = []
+        # (Zeitpunkt von submit, meta) pro Aufrufer für die Wartezeit bis zum Abschicken der Gruppe
+        self.arrivals: list[tuple[float, dict | None]] = []
+        # Slot-Rückrufe aller Aufrufer: der gemeinsame Request läuft für jeden von ihnen
+        self.on_slot: list = []
+        self.full = asyncio.Event()
+
+# Sammelt gleichzeitige Aufrufe mit gleichem Schlüssel und bedient sie mit einem gemeinsamen Aufruf von send(k).
+# Die Gruppe wird abgeschickt, sobald expected Aufrufe da sind oder spätestens nach window Sekunden.
+class SampleBatcher:
+    def __init__(self, window: float = config.SAMPLE_BATCH_WINDOW):
+        self.window = window
+        self._open: dict = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.requests = 0
+        self.answers = 0
+
+    async def submit(self, key, expected: int, send, sample=None, meta: dict | None = None):
+        # send(samples) liefert eine Liste mit einem Ergebnis pro Aufrufer; sample kennzeichnet den Aufrufer (z.B. im Cache)
+        # meta (optional) erhält batch_wait_seconds: Wartezeit im Bündelungsfenster, bis der gemeinsame Request startet
+        group = self._open.get(key)
+        if group is None:
+            group = _Group(max(1, expected))
+            self._open[key] = group
+            task = asyncio.create_task(self._flush(key, group, send))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        future = asyncio.get_running_loop().create_future()
+        group.waiters.append(future)
+        group.samples.append(sample)
+        group.arrivals.append((time.perf_counter(), meta))
+        group.on_slot.extend(on_slot.get())
+        if len(group.waiters) >= group.expected:
+            group.full.set()
+        return await future
+
+    async def _flush(self, key, group: _Group, send) -> None:
+        try:
+            await asyncio.wait_for(group.full.wait(), self.window)
+        except asyncio.TimeoutError:
+            pass
+        # ab hier kommen neue Aufrufer in eine neue Gruppe
+        if self._open.get(key) is group:
+            del self._open[key]
+        waiters = group.waiters
+        t_send = time.perf_counter()
+        for t_submit, meta in group.arrivals:
+            if meta is not None:
+                meta["batch_wait_seconds"] = round(t_send - t_submit, 3)
+        on_slot.set(tuple(group.on_slot))
+        self.requests += 1
+        self.answers += len(waiters)
+        try:
+            results = await send(list(group.samples))
+        except BaseException as e:
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        for future, result in zip(waiters, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Eine Zelle der Experiment-Matrix (Prompt x Modell x Fall x Wiederholung)
+@dataclass(order=True)
+class WorkItem:
+    sort_key: tuple = field(init=False, repr=False)
+    prompt_idx: int = field(compare=False)
+    model: str = field(compare=False)
+    case: dict = field(compare=False, repr=False)
+    repeat: int = field(compare=False)
+    expected_seconds: float = field(compare=False, default=0.0)
+
+    def __post_init__(self):
+        # längste erwartete Dauer zuerst, bei Gleichstand größere Fälle zuerst; Zellen eines Falls stehen zusammen
+        # (der SampleBatcher bündelt sie zu einem Request)
+        self.sort_key = (-self.expected_seconds, -len(self.case.get("sql_script", "")), str(self.case.get("_file") or self.case_id),
+                         self.prompt_idx, self.repeat)
+
+    @property
+    def case_id(self) -> str:
+        return str(self.case.get("id", "unknown"))
+
+    @property
+    def label(self) -> str:
+        # eindeutiger Schlüssel der Zelle (u.a. für das Journal)
+        return f"{self.case_id}/{self.model}/PROMPT{self.prompt_idx+1}/REPEAT{self.repeat}"
+
+    @property
+    def sample(self) -> str:
+        # Kennung der Antwort im Antwort-Cache: jede Prompt-Config und Wiederholung hat ihre eigene Antwort
+        return f"PROMPT{self.prompt_idx+1}/REPEAT{self.repeat}"
+
+def load_expected_durations(model_list: list[str], paths: list[Path]) -> dict[str, float]:
+    # Durchschnittliche Dauer pro Modell aus der ersten vorhandenen model_statistics.json
+    history = {}
+    for path in paths:
+        if path is not None and Path(path).is_file():
+            try:
+                with Path(path).open("r", encoding="utf-8") as f:
+                    history = json.load(f)
+                logger.debug(f"Historische Dauern aus {path} geladen")
+                break
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Konnte {path} nicht lesen: {e}")
+    known = {m: float(v["average_duration_seconds"]) for m, v in history.items()
+             if isinstance(v, dict) and v.get("average_duration_seconds")}
+    fallback = sum(known.values()) / len(known) if known else config.DEFAULT_EXPECTED_SECONDS
+    return {model: known.get(model, fallback) for model in model_list}
+
+def build_work_queue(
+    prompt_count: int,
+    model_list: list[str],
+    cases_list: list[dict],
+    repeat: int,
+    expected: dict[str, float],
+) -> list[WorkItem]:
+    # Alle Zellen in eine Queue, sortiert nach erwarteter Dauer (Longest-Processing-Time-First)
+    items = [
+        WorkItem(prompt_idx=prompt_idx, model=model, case=case, repeat=repeatcount, expected_seconds=expected.get(model, 0.0))
+        for prompt_idx in range(prompt_count)
+        for model in model_list
+        for case in cases_list
+        for repeatcount in range(repeat)
+    ]
+    items.sort()
+    return items
+
+# Startet Zellen pro Modell in LPT-Reihenfolge über alle bisher geladenen Fälle: Fälle werden gestreamt geladen, die
+# Zellen warten hier statt im Limiter, damit die längsten zuerst starten. Pro Modell laufen höchstens slots Gruppen
+# gleichzeitig; eine Gruppe sind aufeinanderfolgende Zellen mit gleichem group_key (ein gebündelter Request).
+class Dispatcher:
+    def __init__(self, process, slots: dict[str, int], group_key):
+        self._process = process
+        self._slots = slots
+        self._group_key = group_key
+        self._ready: dict[str, list[WorkItem]] = {}
+        self._running: dict[str, int] = {}
+        self.tasks: list[asyncio.Task] = []
+
+    def add(self, items: list[WorkItem]) -> None:
+        for item in items:
+            heapq.heappush(self._ready.setdefault(item.model, []), item)
+        for model in {item.model for item in items}:
+            self._dispatch(model)
+
+    def _dispatch(self, model: str) -> None:
+        ready = self._ready.get(model, [])
+        while ready and self._running.get(model, 0) < self._slots.get(model, 1):
+            group = [heapq.heappop(ready)]
+            key = self._group_key(group[0])
+            while ready and self._group_key(ready[0]) == key:
+                group.append(heapq.heappop(ready))
+            self._running[model] = self._running.get(model, 0) + 1
+            remaining = [len(group)]
+
+            def done(_task, model=model, remaining=remaining):
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self._running[model] -= 1
+                    self._dispatch(model)
+
+            for item in group:
+                task = asyncio.create_task(self._process(item))
+                task.add_done_callback(done)
+                self.tasks.append(task)
+
+    async def join(self) -> None:
+        # wartet auch auf Zellen, die während des Wartens nachrücken
+        while self.tasks:
+            tasks, self.tasks = self.tasks, []
+            await asyncio.gather(*tasks)
+
+    async def cancel(self) -> None:
+        self._ready.clear()
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _list_schedule(durations: list[float], slots: int) -> float:
+    # Makespan bei Listen-Scheduling der Dauern in gegebener Reihenfolge auf `slots` parallele Plätze
+    if not durations:
+        return 0.0
+    free_at = [0.0] * max(1, slots)
+    for d in durations:
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + d)
+    return max(free_at)
+
+def estimate_makespan(items: list[WorkItem], slots: dict[str, int]) -> dict[str, float]:
+    # Vergleich: bisheriges Layout (gather-Barriere pro Prompt-Config) vs. globale LPT-Queue
+    # Modelle laufen unabhängig voneinander, die langsamste Modell-Queue bestimmt die Makespan
+    per_prompt: dict[int, dict[str, list[float]]] = {}
+    per_model: dict[str, list[float]] = {}
+    for item in items:
+        per_prompt.setdefault(item.prompt_idx, {}).setdefault(item.model, []).append(item.expected_seconds)
+        per_model.setdefault(item.model, []).append(item.expected_seconds)
+    barrier = sum(
+        max(_list_schedule(d, slots.get(m, 1)) for m, d in models.items())
+        for models in per_prompt.values()
+    )
+    global_queue = max((_list_schedule(d, slots.get(m, 1)) for m, d in per_model.items()), default=0.0)
+    return {"per_prompt_barriers_seconds": round(barrier, 1), "global_queue_seconds": round(global_queue, 1)}
@@ -0,0 +1,233 @@
+import asyncio
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from src import config
+from utils.logger import logging
+from utils.result_sink import RESULTS_SUFFIX, iter_results
+from src.runner.journal import JOURNAL_DIR, new_run_id
+from src.test_statistics import init_stats, record_result, record_error, print_model_statistics
+
+logger = logging.getLogger(__name__)
+
+# Verteilte Ausführung der Experiment-Matrix: statisch per Hash (--shards/--shard-index) oder dynamisch
+# über eine Lease-Queue in einer SQLite-Datei, die sich mehrere Prozesse (oder Rechner über ein
+# gemeinsames Dateisystem) teilen. Abgestürzte Worker verlieren ihre Leases nach LEASE_SECONDS; nach max_attempts
+# abgelaufenen Leases gilt eine Zelle als Fehler, statt endlos neu vergeben zu werden.
+
+QUEUE_SUFFIX = ".queue.sqlite"
+
+def shard_run_id(base_run_id: str, shard_index: int) -> str:
+    return f"{base_run_id}-s{shard_index}"
+
+def shard_of(label: str, shards: int) -> int:
+    # stabile Zuordnung einer Zelle zu einem Shard (unabhängig von PYTHONHASHSEED)
+    return zlib.crc32(label.encode("utf-8")) % shards
+
+def queue_path(out_dir: Path, base_run_id: str) -> Path:
+    return Path(out_dir) / JOURNAL_DIR / f"{base_run_id}{QUEUE_SUFFIX}"
+
+class LeaseQueue:
+    def __init__(self, path: str | os.PathLike, owner: str, lease_seconds: float, max_attempts: int = config.LEASE_MAX_ATTEMPTS, only_retry: bool = False):
+        self.path = Path(path)
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        # --resume --only-failed: nur Zellen leasen, die wegen eines Fehlers wieder freigegeben wurden
+        self.only_retry = only_retry
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Zugriff aus dem Event-Loop und aus dem Thread des Result-Sinks
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cells (
+                label TEXT PRIMARY KEY,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                retry INTEGER NOT NULL DEFAULT 0
+            )""")
+        # Queues älterer Läufe ohne max_attempts/retry ergänzen (parallel startende Worker: Spalte existiert evtl. schon)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cells)")}
+        for column, ddl in (("max_attempts", f"INTEGER NOT NULL DEFAULT {self.max_attempts}"), ("retry", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                try:
+                    self._conn.execute(f"ALTER TABLE cells ADD COLUMN {column} {ddl}")
+                except sqlite3.OperationalError:
+                    pass
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cells_claim ON cells(state, priority)")
+
+    def add(self, labels: list[str]) -> None:
+        # Zellen einstellen (idempotent: jeder Worker stellt dieselbe Matrix ein, erledigte bleiben erledigt)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO cells (label, priority, max_attempts) VALUES (?, ?, ?)",
+                ((label, i, self.max_attempts) for i, label in enumerate(labels)),
+            )
+            self._conn.execute("COMMIT")
+
+    def retry_failed(self, labels: list[str]) -> None:
+        # fehlgeschlagene Zellen wieder freigeben (--resume, mit --only-failed werden nur diese geleast);
+        # jede Freigabe erlaubt max_attempts weitere Leases
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany(
+                "UPDATE cells SET state = 'pending', owner = NULL, lease_until = NULL, retry = 1, max_attempts = attempts + ? "
+                "WHERE label = ? AND state = 'error'",
+                ((self.max_attempts, l) for l in labels),
+            )
+            self._conn.execute("COMMIT")
+
+    def _open_filter(self) -> str:
+        return " AND retry = 1" if self.only_retry else ""
+
+    def claim(self, limit: int) -> list[str]:
+        # freie oder abgelaufene Leases übernehmen (längste Zellen zuerst)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # abgelaufene Leases ohne verbleibende Versuche: Worker ist wiederholt an der Zelle gescheitert
+                exhausted = self._conn.execute(
+                    "UPDATE cells SET state = 'error', owner = NULL, lease_until = NULL "
+                    "WHERE state = 'leased' AND lease_until < ? AND attempts >= max_attempts",
+                    (now,),
+                ).rowcount
+                if exhausted:
+                    logger.warning("%d Zelle(n) nach max. Anzahl Leases als Fehler markiert", exhausted)
+                rows = self._conn.execute(
+                    f"SELECT label FROM cells WHERE (state = 'pending' OR (state = 'leased' AND lease_until < ?)){self._open_filter()} "
+                    "ORDER BY priority LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                labels = [r[0] for r in rows]
+                self._conn.executemany(
+                    "UPDATE cells SET state = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1 WHERE label = ?",
+                    ((self.owner, now + self.lease_seconds, label) for label in labels),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return labels
+
+    def renew(self) -> None:
+        # Heartbeat: eigene Leases verlängern
+        with self._lock:
+            self._conn.execute(
+                "UPDATE cells SET lease_until = ? WHERE owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, self.owner),
+            )
+
+    def complete(self, label: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE cells SET state = ?, lease_until = NULL WHERE label = ? AND owner = ?",
+                ("done" if status == "ok" else "error", label, self.owner),
+            )
+
+    def open_count(self) -> int:
+        # noch nicht abgeschlossene Zellen (frei oder von irgendeinem Worker geleast)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM cells WHERE state IN ('pending', 'leased'){self._open_filter()}").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+async def drain_queue(queue: LeaseQueue, items_by_label: dict, process, max_in_flight: int, poll_seconds: float = 1.0) -> int:
+    # Holt Zellen aus der Queue, solange welche offen sind; hält max_in_flight Zellen gleichzeitig in Arbeit
+    in_flight: set[asyncio.Task] = set()
+    processed = 0
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            await asyncio.to_thread(queue.renew)
+
+    beat = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            free = max_in_flight - len(in_flight)
+            labels = await asyncio.to_thread(queue.claim, free) if free > 0 else []
+            for label in labels:
+                item = items_by_label.get(label)
+                if item is None:
+                    # Zelle, die dieser Worker nicht kennt (abweichende Fälle/Parameter): als Fehler markieren
+                    logger.warning(f"Unbekannte Zelle in der Queue: {label}")
+                    await asyncio.to_thread(queue.complete, label, "error")
+                    continue
+                in_flight.add(asyncio.create_task(process(item)))
+                processed += 1
+            if not in_flight:
+                if await asyncio.to_thread(queue.open_count) == 0:
+                    return processed
+                # alle offenen Zellen sind von anderen Workern geleast: auf Abschluss oder Ablauf warten
+                await asyncio.sleep(poll_seconds)
+                continue
+            _, in_flight = await asyncio.wait(in_flight, timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        beat.cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+def shard_results(out_dir: Path, base_run_id: str) -> list[Path]:
+    return sorted((Path(out_dir) / JOURNAL_DIR).glob(f"{base_run_id}-s*{RESULTS_SUFFIX}"))
+
+def merge_shard_stats(out_dir: Path, base_run_id: str, model_list: list[str] | None = None) -> dict:
+    # Statistik aus den Ergebniszeilen aller Shards neu berechnen (exakte Perzentile statt Mittelung der Shards)
+    latest: dict[str, dict] = {}
+    files = shard_results(out_dir, base_run_id)
+    for f in files:
+        for record in iter_results(f):
+            cell = record.get("cell") or record.get("id")
+            # bei mehrfach bearbeiteten Zellen (abgelaufene Lease) zählt ein erfolgreiches Ergebnis
+            if cell not in latest or record.get("status") == "ok":
+                latest[cell] = record
+    models = model_list or sorted({r["model"] for r in latest.values() if r.get("model")})
+    stats = init_stats(models)
+    for record in latest.values():
+        model = record.get("model")
+        if model not in stats:
+            continue
+        if record.get("status") == "ok":
+            record_result(stats, model, record.get("prompt"), record["data"])
+        else:
+            record_error(stats, model, record.get("prompt"))
+    logger.info(f"{len(files)} Shard-Ergebnisdateien zusammengeführt: {len(latest)} Zellen")
+    print_model_statistics(models, stats, out_dir)
+    return stats
+
+def run_coordinator(argv: list[str], shards: int, out_dir: str, model_list: list[str], resume: str | None = None) -> int:
+    # Startet N Worker-Prozesse mit gemeinsamer Lease-Queue und führt danach die Statistiken zusammen
+    base_run_id = resume or new_run_id()
+    queue = queue_path(Path(out_dir), base_run_id)
+    logger.info(f"Starte {shards} Shards für Run {base_run_id} (Queue: {queue})")
+    procs = []
+    for i in range(shards):
+        cmd = [sys.executable, *argv, "--shard-index", str(i), "--lease-queue", str(queue)]
+        if resume is None:
+            cmd += ["--run-id", base_run_id]
+        procs.append(subprocess.Popen(cmd))
+    codes = [p.wait() for p in procs]
+    failed = [i for i, code in enumerate(codes) if code != 0]
+    if failed:
+        logger.error(f"Shards mit Fehler beendet: {failed} (fortsetzen mit --resume {base_run_id})")
+    merge_shard_stats(Path(out_dir), base_run_id, model_list)
+    logger.info(f"Run {base_run_id}: Statistik aller Shards in {Path(out_dir) / 'model_statistics.json'}")
+    return 1 if failed else 0
+
+def worker_owner(shard_index: int) -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-s{shard_index}"
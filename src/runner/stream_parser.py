@@ -0,0 +1,209 @@
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+class SchemaDivergence(ValueError):
+    # Die gestreamte Ausgabe kann das Schema nicht mehr erfüllen
+    pass
+
+_LITERAL_CHARS = set("0123456789+-.eEtruefalsn")
+
+# Inkrementeller JSON-Parser, der Zeichen für Zeichen gegen ein (Pydantic-)JSON-Schema prüft.
+# Erkennt strukturelle Abweichungen (kaputtes JSON, falsche Typen, fehlende Pflichtfelder) sobald sie im Stream
+# sichtbar werden, statt erst am Ende der Antwort. Was die lokale Reparatur (json_repair.local_repair) ohne neuen
+# Request behebt, bricht den Stream nicht ab: zu lange/kurze Strings, Enum-Werte, unbekannte Felder, Zahlengrenzen
+# und Prosa vor dem JSON-Objekt.
+class StreamingSchemaValidator:
+    def __init__(self, schema: dict):
+        self._defs = schema.get("$defs", {})
+        self._root = schema
+        self.stack: list[dict] = []
+        self.done = False
+        self.chars = 0
+        self._fence = False
+        self._str: dict | None = None
+        self._lit: dict | None = None
+
+    def feed(self, text: str) -> None:
+        for ch in text:
+            if self.done:
+                return
+            self.chars += 1
+            self._step(ch)
+
+    # --- Schema-Hilfen ---
+    def _resolve(self, node: dict | None) -> dict | None:
+        while node is not None and "$ref" in node:
+            node = self._defs[node["$ref"].rsplit("/", 1)[-1]]
+        return node
+
+    def _alternatives(self, node: dict | None) -> list[dict | None]:
+        node = self._resolve(node)
+        if node is None:
+            return [None]
+        if "anyOf" in node:
+            return [self._resolve(alt) for alt in node["anyOf"]]
+        return [node]
+
+    @staticmethod
+    def _accepts(alt: dict | None, kind: str) -> bool:
+        if alt is None:
+            return True
+        types = alt.get("type")
+        if types is None:
+            return kind == "string" and "enum" in alt
+        if isinstance(types, str):
+            types = [types]
+        if kind == "number":
+            return "number" in types or "integer" in types
+        return kind in types
+
+    def _diverge(self, message: str) -> None:
+        raise SchemaDivergence(f"{message} (nach {self.chars} Zeichen)")
+
+    # --- Zustandsautomat ---
+    def _step(self, ch: str) -> None:
+        if self._str is not None:
+            self._string_char(ch)
+            return
+        if self._lit is not None:
+            if ch in _LITERAL_CHARS:
+                self._lit["chars"].append(ch)
+                return
+            self._end_literal()
+            if self.done:
+                return
+        if self._fence:
+            # ```json-Zeile vor dem Objekt überspringen
+            if ch == "\n":
+                self._fence = False
+            return
+        if ch.isspace():
+            return
+        if not self.stack:
+            if ch == "{":
+                self._start_value(ch, self._root, "$", None)
+            elif ch == "`":
+                self._fence = True
+            else:
+                # Prosa vor dem Objekt: Objektbeginn ist nicht sicher erkennbar -> Prüfung beenden, Extraktion am Ende
+                logger.debug("Stream beginnt mit Text statt JSON, Schema-Prüfung beendet")
+                self.done = True
+            return
+
+        frame = self.stack[-1]
+        expect = frame["expect"]
+        if frame["type"] == "object":
+            if expect in ("key_or_end", "comma_or_end") and ch == "}":
+                self._close_object(frame)
+            elif expect in ("key_or_end", "key") and ch == '"':
+                self._str = {"key": True, "len": 0, "esc": False, "hex": 0, "buf": [], "schema": None, "path": frame["path"]}
+            elif expect == "colon" and ch == ":":
+                frame["expect"] = "value"
+            elif expect == "value":
+                props = frame["schema"].get("properties", {}) if frame["schema"] else {}
+                frame["expect"] = "comma_or_end"
+                self._start_value(ch, props.get(frame["key"]), f"{frame['path']}.{frame['key']}", frame)
+            elif expect == "comma_or_end" and ch == ",":
+                frame["expect"] = "key"
+            else:
+                self._diverge(f"{frame['path']}: unerwartetes Zeichen {ch!r}")
+        else:
+            if expect in ("value_or_end", "comma_or_end") and ch == "]":
+                self.stack.pop()
+            elif expect in ("value_or_end", "value"):
+                frame["expect"] = "comma_or_end"
+                items = frame["schema"].get("items") if frame["schema"] else None
+                self._start_value(ch, items, f"{frame['path']}[{frame['count']}]", frame)
+                frame["count"] += 1
+            elif expect == "comma_or_end" and ch == ",":
+                frame["expect"] = "value"
+            else:
+                self._diverge(f"{frame['path']}: unerwartetes Zeichen {ch!r}")
+
+    def _start_value(self, ch: str, node: dict | None, path: str, parent: dict | None) -> None:
+        if ch == "{":
+            kind = "object"
+        elif ch == "[":
+            kind = "array"
+        elif ch == '"':
+            kind = "string"
+        elif ch in "tf":
+            kind = "boolean"
+        elif ch == "n":
+            kind = "null"
+        elif ch == "-" or ch.isdigit():
+            kind = "number"
+        else:
+            self._diverge(f"{path}: ungültiger Wertbeginn {ch!r}")
+        alt = next((a for a in self._alternatives(node) if self._accepts(a, kind)), False)
+        if alt is False:
+            self._diverge(f"{path}: Typ {kind} passt nicht zum Schema")
+        if kind == "object":
+            self.stack.append({"type": "object", "schema": alt, "path": path, "expect": "key_or_end", "key": None, "seen": set()})
+        elif kind == "array":
+            self.stack.append({"type": "array", "schema": alt, "path": path, "expect": "value_or_end", "count": 0})
+        elif kind == "string":
+            self._str = {"key": False, "len": 0, "esc": False, "hex": 0, "buf": None, "schema": alt, "path": path}
+        else:
+            self._lit = {"kind": kind, "chars": [ch], "schema": alt, "path": path}
+
+    def _string_char(self, ch: str) -> None:
+        s = self._str
+        if s["hex"]:
+            s["hex"] -= 1
+            return
+        if s["esc"]:
+            s["esc"] = False
+            s["len"] += 1
+            if ch == "u":
+                s["hex"] = 4
+            if s["buf"] is not None:
+                s["buf"].append(ch)
+        elif ch == "\\":
+            s["esc"] = True
+            return
+        elif ch == '"':
+            self._str = None
+            self._end_string(s)
+            return
+        else:
+            s["len"] += 1
+            if s["buf"] is not None:
+                s["buf"].append(ch)
+
+    def _end_string(self, s: dict) -> None:
+        if s["key"]:
+            frame = self.stack[-1]
+            key = "".join(s["buf"])
+            frame["key"] = key
+            frame["seen"].add(key)
+            frame["expect"] = "colon"
+
+    def _end_literal(self) -> None:
+        lit = self._lit
+        self._lit = None
+        text = "".join(lit["chars"])
+        kind = lit["kind"]
+        if kind == "boolean" and text not in ("true", "false"):
+            self._diverge(f"{lit['path']}: ungültiger Wahrheitswert {text!r}")
+        if kind == "null" and text != "null":
+            self._diverge(f"{lit['path']}: ungültiger Wert {text!r}")
+        if kind == "number":
+            try:
+                value = float(text)
+            except ValueError:
+                self._diverge(f"{lit['path']}: ungültige Zahl {text!r}")
+            schema = lit["schema"]
+            if schema is not None and schema.get("type") == "integer" and not value.is_integer():
+                self._diverge(f"{lit['path']}: keine Ganzzahl {text!r}")
+
+    def _close_object(self, frame: dict) -> None:
+        schema = frame["schema"]
+        if schema is not None:
+            missing = [k for k in schema.get("required", []) if k not in frame["seen"]]
+            if missing:
+                self._diverge(f"{frame['path']}: Pflichtfelder fehlen: {', '.join(missing)}")
+        self.stack.pop()
+        if not self.stack:
+            self.done = True
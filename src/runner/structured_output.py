@@ -0,0 +1,158 @@
+import copy
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from src import config
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+# Ausgabemodi: json_object (nur gültiges JSON erzwungen) oder json_schema (striktes Schema beim Provider)
+OUTPUT_MODES = ("json_object", "json_schema")
+
+# Stufen im json_schema-Modus, von der strengsten zur lockersten; abgelehnte Stufen werden pro Modell übersprungen
+SCHEMA_LEVELS = ("json_schema", "json_schema_compat", "json_object")
+
+# Schlüsselwörter, die im strikten Modus nicht erlaubt sind (werden in die Beschreibung übernommen)
+_LENGTH_KEYS = ("minLength", "maxLength")
+
+def _length_hint(node: dict) -> str | None:
+    lo, hi = node.get("minLength"), node.get("maxLength")
+    if lo is not None and hi is not None:
+        return f"{lo}-{hi} Zeichen"
+    if hi is not None:
+        return f"max. {hi} Zeichen"
+    if lo is not None:
+        return f"min. {lo} Zeichen"
+    return None
+
+def _strict_node(node, defs: dict, compat: bool):
+    if isinstance(node, list):
+        return [_strict_node(n, defs, compat) for n in node]
+    if not isinstance(node, dict):
+        return node
+    if compat and "$ref" in node:
+        # $ref/$defs inline auflösen (werden von manchen Providern abgelehnt)
+        return _strict_node(copy.deepcopy(defs[node["$ref"].rsplit("/", 1)[-1]]), defs, compat)
+    out = {}
+    hint = _length_hint(node)
+    for key, value in node.items():
+        if key in ("default", "title") or key in _LENGTH_KEYS:
+            continue
+        if compat and key in ("minimum", "maximum", "exclusiveMinimum", "exclusiveMaximum", "$defs"):
+            continue
+        if key in ("properties", "$defs"):
+            out[key] = {k: _strict_node(v, defs, compat) for k, v in value.items()}
+        else:
+            out[key] = _strict_node(value, defs, compat)
+    if hint:
+        out["description"] = f"{out['description']} ({hint})" if out.get("description") else hint
+    if out.get("type") == "object":
+        # strikter Modus: alle Felder Pflicht, keine zusätzlichen Felder (optionale Felder sind nullable)
+        out["additionalProperties"] = False
+        out["required"] = list(out.get("properties", {}))
+    if compat and "anyOf" in out:
+        # anyOf [X, null] -> type [X, "null"]
+        alts = out["anyOf"]
+        non_null = [a for a in alts if a.get("type") != "null"]
+        if len(non_null) == 1 and len(alts) == 2 and isinstance(non_null[0].get("type"), str):
+            merged = {**non_null[0], **{k: v for k, v in out.items() if k != "anyOf"}}
+            merged["type"] = [non_null[0]["type"], "null"]
+            if non_null[0].get("description") and out.get("description"):
+                merged["description"] = f"{out['description']} ({non_null[0]['description']})"
+            out = merged
+    return out
+
+def strict_schema(model_cls: type[BaseModel], compat: bool = False) -> dict:
+    # Kompatibilitäts-Transformation des Pydantic-Schemas für strict=True:
+    # - alle Objekte mit additionalProperties=false und allen Feldern in required
+    # - default/title entfernt, minLength/maxLength als Hinweis in die Beschreibung
+    # compat=True zusätzlich: $ref inline, keine Zahlengrenzen, anyOf mit null als Typ-Liste
+    schema = model_cls.model_json_schema()
+    return _strict_node(schema, schema.get("$defs", {}), compat)
+
+@lru_cache(maxsize=None)
+def response_format_for(model_cls: type[BaseModel], level: str) -> dict:
+    # response_format für eine Stufe (Ergebnis ist pro Stufe stabil und kann als Cache-Key dienen; nicht verändern)
+    if level == "json_object":
+        return {"type": "json_object"}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model_cls.__name__,
+            "strict": True,
+            "schema": strict_schema(model_cls, compat=level == "json_schema_compat"),
+        },
+    }
+
+def is_format_rejection(exc: BaseException) -> bool:
+    # 400/422 des Providers, der das response_format bzw. das Schema nicht unterstützt
+    status = getattr(exc, "status_code", None)
+    if status not in (400, 422):
+        return False
+    message = str(exc).lower()
+    return any(word in message for word in ("response_format", "json_schema", "schema", "strict"))
+
+# Merkt sich pro Endpunkt (base_url) und Modell die strengste funktionierende Stufe (persistiert, damit die Erkennung
+# nur einmal läuft). Der Endpunkt gehört zum Schlüssel, damit z.B. ein Mock-Server den echten Provider nicht herabstuft.
+class SchemaSupport:
+    def __init__(self, path: str | os.PathLike | None):
+        self.path = Path(path) if path else None
+        self._levels: dict[tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.is_file():
+            try:
+                with self.path.open("r", encoding="utf-8") as f:
+                    data = json.load(f)
+                # {base_url: {model: level}}; ältere Dateien ohne Endpunkt ({model: level}) werden verworfen
+                self._levels = {(url, m): lvl for url, models in data.items() if isinstance(models, dict)
+                                for m, lvl in models.items() if lvl in SCHEMA_LEVELS}
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning(f"Schema-Unterstützung konnte nicht gelesen werden ({self.path}): {e}")
+
+    def level(self, model: str, output_mode: str, base_url: str | None = None) -> str:
+        if output_mode != "json_schema":
+            return "json_object"
+        return self._levels.get((base_url or config.OPENAI_BASE_URL, model), SCHEMA_LEVELS[0])
+
+    def downgrade(self, model: str, level: str, reason: BaseException, base_url: str | None = None) -> str | None:
+        # nächste Stufe nach einer Ablehnung; None, wenn es keine lockerere Stufe gibt
+        idx = SCHEMA_LEVELS.index(level)
+        if idx + 1 >= len(SCHEMA_LEVELS):
+            return None
+        key = (base_url or config.OPENAI_BASE_URL, model)
+        with self._lock:
+            current = self._levels.get(key, SCHEMA_LEVELS[0])
+            if SCHEMA_LEVELS.index(current) <= idx:
+                self._levels[key] = SCHEMA_LEVELS[idx + 1]
+                logger.warning(f"{model} ({key[0]}) lehnt response_format '{level}' ab, weiter mit '{SCHEMA_LEVELS[idx + 1]}': {reason}")
+                self._save()
+            return self._levels[key]
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            data: dict[str, dict[str, str]] = {}
+            for (url, model), level in self._levels.items():
+                data.setdefault(url, {})[model] = level
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"Schema-Unterstützung konnte nicht gespeichert werden ({self.path}): {e}")
+
+_support: SchemaSupport | None = None
+
+def schema_support() -> SchemaSupport:
+    global _support
+    if _support is None:
+        _support = SchemaSupport(config.SCHEMA_SUPPORT_PATH)
+    return _support
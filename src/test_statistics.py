@@ -1,36 +1,168 @@
 import json
 from pathlib import Path
 from utils.utils import write_json
+from src.runner.sampling import request_share
 
 def init_stats(model_list):
-     # Initialisiert das Statistik-Dictionary für die Modelle
-    return {model: {"char_counts": [], "durations": []} for model in model_list}
+     # Initialisiert das Statistik-Dictionary für die Modelle (eine Messreihe pro Request, Fehler pro Prompt)
+    return {model: {"requests": [], "errors": {}} for model in model_list}
 
-def print_model_statistics(model_list, stats, output_dir=None):
-    # Statistik pro Modell berechnen und ausgeben
+def record_result(stats, model, prompt, row):
+    # Übernimmt die Messwerte einer erfolgreichen Antwort (Metadatenfelder der Ergebniszeile)
+    stats[model]["requests"].append({
+        "prompt": prompt,
+        "chars": row.get("_response_char_count", 0),
+        "duration": row.get("_duration_seconds", 0.0),
+        "queue_wait": row.get("_queue_wait_seconds", 0.0),
+        "batch_wait": row.get("_batch_wait_seconds", 0.0),
+        # gebündelte Requests (n Choices): Netzwerkzeit nur einmal pro Request zählen
+        "network": request_share(row, "_network_seconds") if row.get("_network_seconds") is not None else None,
+        # Latenz des Requests selbst und ob er unter --hedge lief (Vergleichswert für das Hedging)
+        "request_latency": row.get("_network_seconds"),
+        "hedging": row.get("_hedge_latency_seconds") is not None,
+        "ttft": row.get("_ttft_seconds"),
+        "parse": row.get("_parse_seconds"),
+        "repair": row.get("_repair_seconds"),
+        "prompt_tokens": row.get("_prompt_tokens"),
+        "completion_tokens": row.get("_completion_tokens"),
+        "cached_tokens": row.get("_cached_tokens"),
+        "repaired": bool(row.get("_correction_attempted")),
+        "local_repaired": bool(row.get("_local_repair")),
+        "cache_hit": bool(row.get("_cache_hit")),
+        "batched": row.get("_sample_batch", 1) > 1,
+        "batch_api": bool(row.get("_batch")),
+        "prompt_tokens_original": row.get("_user_prompt_tokens_original"),
+        "prompt_tokens_compacted": row.get("_user_prompt_tokens_compacted"),
+        "output_mode": row.get("_output_mode", "json_object"),
+    })
+
+def record_error(stats, model, prompt):
+    errors = stats[model]["errors"]
+    errors[prompt] = errors.get(prompt, 0) + 1
+
+def percentile(values, q):
+    # Perzentil mit linearer Interpolation (q in [0, 100])
+    if not values:
+        return 0
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+def _compaction_summary(requests):
+    # geschätzte User-Prompt-Tokens vor/nach der Verdichtung (nur Antworten mit --compact-prompt)
+    compacted = [r for r in requests if r.get("prompt_tokens_compacted") is not None]
+    if not compacted:
+        return {}
+    original = sum(r["prompt_tokens_original"] or 0 for r in compacted)
+    after = sum(r["prompt_tokens_compacted"] or 0 for r in compacted)
+    return {
+        "avg_user_prompt_tokens_original": round(original / len(compacted), 1),
+        "avg_user_prompt_tokens_compacted": round(after / len(compacted), 1),
+        "compaction_ratio": round(after / original, 3) if original > 0 else None,
+    }
+
+def summarize(requests, errors=0):
+    # Kennzahlen einer Messreihe; Latenzen ohne Cache-Treffer und Batch-API-Antworten (ohne messbare Modellzeit)
+    measured = [r for r in requests if not r["cache_hit"] and not r.get("batch_api")]
+    durations = [r["duration"] for r in measured]
+    char_counts = [r["chars"] for r in requests]
+    ttfts = [r["ttft"] for r in measured if r["ttft"] is not None]
+    # Request-Latenzen ohne Hedging: Referenz, mit der ein späterer Lauf mit --hedge seine p99 vergleicht
+    latencies = [r["request_latency"] for r in measured if r.get("request_latency") is not None and not r.get("hedging")]
+    network = sum(r["network"] or 0 for r in measured)
+    completion_tokens = sum(r["completion_tokens"] or 0 for r in measured)
+    prompt_tokens = sum(r["prompt_tokens"] or 0 for r in requests)
+    cached_tokens = sum(r["cached_tokens"] or 0 for r in requests)
+    repaired = sum(1 for r in requests if r["repaired"])
+    local_repaired = sum(1 for r in requests if r.get("local_repaired"))
+    # im ersten Versuch schemakonform: weder lokal noch per Korrektur-Prompt repariert, Fehler zählen als Misserfolg
+    first_attempt = sum(1 for r in requests if not r["repaired"] and not r.get("local_repaired"))
+    attempts = len(requests) + errors
+    return {
+        "average_char_count": round(sum(char_counts) / len(char_counts), 2) if char_counts else 0,
+        "average_duration_seconds": round(sum(durations) / len(durations), 3) if durations else 0,
+        "p50_duration_seconds": round(percentile(durations, 50), 3),
+        "p90_duration_seconds": round(percentile(durations, 90), 3),
+        "p99_duration_seconds": round(percentile(durations, 99), 3),
+        "p99_request_latency_seconds": round(percentile(latencies, 99), 3) if latencies else None,
+        "average_queue_wait_seconds": round(sum(r["queue_wait"] or 0 for r in measured) / len(measured), 3) if measured else 0,
+        "average_batch_wait_seconds": round(sum(r.get("batch_wait") or 0 for r in measured) / len(measured), 3) if measured else 0,
+        "p50_ttft_seconds": round(percentile(ttfts, 50), 3) if ttfts else None,
+        "chars_per_second": round(sum(r["chars"] for r in measured) / sum(durations), 3) if sum(durations) > 0 else 0,
+        "tokens_per_second": round(completion_tokens / network, 3) if network > 0 else 0,
+        "num_answers": len(requests),
+        "num_errors": errors,
+        "repair_rate": round(repaired / len(requests), 3) if requests else 0,
+        "local_repair_rate": round(local_repaired / len(requests), 3) if requests else 0,
+        "llm_repairs": repaired,
+        "local_repairs": local_repaired,
+        "first_attempt_success_rate": round(first_attempt / attempts, 3) if attempts else 0,
+        "cache_hits": len(requests) - len(measured),
+        "batched_answers": sum(1 for r in requests if r.get("batched")),
+        **_compaction_summary(requests),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(r["completion_tokens"] or 0 for r in requests),
+        "cached_prompt_tokens": cached_tokens,
+        "cached_prompt_share": round(cached_tokens / prompt_tokens, 3) if prompt_tokens > 0 else 0,
+    }
+
+def _print_summary(summary, indent="  "):
+    print(f"{indent}Durchschnittliche Zeichenanzahl: {summary['average_char_count']}")
+    print(f"{indent}Durchschnittliche Dauer (Sekunden): {summary['average_duration_seconds']}")
+    print(f"{indent}Dauer p50/p90/p99 (Sekunden): {summary['p50_duration_seconds']} / "
+          f"{summary['p90_duration_seconds']} / {summary['p99_duration_seconds']}")
+    print(f"{indent}Zeichen pro Sekunde: {summary['chars_per_second']}")
+    print(f"{indent}Tokens pro Sekunde: {summary['tokens_per_second']}")
+    print(f"{indent}Anzahl Antworten: {summary['num_answers']} (Fehler: {summary['num_errors']}, "
+          f"Reparaturquote: {summary['repair_rate']:.1%})")
+    print(f"{indent}Reparaturen lokal / per Korrektur-Prompt: {summary['local_repairs']} / {summary['llm_repairs']}")
+    print(f"{indent}Schemakonform im ersten Versuch: {summary['first_attempt_success_rate']:.1%}")
+    if summary.get("batched_answers"):
+        print(f"{indent}Aus Requests mit mehreren Choices (n>1): {summary['batched_answers']} Antworten")
+    if summary.get("compaction_ratio") is not None:
+        print(f"{indent}User-Prompt-Tokens (geschätzt) vorher/nachher: {summary['avg_user_prompt_tokens_original']} / "
+              f"{summary['avg_user_prompt_tokens_compacted']} ({summary['compaction_ratio']:.1%})")
+    print(f"{indent}Gecachte Prompt-Tokens: {summary['cached_prompt_tokens']} von {summary['prompt_tokens']} "
+          f"({summary['cached_prompt_share']:.1%})")
+
+def print_model_statistics(model_list, stats, output_dir=None, filename="model_statistics.json", extra=None):
+    # Statistik pro Modell (und pro Prompt-Config) berechnen und ausgeben
     print("\n=== Modell-Statistiken ===")
     stats_out = {}
     for model in model_list:
-        char_counts = stats[model]["char_counts"]
-        durations = stats[model]["durations"]
-        avg_chars = round(sum(char_counts) / len(char_counts), 2) if char_counts else 0
-        avg_duration = round(sum(durations) / len(durations), 3) if durations else 0
-        
-        # Zeit pro 100 Zeichen berechnen
-        chars_per_second = round((sum(char_counts) / sum(durations)), 3) if sum(durations) > 0 else 0
+        requests = stats[model]["requests"]
+        errors = stats[model]["errors"]
+        summary = summarize(requests, sum(errors.values()))
         print(f"Modell: {model}")
-        print(f"  Durchschnittliche Zeichenanzahl: {avg_chars}")
-        print(f"  Durchschnittliche Dauer (Sekunden): {avg_duration}")
-        print(f"  Zeichen pro Sekunde: {chars_per_second}")
-        print(f"  Anzahl Antworten: {len(char_counts)}")
+        _print_summary(summary)
+        by_prompt = {}
+        for prompt in sorted({r["prompt"] for r in requests} | set(errors)):
+            prompt_summary = summarize([r for r in requests if r["prompt"] == prompt], errors.get(prompt, 0))
+            by_prompt[f"PROMPT{prompt}"] = prompt_summary
+            print(f"  PROMPT{prompt}: {prompt_summary['num_answers']} Antworten, "
+                  f"p50/p90/p99 {prompt_summary['p50_duration_seconds']}/{prompt_summary['p90_duration_seconds']}/"
+                  f"{prompt_summary['p99_duration_seconds']}s, Reparaturquote {prompt_summary['repair_rate']:.1%}")
+        # Vergleich der Ausgabemodi (json_object vs. striktes json_schema bzw. Fallback-Stufen)
+        by_output_mode = {}
+        modes = sorted({r.get("output_mode", "json_object") for r in requests})
+        for mode in modes:
+            mode_summary = summarize([r for r in requests if r.get("output_mode", "json_object") == mode])
+            by_output_mode[mode] = mode_summary
+            if len(modes) > 1 or mode != "json_object":
+                print(f"  {mode}: {mode_summary['num_answers']} Antworten, erster Versuch {mode_summary['first_attempt_success_rate']:.1%}, "
+                      f"p50/p90 {mode_summary['p50_duration_seconds']}/{mode_summary['p90_duration_seconds']}s")
+        # zusätzliche Auswertungen pro Modell, z.B. {"hedging": {model: {...}}}
+        model_extra = {name: values[model] for name, values in (extra or {}).items() if model in values}
+        hedging = model_extra.get("hedging")
+        if hedging:
+            print(f"  Hedging: {hedging['hedges']} von {hedging['requests']} Requests ({hedging['hedge_rate']:.1%}), "
+                  f"{hedging['hedge_wins']} gewonnen, ~{hedging['extra_prompt_tokens_est']} zusätzliche Prompt-Tokens, "
+                  f"p99 {hedging['p99_seconds']}s" + (f" (vorher {hedging['reference_p99_seconds']}s)" if hedging.get("reference_p99_seconds") else ""))
         print("")
-        stats_out[model] = {
-            "average_char_count": avg_chars,
-            "average_duration_seconds": avg_duration,
-            "chars_per_second": chars_per_second,
-            "num_answers": len(char_counts),
-        }
+        stats_out[model] = {**summary, "by_prompt": by_prompt, "by_output_mode": by_output_mode, **model_extra}
     # Schreibe Statistiken als JSON-Datei, falls output_dir angegeben
     if output_dir is not None:
-        out_path = Path(output_dir) / "model_statistics.json"
+        out_path = Path(output_dir) / filename
         write_json(out_path, stats_out)
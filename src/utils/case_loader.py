@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, AsyncIterator
+
+from utils.logger import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Unterhalb dieser Anzahl ungecachter Dateien lohnt sich der Start eines Prozess-Pools nicht
+POOL_MIN_FILES = 16
+
+def parse_case_file(path: str) -> dict:
+    # Parst eine Testfall-Datei (Top-Level-Funktion, damit sie im Prozess-Pool läuft)
+    # yaml erst hier importieren: bei gefülltem Cache-Index wird es gar nicht gebraucht
+    import yaml
+    # libyaml (C) ist um ein Vielfaches schneller als der reine Python-Loader
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path, "r", encoding="utf-8") as h:
+        data = yaml.load(h, Loader=loader)
+    data["_file"] = Path(path).name
+    return data
+
+# Cache-Index geparster Fälle: ein Eintrag pro Datei, gültig solange Pfad, mtime und Größe übereinstimmen
+class CaseCache:
+    def __init__(self, cache_dir: str | os.PathLike | None):
+        self.dir = Path(cache_dir) if cache_dir else None
+        self.hits = 0
+        self.misses = 0
+        if self.dir is not None:
+            self.dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _stamp(path: Path) -> tuple[int, int]:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+
+    def _entry(self, path: Path) -> Path:
+        return self.dir / (hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest() + ".pickle")
+
+    def get(self, path: Path) -> dict | None:
+        if self.dir is None:
+            return None
+        try:
+            with self._entry(path).open("rb") as f:
+                stamp, case = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            self.misses += 1
+            return None
+        if stamp != self._stamp(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return case
+
+    def put(self, path: Path, case: dict) -> None:
+        if self.dir is None:
+            return
+        entry = self._entry(path)
+        tmp = entry.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with tmp.open("wb") as f:
+                pickle.dump((self._stamp(path), case), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, entry)
+        except OSError as e:
+            logger.warning(f"Testfall-Cache für {path} konnte nicht geschrieben werden: {e}")
+
+def iter_cases(cases_dir: Path, limit: int | None = None, cache_dir: str | os.PathLike | None = None, workers: int | None = None) -> Iterator[dict]:
+    # Liefert die Fälle in Dateireihenfolge, sobald sie geparst sind; bei limit werden nur die ersten Dateien gelesen
+    files = sorted(Path(cases_dir).glob("*.yaml"))
+    if limit is not None and limit > 0:
+        files = files[:limit]
+    cache = CaseCache(cache_dir)
+    cached = [cache.get(f) for f in files]
+    missing = [f for f, c in zip(files, cached) if c is None]
+    workers = workers or os.cpu_count() or 1
+    pool = None
+    if len(missing) >= POOL_MIN_FILES and workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        # nicht gecachte Dateien im Pool parsen; Reihenfolge bleibt erhalten, damit --limit und Resume stabil sind
+        futures = {f: pool.submit(parse_case_file, str(f)) for f in missing} if pool is not None else {}
+        for f, case in zip(files, cached):
+            if case is None:
+                case = futures[f].result() if pool is not None else parse_case_file(str(f))
+                cache.put(f, case)
+            yield case
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        logger.debug(f"Testfälle: {cache.hits} aus dem Cache, {cache.misses} geparst (Pool: {pool is not None})")
+
+async def aiter_cases(cases_dir: Path, limit: int | None = None, cache_dir: str | os.PathLike | None = None, workers: int | None = None) -> AsyncIterator[dict]:
+    # Asynchrone Variante: Parsen läuft in einem Thread, der Event-Loop kann schon Requests abarbeiten
+    it = iter_cases(cases_dir, limit, cache_dir, workers)
+    sentinel = object()
+    # gehalten, solange next() im Worker-Thread läuft
+    busy = threading.Lock()
+
+    def step():
+        with busy:
+            return next(it, sentinel)
+
+    def close_when_idle():
+        with busy:
+            it.close()
+
+    try:
+        while True:
+            case = await asyncio.to_thread(step)
+            if case is sentinel:
+                return
+            yield case
+    finally:
+        if busy.acquire(blocking=False):
+            try:
+                it.close()
+            finally:
+                busy.release()
+        else:
+            # Abbruch, während next() noch im Worker-Thread läuft: dort schließen, sobald es zurückkehrt
+            # (sonst "generator already executing" statt des CancelledError)
+            threading.Thread(target=close_when_idle, name="case-loader-close", daemon=True).start()
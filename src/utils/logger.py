@@ -1,31 +1,165 @@
-import os, logging
+import os, json, time, atexit, logging, queue, threading
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 from rich.console import Console
 from rich.logging import RichHandler
 
-LOG_FILE = "outputs/log/llm_tests.log"
+from src import config
+
+# Logdateien pro Lauf: <LOG_DIR>/<run_id>.log bzw. .jsonl
+LOG_DIR = config.LOG_DIR
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(cell)s | %(message)s"
 
 console = Console()
 
-def setup(level: str = "INFO", write_file: bool = True) -> logging.Logger:
+# Kennfelder der Zelle, die gerade im aktuellen asyncio-Task bearbeitet wird (Fall, Modell, Prompt, Wiederholung)
+log_context: ContextVar[dict | None] = ContextVar("log_context", default=None)
+
+def bind_cell(fields: dict) -> None:
+    # gilt für alle Logzeilen des aktuellen Tasks (und der daraus gestarteten Tasks)
+    log_context.set(fields)
+
+def log_path(run_id: str | None, json_logs: bool = False, log_dir: str = LOG_DIR) -> str:
+    name = run_id or f"llm_tests_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    return os.path.join(log_dir, f"{name}.jsonl" if json_logs else f"{name}.log")
+
+# Hängt die Zell-Kennfelder an jeden Record (läuft im aufrufenden Thread, daher nur ein ContextVar-Zugriff)
+class _ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        fields = log_context.get()
+        record.cell_fields = fields
+        record.cell = fields.get("cell", "-") if fields else "-"
+        return True
+
+# Gibt den Record unverändert in die Queue: Formatieren (%-Argumente, Rich-Markup, JSON) passiert erst im
+# Listener-Thread, nicht auf dem Event-Loop. Argumente müssen daher unveränderliche Werte sein (str, Zahlen).
+class _LazyQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+# Eine JSON-Zeile pro Record mit Fall, Modell, Prompt und Wiederholung der Zelle
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "cell_fields", None)
+        if fields:
+            entry.update({k: fields.get(k) for k in ("cell", "case_id", "model", "prompt", "repeat")})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# Konsolenausgabe mit Ratenbegrenzung (Token-Bucket pro Sekunde): bei Läufen mit tausenden Zellen wird die Konsole
+# nicht zum Engpass. Warnungen und Fehler kommen immer durch, unterdrückte Zeilen stehen vollständig in der Logdatei.
+class RateLimitedRichHandler(RichHandler):
+    def __init__(self, *args, rate: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate = rate
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._dropped = 0
+
+    def _allow(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        if self.rate > 0 and record.levelno < logging.WARNING:
+            if not self._allow():
+                self._dropped += 1
+                return False
+            if self._dropped:
+                note = logging.LogRecord(record.name, logging.INFO, record.pathname, record.lineno,
+                                         "… %d Meldungen auf der Konsole unterdrückt (siehe Logdatei)", (self._dropped,), None)
+                self._dropped = 0
+                super().handle(note)
+        return super().handle(record)
+
+def _stop_pipeline(root: logging.Logger) -> None:
+    # Listener einer früheren Konfiguration anhalten (leert die Queue, schließt die Dateien)
+    for handler in list(root.handlers):
+        listener = getattr(handler, "listener", None)
+        if listener is not None:
+            listener.stop()
+            for target in listener.handlers:
+                target.close()
+            handler.listener = None
+
+def setup(
+    level: str = "INFO",
+    write_file: bool = True,
+    run_id: str | None = None,
+    json_logs: bool = False,
+    console_rate: float | None = None,
+    log_dir: str = LOG_DIR,
+    rich_console: Console | None = None,
+) -> logging.Logger:
     lvl = getattr(logging, level.upper(), logging.INFO)
+    rate = config.LOG_CONSOLE_RATE if console_rate is None else console_rate
 
     # Konsole mit Rich
-    handlers = [RichHandler(console=console, show_time=True, markup=True)]
+    handlers: list[logging.Handler] = [RateLimitedRichHandler(console=rich_console or console, show_time=True, markup=True, rate=rate)]
 
-    # Optional zusätzlich Datei-Log (Append = Standard)
+    # Optional zusätzlich Datei-Log, eine Datei pro Lauf
     if write_file:
-        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-        fh = logging.FileHandler(LOG_FILE, mode="a", encoding="utf-8", delay=True)
+        path = log_path(run_id, json_logs, log_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fh = logging.FileHandler(path, mode="a", encoding="utf-8", delay=True)
         fh.setLevel(lvl)
-        fh.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+        fh.setFormatter(JsonFormatter() if json_logs else logging.Formatter(TEXT_FORMAT))
         handlers.append(fh)
 
-    # Einmalig am Programmanfang aufrufen
-    logging.basicConfig(level=lvl, format="%(message)s", handlers=handlers)
+    # Auf dem Root-Logger hängt nur der Queue-Handler; Rendering und Datei-I/O laufen im Thread des Listeners.
+    # Erneuter Aufruf ersetzt die vorherige Konfiguration (sonst wird --loglevel ignoriert)
+    root = logging.getLogger()
+    _stop_pipeline(root)
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    qh = _LazyQueueHandler(records)
+    qh.addFilter(_ContextFilter())
+    qh.listener = _Listener(records, *handlers, respect_handler_level=True)
+    qh.listener.start()
+    logging.basicConfig(level=lvl, handlers=[qh], force=True)
     return logging.getLogger("llm_tests")
 
+# Markiert eine Stelle in der Queue; der Listener meldet, sobald alle Records davor geschrieben sind
+def _flush_marker(done: threading.Event) -> logging.LogRecord:
+    record = logging.LogRecord("llm_tests", logging.NOTSET, "", 0, "", None, None)
+    record.flush_done = done
+    return record
+
+class _Listener(QueueListener):
+    def handle(self, record: logging.LogRecord) -> None:
+        done = getattr(record, "flush_done", None)
+        if done is not None:
+            done.set()
+            return
+        super().handle(record)
+
+def flush(timeout: float = 5.0) -> None:
+    # Wartet, bis alle bisher eingereihten Records geschrieben sind (z.B. vor Ausgaben direkt auf die Konsole)
+    for handler in logging.getLogger().handlers:
+        listener = getattr(handler, "listener", None)
+        if isinstance(listener, QueueListener) and listener._thread is not None:
+            done = threading.Event()
+            listener.queue.put_nowait(_flush_marker(done))
+            done.wait(timeout)
+
 def section(title: str):
     # Trennlinie für Konsolenausgabe
+    flush()
     console.rule(f"[bold]{title}[/]")
 
-logger = setup()
\ No newline at end of file
+@atexit.register
+def _shutdown() -> None:
+    # beim Beenden die Queue leeren, bevor logging.shutdown die Handler schließt
+    _stop_pipeline(logging.getLogger())
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+RESULTS_SUFFIX = ".results.jsonl"
+
+_STOP = object()
+
+# Ergebnisdatei (JSONL) eines Laufs
+def results_path(out_dir: Path, run_id: str) -> Path:
+    return Path(out_dir) / "runs" / f"{run_id}{RESULTS_SUFFIX}"
+
+# Schreibt Ergebniszeilen aus einem Hintergrund-Thread gebündelt in eine JSONL-Datei pro Lauf
+class ResultSink:
+    def __init__(self, path: Path, run_id: str, flush_every: int = 50, flush_interval: float = 1.0, fsync: bool = True):
+        self.path = Path(path)
+        self.run_id = run_id
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rows_written = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="result-sink", daemon=True)
+        self._error: BaseException | None = None
+
+    def start(self) -> "ResultSink":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def put(self, record: dict, on_durable=None) -> str:
+        # Nicht-blockierend: vergibt eine eindeutige Zeilen-ID und reiht die Zeile ein.
+        # on_durable wird im Sink-Thread aufgerufen, sobald die Zeile auf der Platte ist.
+        if self._error is not None:
+            raise RuntimeError(f"Result-Sink ist ausgefallen: {self._error}")
+        row_id = f"{self.run_id}-{uuid.uuid4().hex[:12]}"
+        record = {"row_id": row_id, "run_id": self.run_id, "ts": datetime.now().isoformat(timespec="seconds"), **record}
+        self._queue.put((record, on_durable))
+        return row_id
+
+    def _worker(self) -> None:
+        try:
+            with self.path.open("a", encoding="utf-8") as fh:
+                if fh.tell() > 0 and not self.path.read_bytes().endswith(b"\n"):
+                    # unvollständige letzte Zeile eines abgebrochenen Laufs abschließen
+                    fh.write("\n")
+                stop = False
+                while not stop:
+                    item = self._queue.get()
+                    if item is _STOP:
+                        break
+                    # weitere Zeilen bis flush_every oder flush_interval sammeln
+                    batch = [item]
+                    deadline = time.monotonic() + self.flush_interval
+                    while len(batch) < self.flush_every:
+                        try:
+                            item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+                        except queue.Empty:
+                            break
+                        if item is _STOP:
+                            stop = True
+                            break
+                        batch.append(item)
+                    fh.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record, _ in batch))
+                    fh.flush()
+                    if self.fsync:
+                        os.fsync(fh.fileno())
+                    self.rows_written += len(batch)
+                    for _, on_durable in batch:
+                        if on_durable is not None:
+                            on_durable()
+        except BaseException as e:
+            self._error = e
+            logger.error(f"Result-Sink {self.path} ausgefallen: {e}")
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        logger.debug(f"Result-Sink geschlossen: {self.rows_written} Zeilen in {self.path}")
+
+# liest alle Zeilen einer Ergebnisdatei (abgebrochene Zeilen werden übersprungen)
+def iter_results(path: Path):
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Unlesbare Zeile in {path} übersprungen")
+
+# Export in das bisherige Layout (eine JSON-Datei pro Ergebnis, z.B. für lstlisting_creator.py)
+def export_json_files(path: Path, out_dir: Path) -> int:
+    created_dirs = set()
+    count = 0
+    for record in iter_results(path):
+        target = Path(out_dir) / record["export_name"]
+        if target.parent not in created_dirs:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(target.parent)
+        with target.open("w", encoding="utf-8") as f:
+            json.dump(record["data"], f, ensure_ascii=False, indent=4)
+        count += 1
+    logger.info(f"{count} Ergebnisse als JSON-Dateien nach {out_dir} exportiert")
+    return count
+
+# Optionaler Export als Parquet (benötigt pyarrow, pip install .[parquet])
+def export_parquet(path: Path) -> Path | None:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        logger.warning("pyarrow ist nicht installiert, Parquet-Export übersprungen (pip install .[parquet])")
+        return None
+    rows = []
+    for record in iter_results(path):
+        row = {k: v for k, v in record.items() if k != "data"}
+        # verschachtelte Antwort als JSON-String, damit das Schema stabil bleibt
+        row["data"] = json.dumps(record.get("data"), ensure_ascii=False)
+        rows.append(row)
+    target = Path(path).with_suffix(".parquet")
+    pq.write_table(pa.Table.from_pylist(rows), target)
+    logger.info(f"Parquet-Export erstellt: {target}")
+    return target
@@ -2,15 +2,13 @@ import logging
 from pathlib import Path
 from datetime import datetime
 import json
-import time
-import yaml
 import re
 
 logger = logging.getLogger(__name__)
 
-# gives current timestamp in "YYYYMMDD_HHMM" format
-def now_stamp() -> str:
-    return datetime.now().strftime("%Y%m%d_%H%M")
+# gives current timestamp in "YYYYMMDD_HHMM" format ("YYYYMMDD_HHMMSS" with seconds=True)
+def now_stamp(seconds: bool = False) -> str:
+    return datetime.now().strftime("%Y%m%d_%H%M%S" if seconds else "%Y%m%d_%H%M")
 
 # ensures that the parent directory of the given path exists
 def ensure_parent(path: Path) -> None:
@@ -24,14 +22,11 @@ def write_json(path: Path, obj: dict) -> None:
         json.dump(obj, f, ensure_ascii=False, indent=4)
     logger.debug(f"JSON erstellt: {path}")
 
-# loads all yaml files in the given directory and returns a list of dicts
-def load_cases(cases_dir: Path) -> list[dict]:
-    cases = []
-    for f in sorted(cases_dir.glob("*.yaml")):
-        with f.open("r", encoding="utf-8") as h:
-            data = yaml.safe_load(h)
-            data["_file"] = f.name
-            cases.append(data)
+# loads all yaml files in the given directory and returns a list of dicts (limit: only the first files are parsed)
+def load_cases(cases_dir: Path, limit: int | None = None, cache_dir: Path | None = None) -> list[dict]:
+    # Loader (asyncio, Prozess-Pool) erst bei Bedarf importieren, get_model_list wird schon beim CLI-Start gebraucht
+    from utils.case_loader import iter_cases
+    cases = list(iter_cases(cases_dir, limit=limit, cache_dir=cache_dir))
     logger.debug(f"Testfall-Dateien geladen: {len(cases)}")
     return cases
 
@@ -58,14 +53,20 @@ def get_model_list(model:str) -> list[str]:
         model_list.append(get_model_aliases(m))
     return model_list
 
-def add_metadata_to_row(row, case, model, t0, raw):
-    # Fügt Metadaten zum Ergebnis hinzu
+def add_metadata_to_row(row, case, model, duration, raw):
+    # Fügt Metadaten zum Ergebnis hinzu (duration = bereits gemessene Dauer in Sekunden, None = nicht messbar)
     row["_source_file"] = case["_file"]
     row["_model"] = model
-    row["_duration_seconds"] = round(time.perf_counter() - t0, 3)
+    row["_duration_seconds"] = round(duration, 3) if duration is not None else None
     row["_response_char_count"] = count_characters(raw)
     return row
 
+def add_request_meta_to_row(row, meta):
+    # Übernimmt Messwerte des Requests (z.B. TTFT, Stream-Abbrüche, Cache-Treffer) als Metadaten
+    for key, value in meta.items():
+        row[f"_{key}"] = value
+    return row
+
 def normalize_model_name(model_name: str) -> str:
     # Entfernt Versionsnummern und unerwünschte Zeichen aus dem Modellnamen für Dateinamen
     normalized_model_name = re.sub(r'[-_](\d{4,}([-.]\d{2,})*)$', '', model_name)